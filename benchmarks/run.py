@@ -0,0 +1,316 @@
+"""
+Бенчмарк API: задержки, пропускная способность и количество SQL запросов.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --books 1000000 --users 100000 --news 50000
+    python benchmarks/run.py --mode live --concurrency 8 --output results.json
+    python benchmarks/run.py --baseline previous.json --max-regression 0.2
+
+1. Дозаполняет БД тестовыми данными (benchmarks/seed.py).
+2. Прогоняет сценарии (BookViewSet, UserViewSet, login) через Django
+   test client (--mode client) и/или через настоящий HTTP сервер в
+   отдельном потоке (--mode live, с параллельными клиентами).
+3. Печатает p50/p95/p99, запросы в секунду и SQL запросов на запрос,
+   сохраняет результаты в JSON.
+4. Сравнивает с порогами (--thresholds) и с прошлым результатом
+   (--baseline); при регрессии код возврата 1.
+
+Запускается на той БД, что указана в настройках (DJANGO_SETTINGS_MODULE).
+Лимиты частоты запросов на время бенчмарка отключаются.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import socketserver
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+DEFAULT_THRESHOLDS = Path(__file__).resolve().parent / "thresholds.json"
+SEARCH_WORDS = ("война", "море", "город", "звезда", "память")
+
+
+def scenarios(book_ids, books, users):
+    """
+    Сценарии: имя -> (метод, функция номера запроса -> путь, тело, доля запросов).
+
+    Номер запроса меняет страницу, книгу или поисковое слово, чтобы
+    измерялся не только один закэшированный ответ.
+    """
+    book_pages = max(1, min(50, books // 10))
+    user_pages = max(1, min(50, users // 10))
+    words = [quote(word) for word in SEARCH_WORDS]
+    from landing.fake_data import DEFAULT_PASSWORD, user_email
+
+    login_body = {"email": user_email(0), "password": DEFAULT_PASSWORD, "session": False}
+    return {
+        "book-list": ("GET", lambda i: f"/api/books/?page={i % book_pages + 1}", None, 1.0),
+        "book-list-cursor": ("GET", lambda i: "/api/books/?pagination=cursor", None, 1.0),
+        "book-detail": ("GET", lambda i: f"/api/books/{book_ids[i % len(book_ids)]}/", None, 1.0),
+        "book-recent": ("GET", lambda i: "/api/books/recent/", None, 1.0),
+        "book-search": ("GET", lambda i: f"/api/books/search/?q={words[i % len(words)]}", None, 1.0),
+        "user-list": ("GET", lambda i: f"/api/users/?page={i % user_pages + 1}", None, 1.0),
+        "user-me": ("GET", lambda i: "/api/users/me/", None, 1.0),
+        # PBKDF2 дорогой намеренно - запросов меньше
+        "api-login": ("POST", lambda i: "/api/login/", login_body, 0.1),
+    }
+
+
+def summarize(latencies, queries, wall_time, errors):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p95_ms": round(quantiles[94] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "rps": round(len(latencies) / wall_time, 1) if wall_time else None,
+        "queries": round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_client(method, path_for, body, count, warmup, token):
+    """Последовательные запросы через Django test client (без сети)"""
+    from django.db import connection
+    from django.test import Client
+
+    client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+    errors = 0
+    latencies, queries = [], []
+
+    def call(i):
+        if method == "GET":
+            return client.get(path_for(i))
+        return client.post(path_for(i), body, content_type="application/json")
+
+    for i in range(warmup):
+        call(i)
+    started = time.perf_counter()
+    for i in range(count):
+        counter = _QueryCounter()
+        begin = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = call(i)
+        latencies.append(time.perf_counter() - begin)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+    return summarize(latencies, queries, time.perf_counter() - started, errors)
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    """WSGI приложение Django в отдельном потоке на свободном порту"""
+    from django.core.wsgi import get_wsgi_application
+
+    server = make_server(
+        "127.0.0.1", 0, get_wsgi_application(),
+        server_class=_ThreadingServer, handler_class=_QuietHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def run_live(server, method, path_for, body, count, warmup, token, concurrency):
+    """Параллельные запросы по HTTP к серверу из start_server"""
+    host, port = server.server_address
+    headers = {"Authorization": f"Token {token}", "Content-Type": "application/json"}
+    payload = json.dumps(body).encode() if body is not None else None
+
+    def call(i):
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        begin = time.perf_counter()
+        try:
+            connection.request(method, path_for(i), body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - begin
+        # Количество SQL запросов сервер сообщает в Server-Timing (config/middleware.py)
+        match = SERVER_TIMING_QUERIES.search(response.getheader("Server-Timing") or "")
+        return elapsed, int(match.group(1)) if match else None, response.status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(warmup)))
+        started = time.perf_counter()
+        results = list(executor.map(call, range(count)))
+        wall_time = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, _, _ in results]
+    queries = [number for _, number, _ in results if number is not None]
+    errors = sum(1 for _, _, status in results if status >= 400)
+    return summarize(latencies, queries, wall_time, errors)
+
+
+def check(results, thresholds, baseline, max_regression):
+    """Список нарушений порогов и регрессий относительно прошлого результата"""
+    failures = []
+    for name, result in results.items():
+        limits = thresholds.get(name, {})
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "queries"):
+            limit = limits.get(metric)
+            if limit is not None and result[metric] is not None and result[metric] > limit:
+                failures.append(f"{name}: {metric} {result[metric]} > порога {limit}")
+        min_rps = limits.get("min_rps")
+        if min_rps is not None:
+            # rps нет, если время прогона не измерилось (0) - порог не проверить
+            if result["rps"] is None:
+                failures.append(f"{name}: rps не измерен, порог {min_rps}")
+            elif result["rps"] < min_rps:
+                failures.append(f"{name}: rps {result['rps']} < порога {min_rps}")
+        if result["errors"] > limits.get("max_errors", 0):
+            failures.append(f"{name}: ошибок {result['errors']}")
+
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("p95_ms", "queries"):
+            if previous.get(metric) and result[metric] is not None:
+                if result[metric] > previous[metric] * (1 + max_regression):
+                    failures.append(
+                        f"{name}: {metric} {result[metric]} хуже прошлого {previous[metric]} "
+                        f"больше чем на {max_regression:.0%}"
+                    )
+    return failures
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--news", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора данных")
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--mode", choices=["client", "live", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=4, help="Параллельных клиентов в режиме live")
+    parser.add_argument("--only", nargs="*", help="Запустить только эти сценарии")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS))
+    parser.add_argument("--baseline", help="Прошлый результат для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    # Лимиты частоты запросов мешают нагрузке; SQL считаем на каждом запросе
+    settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] = {}
+    settings.SQL_INSTRUMENTATION["SAMPLE_RATE"] = 1.0
+    # Медленные запросы и так видны в отчете - не дублируем их в лог
+    settings.SQL_INSTRUMENTATION["SLOW_REQUEST_MS"] = float("inf")
+    from rest_framework.settings import api_settings
+
+    api_settings.reload()
+
+    from benchmarks.seed import isbn, seed
+    from django.db import connection
+    from landing.models import Book
+
+    started = time.perf_counter()
+    _, token, added = seed(args.books, args.users, args.news, args.seed)
+    print(f"Данные: {added} добавлено за {time.perf_counter() - started:.1f} сек")
+
+    # Книги для detail - по ISBN из данных бенчмарка (без ORDER BY random() по всей таблице)
+    rng = random.Random(args.seed)
+    isbns = [isbn(index) for index in rng.sample(range(args.books), min(500, args.books))]
+    book_ids = list(Book.objects.filter(isbn__in=isbns).values_list("id", flat=True))
+    selected = scenarios(book_ids, args.books, args.users)
+    if args.only:
+        selected = {name: selected[name] for name in args.only}
+
+    modes = ["client", "live"] if args.mode == "both" else [args.mode]
+    server = start_server() if "live" in modes else None
+    results = {}
+    for mode in modes:
+        for name, (method, path_for, body, share) in selected.items():
+            count = max(int(args.requests * share), 2)
+            warmup = min(args.warmup, count)
+            if mode == "client":
+                result = run_client(method, path_for, body, count, warmup, token)
+            else:
+                result = run_live(server, method, path_for, body, count, warmup, token, args.concurrency)
+            results[f"{mode}:{name}"] = result
+            print(
+                f"{mode + ':' + name:28} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+                f"p99 {result['p99_ms']:8.2f} мс  {result['rps']:8.1f} rps  "
+                f"SQL {result['queries']}  ошибок {result['errors']}"
+            )
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": {"books": args.books, "users": args.users, "news": args.news, "seed": args.seed},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты записаны в {args.output}")
+
+    thresholds = json.loads(Path(args.thresholds).read_text()) if Path(args.thresholds).exists() else {}
+    baseline = json.loads(Path(args.baseline).read_text())["results"] if args.baseline else {}
+    failures = check(results, thresholds, baseline, args.max_regression)
+    for failure in failures:
+        print(f"РЕГРЕССИЯ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
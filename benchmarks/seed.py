@@ -0,0 +1,50 @@
+"""
+Тестовые данные для бенчмарков.
+
+Книги, пользователи и новости генерируются landing/fake_data.py (как
+командой generate_data): данные детерминированы и дозаполняются -
+повторный запуск с тем же размером ничего не добавляет, с большим -
+добавляет недостающее. Здесь же создается staff-пользователь, от имени
+которого идут запросы бенчмарка.
+"""
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from landing import fake_data
+from users.models import CustomUser
+
+ADMIN_EMAIL = "admin@bench.local"
+PASSWORD = "bench-password-1"
+BATCH_SIZE = 10000
+
+isbn = fake_data.isbn13
+
+
+def seed_admin():
+    """Пользователь staff с токеном - от его имени идут запросы бенчмарка"""
+    admin, created = CustomUser.objects.get_or_create(
+        email=ADMIN_EMAIL,
+        defaults={"username": "bench-admin", "is_staff": True},
+    )
+    if created:
+        admin.set_password(PASSWORD)
+        admin.save(update_fields=["password"])
+    token, _ = Token.objects.get_or_create(user=admin)
+    return admin, token.key
+
+
+def seed(books, users, news, seed=0):
+    """Дозаполняет данные до заданных размеров, возвращает (admin, токен, добавлено)"""
+    with transaction.atomic():
+        admin, token = seed_admin()
+    added = fake_data.generate(
+        books=books,
+        # Новостям нужны авторы из сгенерированных пользователей
+        users=max(users, 1 if news else 0),
+        news=news,
+        seed=seed,
+        chunk_rows=BATCH_SIZE,
+        # Тот же пароль, что у generate_data по умолчанию: данные взаимозаменяемы
+        password=fake_data.DEFAULT_PASSWORD,
+    )
+    return admin, token, added
@@ -0,0 +1,100 @@
+"""
+Замер накладных расходов троттлинга (config/throttling.py).
+
+    python benchmarks/throttling.py
+    python benchmarks/throttling.py --iterations 200000 --clients 1000 --store cache
+
+Для каждого класса троттлинга вызывает allow_request на заранее
+подготовленных запросах (разные IP и токены) и печатает среднее время
+на один вызов и p99 по пачкам из 1000 вызовов. Суммарное время всех
+трех классов должно укладываться в --budget-us микросекунд, иначе
+код возврата 1.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+
+def build_requests(clients):
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+
+    factory = RequestFactory()
+    requests = []
+    for i in range(clients):
+        django_request = factory.post(
+            "/api/books/", REMOTE_ADDR=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+        )
+        request = Request(django_request)
+        request._user = AnonymousUser()
+        # Токен без обращения к БД: для троттлинга нужен только key
+        request._auth = type("FakeToken", (), {"key": f"{i:040x}"})()
+        requests.append(request)
+    return requests
+
+
+class View:
+    throttle_scope = "bench"
+
+
+def measure(throttle_class, requests, iterations):
+    view = View()
+    samples = []
+    batch = 1000
+    done = 0
+    while done < iterations:
+        started = time.perf_counter()
+        for i in range(done, done + batch):
+            throttle_class().allow_request(requests[i % len(requests)], view)
+        samples.append((time.perf_counter() - started) / batch)
+        done += batch
+    samples.sort()
+    return statistics.fmean(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--store", choices=["local", "cache"], default="local")
+    parser.add_argument("--budget-us", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.THROTTLE_STORE = args.store
+    # Лимиты с запасом, чтобы измерять путь "разрешено" и "отказано" вперемешку
+    settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"].update({
+        "bench:ip": "100/min",
+        "bench:user": "100/min",
+        "bench:endpoint": f"{args.iterations // 2}/min",
+    })
+    from rest_framework.settings import api_settings
+
+    api_settings.reload()
+
+    from config.throttling import EndpointRateThrottle, IPRateThrottle, TokenRateThrottle
+
+    requests = build_requests(args.clients)
+    total = 0.0
+    print(f"хранилище: {args.store}, вызовов: {args.iterations}, клиентов: {args.clients}")
+    for throttle_class in (IPRateThrottle, TokenRateThrottle, EndpointRateThrottle):
+        mean, p99 = measure(throttle_class, requests, args.iterations)
+        total += mean
+        print(f"{throttle_class.__name__:22} среднее {mean * 1e6:7.2f} мкс  p99 {p99 * 1e6:7.2f} мкс")
+
+    print(f"{'итого на запрос':22} {total * 1e6:7.2f} мкс (бюджет {args.budget_us:.0f} мкс)")
+    return 0 if total * 1e6 <= args.budget_us else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
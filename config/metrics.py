@@ -0,0 +1,426 @@
+"""
+Метрики приложения в формате Prometheus (GET /metrics).
+
+Приложение работает в нескольких процессах (воркеры gunicorn/uvicorn),
+поэтому метрики одного процесса ничего не говорят о сервисе в целом:
+
+- каждый процесс копит метрики в памяти (запись - словарь под локальной
+  блокировкой, без обращений к диску и сети на каждом запросе);
+- фоновый поток раз в FLUSH_INTERVAL секунд атомарно (os.replace)
+  записывает снимок в METRICS_DIR/<pid>.json - каждый процесс пишет
+  только свой файл, межпроцессных блокировок на горячем пути нет;
+- /metrics читает файлы всех процессов и суммирует их. Gauge завершенных
+  процессов отбрасываются, а их счетчики и гистограммы переносятся в
+  archive.json (под flock), чтобы суммы не уменьшались.
+
+METRICS_DIR нужно очищать при перезапуске сервиса (как и в
+multiprocess-режиме prometheus_client).
+"""
+import atexit
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+# Границы гистограммы длительности запросов (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя -> (тип, описание)
+METRICS = {
+    "http_requests_total": ("counter", "Обработанные HTTP запросы"),
+    "http_request_duration_seconds": ("histogram", "Длительность обработки HTTP запроса"),
+    "http_requests_in_flight": ("gauge", "HTTP запросы, обрабатываемые сейчас"),
+    "db_queries_total": ("counter", "SQL запросы, выполненные при обработке HTTP запросов"),
+    "db_query_duration_seconds_total": ("counter", "Суммарное время SQL запросов"),
+    "cache_requests_total": ("counter", "Обращения к слоям кэша (result=hit|miss)"),
+    "login_hashing_queue_depth": ("gauge", "Проверки паролей, ожидающие в очереди"),
+    "login_hashing_running": ("gauge", "Проверки паролей, выполняемые сейчас"),
+    "login_hashing_total": ("counter", "Проверки паролей по результату"),
+    "db_pool_connections": ("gauge", "Соединения в пуле БД (state=idle|in_use)"),
+    "db_pool_waiting": ("gauge", "Потоки, ожидающие свободное соединение"),
+    "db_pool_max_size": ("gauge", "Максимальный размер пула БД"),
+    "db_pool_checkouts_total": ("counter", "Выдачи соединений из пула БД"),
+    "db_pool_waits_total": ("counter", "Выдачи соединений, которым пришлось ждать"),
+    "db_pool_wait_seconds_total": ("counter", "Суммарное ожидание соединений из пула БД"),
+    "db_pool_timeouts_total": ("counter", "Отказы: свободное соединение не дождались"),
+    "db_pool_errors_total": ("counter", "Ошибки открытия соединений с БД"),
+    "db_pool_health_check_failures_total": ("counter", "Соединения, не прошедшие проверку перед выдачей"),
+    "db_pool_connections_opened_total": ("counter", "Открытые пулом соединения"),
+    "db_pool_connections_closed_total": ("counter", "Закрытые пулом соединения"),
+}
+
+# Накопительные счетчики пула БД -> имя метрики
+DB_POOL_COUNTERS = {
+    "checkouts": "db_pool_checkouts_total",
+    "waits": "db_pool_waits_total",
+    "wait_seconds_sum": "db_pool_wait_seconds_total",
+    "timeouts": "db_pool_timeouts_total",
+    "errors": "db_pool_errors_total",
+    "health_check_failures": "db_pool_health_check_failures_total",
+    "connections_opened": "db_pool_connections_opened_total",
+    "connections_closed": "db_pool_connections_closed_total",
+}
+
+ARCHIVE = "archive.json"
+
+
+class Registry:
+    """Метрики одного процесса"""
+
+    def __init__(self, directory, flush_interval):
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"{self.pid}.json")
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}  # (имя, метки) -> значение
+        self._gauges = {}
+        self._histograms = {}  # (имя, метки) -> [счетчики корзин..., сумма]
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_gauge(self, name, labels=(), delta=1):
+        key = (name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def set_gauge(self, name, labels=(), value=0):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(LATENCY_BUCKETS)] += 1
+            histogram[-1] += value
+
+    def _collect_login_pool(self):
+        # Пул создается при первом логине - здесь его не создаем
+        from users import hashing
+
+        pool = hashing._pool
+        if pool is None:
+            return
+        stats = pool.stats()
+        self.set_gauge("login_hashing_queue_depth", (), stats["queue_depth"])
+        self.set_gauge("login_hashing_running", (), stats["running"])
+        with self._lock:
+            for result in ("completed", "rejected", "timed_out"):
+                # Счетчики пула уже накопительные - переносим как есть
+                self._counters[("login_hashing_total", (("result", result),))] = stats[result]
+
+    def _collect_db_pools(self):
+        # Модуль импортируется только если пул включен в DATABASES
+        module = sys.modules.get("config.postgresql_pool.base")
+        if module is None:
+            return
+        for alias, stats in module.pool_stats().items():
+            labels = (("alias", alias),)
+            self.set_gauge("db_pool_connections", labels + (("state", "idle"),), stats["idle"])
+            self.set_gauge("db_pool_connections", labels + (("state", "in_use"),), stats["in_use"])
+            self.set_gauge("db_pool_waiting", labels, stats["waiting"])
+            self.set_gauge("db_pool_max_size", labels, stats["max_size"])
+            with self._lock:
+                for key, name in DB_POOL_COUNTERS.items():
+                    self._counters[(name, labels)] = stats[key]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, labels, value] for (name, labels), value in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Записывает снимок метрик процесса в его файл"""
+        self._collect_login_pool()
+        self._collect_db_pools()
+        data = self.snapshot()
+        with self._flush_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = f"{self.path}.tmp"
+            with open(temp, "w") as file:
+                json.dump(data, file)
+            os.replace(temp, self.path)
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Реестр текущего процесса (после fork создается заново)"""
+    global _registry
+    registry = _registry
+    if registry is not None and registry.pid == os.getpid():
+        return registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            config = settings.METRICS
+            _registry = Registry(config["DIR"], config["FLUSH_INTERVAL"])
+            threading.Thread(target=_registry.run_flusher, name="metrics-flush", daemon=True).start()
+            atexit.register(_registry.flush)
+        return _registry
+
+
+def inc(name, labels=(), value=1):
+    if settings.METRICS["ENABLED"]:
+        get_registry().inc(name, labels, value)
+
+
+def cache_event(layer, hit):
+    """Обращение к слою кэша: layer - имя слоя, hit - было ли значение в кэше"""
+    inc("cache_requests_total", (("layer", layer), ("result", "hit" if hit else "miss")))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(target, rows, histogram=False):
+    for name, labels, value in rows:
+        key = (name, tuple(tuple(label) for label in labels))
+        if histogram:
+            current = target.setdefault(key, [0] * len(value))
+            for index, item in enumerate(value):
+                current[index] += item
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _archive_dead(directory, dead):
+    """Переносит счетчики и гистограммы завершенных процессов в archive.json"""
+    archive_path = os.path.join(directory, ARCHIVE)
+    archive = _read(archive_path) or {"counters": [], "histograms": []}
+    counters, histograms = {}, {}
+    _merge(counters, archive["counters"])
+    _merge(histograms, archive["histograms"], histogram=True)
+    for _, data in dead:
+        _merge(counters, data["counters"])
+        _merge(histograms, data["histograms"], histogram=True)
+    temp = f"{archive_path}.tmp"
+    with open(temp, "w") as file:
+        json.dump({
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, value] for (name, labels), value in histograms.items()],
+        }, file)
+    os.replace(temp, archive_path)
+    for path, _ in dead:
+        os.unlink(path)
+
+
+def collect():
+    """Суммирует метрики всех процессов: (counters, gauges, histograms)"""
+    get_registry().flush()
+    directory = settings.METRICS["DIR"]
+    counters, gauges, histograms = {}, {}, {}
+    dead = []
+    # Блокировка только между параллельными /metrics (чтобы файл завершенного
+    # процесса не был учтен дважды); воркеры пишут свои файлы без нее
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(directory, filename)
+            data = _read(path)
+            if data is None:
+                continue
+            _merge(counters, data["counters"])
+            _merge(histograms, data["histograms"], histogram=True)
+            if filename == ARCHIVE:
+                continue
+            if _pid_alive(data["pid"]):
+                _merge(gauges, data["gauges"])
+            else:
+                dead.append((path, data))
+        if dead:
+            _archive_dead(directory, dead)
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render(counters, gauges, histograms):
+    """Текстовый формат Prometheus 0.0.4"""
+    by_name = {}
+    for source in (counters, gauges, histograms):
+        for (name, labels), value in source.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, description = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    GET /metrics для Prometheus.
+
+    Доступ - по заголовку Authorization: Bearer <METRICS_TOKEN> или
+    пользователю staff (сессия). Без METRICS_TOKEN - только staff.
+    """
+    token = settings.METRICS["TOKEN"]
+    authorized = token and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render(*collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class _QueryCounter:
+    """Минимальный execute_wrapper: только количество и время SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Длительность, количество и SQL запросов по имени URL (book-list, api-login, ...)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.METRICS["ENABLED"]
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _wrap_connections(queries):
+        """
+        Ставит execute_wrapper на соединения текущего потока. Под ASGI
+        вызывается через sync_to_async: синхронный код запроса (и
+        асинхронный ORM) выполняется в одном потоке запроса.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        registry = get_registry()
+        registry.add_gauge("http_requests_in_flight", (), 1)
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        try:
+            with self._wrap_connections(queries):
+                response = self.get_response(request)
+        finally:
+            registry.add_gauge("http_requests_in_flight", (), -1)
+        return self._record(request, response, queries, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        registry = get_registry()
+        registry.add_gauge("http_requests_in_flight", (), 1)
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        try:
+            stack = await sync_to_async(self._wrap_connections)(queries)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            registry.add_gauge("http_requests_in_flight", (), -1)
+        return self._record(request, response, queries, time.perf_counter() - started)
+
+    def _record(self, request, response, queries, elapsed):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        if view == "metrics":
+            return response
+        registry = get_registry()
+        registry.inc("http_requests_total", (
+            ("view", view), ("method", request.method), ("status", str(response.status_code)),
+        ))
+        registry.observe("http_request_duration_seconds", (("view", view),), elapsed)
+        if queries.count:
+            registry.inc("db_queries_total", (("view", view),), queries.count)
+            registry.inc("db_query_duration_seconds_total", (("view", view),), queries.duration)
+        return response
@@ -0,0 +1,191 @@
+"""
+Учет SQL запросов на каждый HTTP запрос.
+
+QueryInstrumentationMiddleware через connection.execute_wrapper считает
+запросы и время в БД, и по итогам:
+
+- добавляет заголовок Server-Timing (виден в DevTools браузера):
+  db;dur=12.3;desc="8 queries", app;dur=40.1;
+- ищет подозрения на N+1: один и тот же SQL (с плейсхолдерами вместо
+  параметров) выполнен N_PLUS_ONE_THRESHOLD раз и больше;
+- пишет в лог медленные запросы (дольше SLOW_REQUEST_MS) с самыми
+  долгими SQL.
+
+Учитывается только доля запросов SAMPLE_RATE, остальные проходят без
+обертки, поэтому в продакшене можно оставить включенным с небольшой долей.
+
+Под ASGI синхронный код запроса (sync views, асинхронный ORM - он тоже
+уходит в sync_to_async) выполняется в одном потоке запроса, а соединения
+с БД привязаны к потоку. Поэтому обертки ставятся и снимаются через
+sync_to_async в том же потоке. Не учитывается SQL, выполненный уже при
+отдаче StreamingHttpResponse.
+
+DatabaseUnavailableMiddleware отвечает 503, если пул соединений с БД
+исчерпан (config/postgresql_pool).
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """execute_wrapper, который копит количество и время запросов по форме SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}  # SQL -> [количество, суммарное время]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            shape = self.shapes.get(sql)
+            if shape is None:
+                self.shapes[sql] = [1, elapsed]
+            else:
+                shape[0] += 1
+                shape[1] += elapsed
+
+    def repeated(self, threshold):
+        """Формы SQL, выполненные threshold раз и больше (подозрение на N+1)"""
+        return sorted(
+            ((sql, count, duration) for sql, (count, duration) in self.shapes.items() if count >= threshold),
+            key=lambda item: -item[1],
+        )
+
+    def slowest(self, limit):
+        return sorted(
+            ((sql, count, duration) for sql, (count, duration) in self.shapes.items()),
+            key=lambda item: -item[2],
+        )[:limit]
+
+
+def _format_queries(queries):
+    return "\n".join(
+        f"  {count} x {duration * 1000:.1f} мс: {sql[:500]}" for sql, count, duration in queries
+    )
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = settings.SQL_INSTRUMENTATION
+        self.sample_rate = config["SAMPLE_RATE"]
+        self.slow_ms = config["SLOW_REQUEST_MS"]
+        self.threshold = config["N_PLUS_ONE_THRESHOLD"]
+        self.top_queries = config["TOP_QUERIES"]
+        self.server_timing = config["SERVER_TIMING"]
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def _wrap_connections(stats):
+        """Ставит execute_wrapper на соединения текущего потока"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        stats = QueryStats()
+        # Остальные middleware (например, метрики) могут взять итоги отсюда
+        request.query_stats = stats
+        started = time.perf_counter()
+        with self._wrap_connections(stats):
+            response = self.get_response(request)
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        request.query_stats = stats
+        started = time.perf_counter()
+        stack = await sync_to_async(self._wrap_connections)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    def _report(self, request, response, stats, total):
+        if self.server_timing:
+            response["Server-Timing"] = (
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+                f"app;dur={total * 1000:.1f}"
+            )
+
+        suspects = stats.repeated(self.threshold)
+        if suspects:
+            logger.warning(
+                "Возможный N+1: %s %s, %d запросов, повторяются:\n%s",
+                request.method, request.path, stats.count, _format_queries(suspects[:self.top_queries]),
+            )
+        if total * 1000 >= self.slow_ms:
+            logger.warning(
+                "Медленный запрос: %s %s, %.0f мс, из них БД %.0f мс (%d запросов). Самые долгие:\n%s",
+                request.method, request.path, total * 1000, stats.duration * 1000, stats.count,
+                _format_queries(stats.slowest(self.top_queries)),
+            )
+        return response
+
+
+class DatabaseUnavailableMiddleware:
+    """
+    Пул соединений с БД исчерпан (config/postgresql_pool, PoolTimeout):
+    вместо 500 отвечает 503 с Retry-After - клиенту стоит повторить позже.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # process_exception вызывает обработчик Django (под ASGI - через sync_to_async)
+        return await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        from config.postgresql_pool.base import PoolTimeout
+
+        if isinstance(exception, OperationalError) and isinstance(exception.__cause__, PoolTimeout):
+            logger.warning("Нет свободного соединения с БД: %s %s", request.method, request.path)
+            response = JsonResponse(
+                {"detail": "Сервис временно перегружен, повторите запрос позже"}, status=503,
+            )
+            response["Retry-After"] = "1"
+            return response
+        return None
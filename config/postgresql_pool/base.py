@@ -0,0 +1,329 @@
+"""
+Бэкенд PostgreSQL (psycopg2) с пулом соединений внутри процесса.
+
+    DATABASES["default"]["ENGINE"] = "config.postgresql_pool"
+    DATABASES["default"]["POOL"] = {"MIN_SIZE": 2, "MAX_SIZE": 10, ...}
+
+Без пула каждый запрос открывает новое соединение (TCP, TLS,
+аутентификация), а CONN_MAX_AGE держит по соединению на каждый поток,
+даже простаивающий. Здесь соединение берется из пула при первом SQL
+запросе и возвращается в пул, когда Django его закрывает (в конце
+запроса, CONN_MAX_AGE должен быть 0):
+
+- MIN_SIZE - столько соединений пул держит открытыми всегда;
+- MAX_SIZE - больше соединений процесс не откроет, остальные ждут;
+- TIMEOUT - сколько секунд ждать свободное соединение, затем PoolTimeout
+  (ответ 503, см. config/middleware.py);
+- MAX_LIFETIME - соединение старше этого закрывается при возврате в пул
+  (перераспределение между репликами за балансировщиком, утечки памяти
+  в бэкенде PostgreSQL);
+- MAX_IDLE - соединения сверх MIN_SIZE, простаивающие дольше, закрываются;
+- CHECK_IDLE - соединение, простоявшее в пуле дольше, перед выдачей
+  проверяется SELECT 1 (0 - проверять всегда). Мертвые соединения
+  (перезапуск PostgreSQL, обрыв сети) отбрасываются, запрос их не увидит.
+
+Пул общий для всех потоков процесса (WSGI с потоками, ASGI - синхронный
+код Django выполняется в потоках), после fork создается заново.
+Статистика - pool_stats(), экспортируется в /metrics.
+"""
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.db.backends.base.base import NO_DB_ALIAS
+from psycopg2 import extensions
+
+DEFAULTS = {
+    "MIN_SIZE": 0,
+    "MAX_SIZE": 10,
+    "TIMEOUT": 5.0,
+    "MAX_LIFETIME": 3600.0,
+    "MAX_IDLE": 300.0,
+    "CHECK_IDLE": 30.0,
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Свободное соединение не появилось за TIMEOUT секунд"""
+
+
+class ConnectionPool:
+    def __init__(self, name, connect, min_size, max_size, timeout, max_lifetime, max_idle, check_idle):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Нужно 0 <= MIN_SIZE <= MAX_SIZE и MAX_SIZE >= 1")
+        self.name = name
+        self.pid = os.getpid()
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+
+        self._condition = threading.Condition()
+        self._idle = deque()  # (соединение, когда открыто, когда возвращено)
+        self._opened = {}  # id(соединение) -> когда открыто (включая выданные)
+        self._size = 0  # открытые и открывающиеся соединения
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_sum": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "errors": 0,
+            "health_check_failures": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+        }
+        threading.Thread(target=self._maintain, name=f"db-pool-{name}", daemon=True).start()
+
+    def _open(self):
+        """Открывает соединение (место в _size уже занято вызывающим)"""
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._stats["errors"] += 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opened[id(connection)] = time.monotonic()
+            self._stats["connections_opened"] += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._condition:
+            # Соединение не из этого пула (пул пересоздан) место в нем не занимает
+            if self._opened.pop(id(connection), None) is not None:
+                self._size -= 1
+                self._stats["connections_closed"] += 1
+                self._condition.notify()
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            candidate = None
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout(f"Пул соединений {self.name} закрыт")
+                    if self._idle:
+                        # Последнее возвращенное: оно "теплое", а давно
+                        # простаивающие в начале очереди закроет _maintain
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Нет свободного соединения в пуле {self.name} "
+                            f"за {self.timeout:g} сек (MAX_SIZE={self.max_size})"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if candidate is None:
+                connection = self._open()
+            else:
+                connection, _, returned = candidate
+                if (
+                    connection.closed
+                    or (time.monotonic() - returned >= self.check_idle and not self._healthy(connection))
+                ):
+                    with self._condition:
+                        self._stats["health_check_failures"] += 1
+                    self._discard(connection)
+                    continue
+
+            wait = time.monotonic() - started
+            with self._condition:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_seconds_sum"] += wait
+                    self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+            return connection
+
+    def putconn(self, connection):
+        """Возвращает соединение в пул (или закрывает, если оно непригодно или старое)"""
+        opened = self._opened.get(id(connection))
+        if self._closed or opened is None or connection.closed:
+            self._discard(connection)
+            return
+        try:
+            status = connection.get_transaction_status()
+            if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+                # Незавершенная транзакция (исключение внутри atomic) - не
+                # отдаем ее следующему запросу
+                connection.rollback()
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                # Запрос еще выполняется или соединение потеряно
+                self._discard(connection)
+                return
+        except psycopg2.Error:
+            self._discard(connection)
+            return
+        now = time.monotonic()
+        if now - opened >= self.max_lifetime:
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, opened, now))
+            self._condition.notify()
+
+    def _maintain(self):
+        """Фоновый поток: закрывает простаивающие и старые соединения, держит MIN_SIZE"""
+        while not self._closed and self.pid == os.getpid():
+            expired = []
+            with self._condition:
+                now = time.monotonic()
+                keep = deque()
+                for item in self._idle:
+                    connection, opened, returned = item
+                    surplus = self._size - len(expired) > self.min_size
+                    if now - opened >= self.max_lifetime or (surplus and now - returned >= self.max_idle):
+                        expired.append(connection)
+                    else:
+                        keep.append(item)
+                self._idle = keep
+                missing = max(self.min_size - (self._size - len(expired)), 0)
+            for connection in expired:
+                self._discard(connection)
+            for _ in range(missing):
+                with self._condition:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                try:
+                    connection = self._open()
+                except psycopg2.Error:
+                    break
+                self.putconn(connection)
+            time.sleep(min(self.max_idle, self.check_idle, 5.0) or 1.0)
+
+    def open(self):
+        # Для совместимости с пулом psycopg 3, который ожидает Django:
+        # этот пул открывает соединения по мере надобности
+        pass
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._condition.notify_all()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats():
+    """Статистика пулов текущего процесса: псевдоним БД -> словарь"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == pid]
+    return {pool.name: pool.stats() for pool in pools}
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """
+    Использует встроенную в Django поддержку пула (свойство pool), но со
+    своим пулом: пул Django требует psycopg 3, а проект работает на psycopg2.
+    """
+
+    @property
+    def pool(self):
+        if self.alias == NO_DB_ALIAS:
+            # Служебное соединение к БД postgres (создание тестовой БД)
+            return None
+        pool = _pools.get(self.alias)
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        with _pools_lock:
+            pool = _pools.get(self.alias)
+            if pool is None or pool.pid != os.getpid():
+                if self.settings_dict["CONN_MAX_AGE"] != 0:
+                    raise ImproperlyConfigured("Пул соединений требует CONN_MAX_AGE = 0")
+                # Соединения родителя после fork не используем - только новый пул
+                options = {**DEFAULTS, **self.settings_dict.get("POOL", {})}
+                params = self.get_connection_params()
+                pool = _pools[self.alias] = ConnectionPool(
+                    self.alias,
+                    functools.partial(self._connect_raw, params),
+                    min_size=options["MIN_SIZE"],
+                    max_size=options["MAX_SIZE"],
+                    timeout=options["TIMEOUT"],
+                    max_lifetime=options["MAX_LIFETIME"],
+                    max_idle=options["MAX_IDLE"],
+                    check_idle=options["CHECK_IDLE"],
+                )
+            return pool
+
+    def close_pool(self):
+        with _pools_lock:
+            pool = _pools.pop(self.alias, None)
+        if pool is not None and pool.pid == os.getpid():
+            pool.close()
+
+    def _connect_raw(self, conn_params):
+        # Часовой пояс и роль настраиваются один раз при открытии и
+        # сохраняются в соединении между запросами
+        connection = self.Database.connect(**conn_params)
+        connection.autocommit = True
+        self._configure_connection(connection)
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+            # Соединение больше не принадлежит этому потоку
+            self.connection = None
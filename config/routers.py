@@ -0,0 +1,215 @@
+"""
+Чтение с реплик PostgreSQL с "read-your-writes".
+
+Реплики описываются в settings.DATABASE_REPLICAS (псевдоним -> вес).
+ReplicaRoutingMiddleware решает для каждого HTTP запроса, куда идут
+чтения:
+
+- небезопасные методы (POST, PUT, PATCH, DELETE) - все запросы к primary;
+- безопасные методы (GET, HEAD, OPTIONS) - чтения на одну из реплик,
+  выбранную для всего запроса (взвешенно случайно или по кругу), чтобы
+  внутри одного ответа данные были согласованы;
+- после записи клиент закрепляется за primary на PIN_SECONDS (реплики
+  отстают): в ответ ставится cookie, а для запросов с заголовком
+  Authorization (API-клиенты с токеном обычно не хранят cookie) - еще и
+  отметка в кэше по хэшу заголовка.
+
+Вне HTTP запросов (команды manage.py, shell, фоновые задачи) все идет на
+primary - решение принимается только в middleware. Записи всегда идут
+на primary, миграции - только на primary.
+
+Отметки закрепления и кэш каталога должны быть общими для всех процессов
+(Redis, Memcached): иначе запись в одном воркере не закрепит клиента в
+другом. С репликами и кэшем в памяти процесса manage.py check выдает
+ошибку (check_replica_cache). Кэш каталога после записи тоже может
+заполниться отстающими данными с реплики - см. cacheable_read в
+landing/caching.py.
+
+В тестах реплики объявлены зеркалами default (TEST["MIRROR"]),
+поэтому видят те же данные.
+"""
+import contextvars
+import hashlib
+import itertools
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Кэши, которые не видны другим процессам
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+# Псевдоним БД для чтений в текущем запросе (None - primary)
+_read_alias = contextvars.ContextVar("read_alias", default=None)
+
+
+class ReplicaChooser:
+    """Выбор реплики: weighted - случайно с весами, round_robin - по кругу с учетом весов"""
+
+    def __init__(self, replicas, mode):
+        self.aliases = list(replicas)
+        self.weights = [replicas[alias] for alias in self.aliases]
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(
+            [alias for alias, weight in replicas.items() for _ in range(weight)]
+        )
+
+    def choose(self):
+        if len(self.aliases) == 1:
+            return self.aliases[0]
+        if self.mode == "round_robin":
+            with self._lock:
+                return next(self._cycle)
+        return random.choices(self.aliases, self.weights)[0]
+
+
+_chooser = None
+
+
+def get_chooser():
+    global _chooser
+    replicas = settings.DATABASE_REPLICAS
+    mode = settings.REPLICA_ROUTING["MODE"]
+    if _chooser is None or _chooser.aliases != list(replicas) or _chooser.mode != mode:
+        _chooser = ReplicaChooser(replicas, mode)
+    return _chooser
+
+
+def current_read_alias():
+    """Куда идут чтения в текущем контексте (для логов и отладки)"""
+    return _read_alias.get() or PRIMARY
+
+
+class use_primary:
+    """
+    Контекстный менеджер: чтения внутри блока идут на primary.
+
+    Для кода, который в GET запросе читает только что записанное другим
+    запросом и не может ждать репликации.
+    """
+
+    def __enter__(self):
+        self._token = _read_alias.set(None)
+
+    def __exit__(self, *exc_info):
+        _read_alias.reset(self._token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии primary, связи между объектами из них допустимы
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def check_replica_cache(app_configs=None, **kwargs):
+    """С репликами отметки закрепления и версии кэша каталога должны видеть все процессы"""
+    if not settings.DATABASE_REPLICAS:
+        return []
+    errors = []
+    for setting, alias in (
+        ('REPLICA_ROUTING["CACHE_ALIAS"]', settings.REPLICA_ROUTING["CACHE_ALIAS"]),
+        ("CATALOG_CACHE_ALIAS", settings.CATALOG_CACHE_ALIAS),
+    ):
+        backend = settings.CACHES[alias]["BACKEND"]
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(checks.Error(
+                f"{setting} указывает на кэш {alias!r} ({backend}), который не общий для процессов",
+                hint="С DB_REPLICAS нужен общий кэш, например CACHE_BACKEND="
+                     "django.core.cache.backends.redis.RedisCache",
+                id="config.E001",
+            ))
+    return errors
+
+
+def _pin_key(request):
+    authorization = request.headers.get("Authorization")
+    if not authorization:
+        return None
+    return "db-pin:" + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = settings.REPLICA_ROUTING
+        self.pin_seconds = config["PIN_SECONDS"]
+        self.cookie = config["COOKIE_NAME"]
+        self.cache_alias = config["CACHE_ALIAS"]
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request):
+        try:
+            if float(request.COOKIES.get(self.cookie, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        key = _pin_key(request)
+        return key is not None and caches[self.cache_alias].get(key) is not None
+
+    def _read_alias_for(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        if self._pinned(request):
+            return None
+        return get_chooser().choose()
+
+    def _pin(self, request, response):
+        if request.method in SAFE_METHODS or self.pin_seconds <= 0:
+            return
+        response.set_cookie(
+            self.cookie,
+            str(time.time() + self.pin_seconds),
+            max_age=self.pin_seconds,
+            httponly=True,
+            samesite="Lax",
+        )
+        key = _pin_key(request)
+        if key is not None:
+            caches[self.cache_alias].set(key, 1, self.pin_seconds)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_alias.set(self._read_alias_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self._pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # Синхронный код Django под ASGI выполняется в других потоках, но
+        # asgiref копирует в них контекст - значение ContextVar видно и там
+        token = _read_alias.set(self._read_alias_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self._pin(request, response)
+        return response
@@ -2,6 +2,7 @@ from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,6 +29,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
+    # Первым, чтобы учитывать и запросы сессий и аутентификации
+    "config.middleware.QueryInstrumentationMiddleware",
+    "config.middleware.DatabaseUnavailableMiddleware",
+    # До сессий и аутентификации: их чтения тоже идут на реплику
+    "config.routers.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,17 +64,224 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "project.wsgi.application"
 
+# Соединения с БД. По умолчанию - постоянное соединение на поток, живущее
+# CONN_MAX_AGE секунд. DB_POOL=True включает пул соединений в каждом процессе
+# (config/postgresql_pool, подходит и для WSGI, и для ASGI)
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "config.postgresql_pool" if DB_POOL else "django.db.backends.postgresql_psycopg2",
         "NAME": os.getenv("POSTGRES_DB"),
         "USER": os.getenv("POSTGRES_USER"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # С пулом соединение возвращается в пул в конце каждого запроса
+        "CONN_MAX_AGE": 0 if DB_POOL else int(os.getenv("CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Порог сходства для нечеткого поиска (оператор <% в landing/fuzzy.py)
+            "options": f"-c pg_trgm.word_similarity_threshold={os.getenv('FUZZY_MIN_SIMILARITY', '0.4')}",
+        },
+        "POOL": {
+            "MIN_SIZE": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "MAX_SIZE": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", 5.0)),  # секунды
+            "MAX_LIFETIME": float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+            "MAX_IDLE": float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+            "CHECK_IDLE": float(os.getenv("DB_POOL_CHECK_IDLE", 30)),
+        },
+    }
+}
+
+# Реплики для чтения (config/routers.py): DB_REPLICAS=хост[:порт[:вес]],...
+# например DB_REPLICAS=db-replica-1:5432:3,db-replica-2:5432:1.
+# Имя БД, пользователь и пароль - как у default.
+DATABASE_REPLICAS = {}
+for number, spec in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), start=1):
+    host, port, weight = (spec.strip().split(":") + ["", ""])[:3]
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        # В тестах реплика - зеркало default, а не отдельная тестовая БД
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ["config.routers.PrimaryReplicaRouter"]
+
+REPLICA_ROUTING = {
+    # weighted - случайный выбор с весами, round_robin - по кругу с весами
+    "MODE": os.getenv("DB_REPLICA_MODE", "weighted"),
+    # Сколько секунд после записи клиент читает только с primary
+    "PIN_SECONDS": int(os.getenv("DB_REPLICA_PIN_SECONDS", 10)),
+    "COOKIE_NAME": "db_pin",
+    "CACHE_ALIAS": "default",
+}
+
+# Кэш. По умолчанию - в памяти процесса (подходит для разработки и тестов),
+# в продакшене нужен общий для всех воркеров бэкенд (с DB_REPLICAS без него
+# manage.py check выдает ошибку config.E001), например:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
     }
 }
 
+# Кэш ответов каталога книг (см. landing/caching.py)
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))  # секунды
+
+# Фасеты каталога (GET /api/books/facets/, см. landing/filters.py)
+BOOK_FACETS = {
+    "CACHE_TIMEOUT": int(os.getenv("BOOK_FACETS_CACHE_TIMEOUT", 60)),  # секунды
+    "AUTHOR_LIMIT": int(os.getenv("BOOK_FACETS_AUTHOR_LIMIT", 20)),
+}
+
+# Подсказки GET /api/books/suggest/ из индекса в памяти (landing/suggest.py)
+BOOK_SUGGEST = {
+    "MAX_MEMORY_MB": int(os.getenv("BOOK_SUGGEST_MAX_MEMORY_MB", 64)),
+    "LIMIT": 10,
+    "MAX_LIMIT": 20,
+    "MIN_LENGTH": 1,
+    # Сколько ключей с подходящим префиксом просматривать (ограничивает время ответа)
+    "MAX_SCAN": 1000,
+    # Как часто сверять версию каталога и как часто можно перестраивать индекс (секунды)
+    "CHECK_INTERVAL": 5,
+    "REBUILD_INTERVAL": int(os.getenv("BOOK_SUGGEST_REBUILD_INTERVAL", 60)),
+}
+
+# Нечеткий поиск GET /api/books/search/?mode=fuzzy (landing/fuzzy.py).
+# На PostgreSQL из этих настроек используется только MAX_CANDIDATES,
+# порог сходства задается в OPTIONS подключения к БД
+BOOK_FUZZY = {
+    "MAX_MEMORY_MB": int(os.getenv("BOOK_FUZZY_MAX_MEMORY_MB", 128)),
+    "MIN_SIMILARITY": float(os.getenv("FUZZY_MIN_SIMILARITY", 0.4)),
+    # Сколько кандидатов ранжировать и сколько лучших значений искать в БД
+    "MAX_CANDIDATES": 500,
+    "MAX_VALUES": 50,
+    # Сколько записей списков вхождений триграмм просматривать на запрос
+    "MAX_POSTINGS": 200000,
+    "CHECK_INTERVAL": 5,
+    "REBUILD_INTERVAL": int(os.getenv("BOOK_FUZZY_REBUILD_INTERVAL", 60)),
+}
+
+# Похожие книги GET /api/books/{id}/similar/ (landing/similar.py).
+# Индекс строит команда build_similar_index.
+BOOK_SIMILAR = {
+    "INDEX_DIR": os.getenv("BOOK_SIMILAR_INDEX_DIR") or str(BASE_DIR / "var" / "similar"),
+    # Размерность векторов (не больше 2048) и количество соседей в индексе
+    "DIMENSIONS": int(os.getenv("BOOK_SIMILAR_DIMENSIONS", 256)),
+    "NEIGHBORS": 20,
+    "LIMIT": 10,
+    # Память на блок матрицы сходства при сборке
+    "BLOCK_MEMORY_MB": int(os.getenv("BOOK_SIMILAR_BLOCK_MEMORY_MB", 64)),
+    # Доля измененных книг, после которой инкрементальная сборка становится полной
+    "FULL_REBUILD_RATIO": 0.2,
+    # Как часто процессы проверяют, не появилась ли новая сборка (секунды)
+    "CHECK_INTERVAL": 30,
+}
+
+# Просмотры книг и популярное (landing/trending.py)
+BOOK_TRENDING = {
+    "ENABLED": os.getenv("BOOK_VIEWS_ENABLED", "True") == "True",
+    # Буфер просмотров записывается в БД раз в FLUSH_INTERVAL секунд
+    # или раньше, когда накопится MAX_PENDING просмотров
+    "FLUSH_INTERVAL": float(os.getenv("BOOK_VIEWS_FLUSH_INTERVAL", 10)),
+    "MAX_PENDING": int(os.getenv("BOOK_VIEWS_MAX_PENDING", 10000)),
+    # Часовые корзины старше RETENTION_HOURS удаляются
+    "RETENTION_HOURS": int(os.getenv("BOOK_VIEWS_RETENTION_HOURS", 24 * 30)),
+    # Окно популярного по умолчанию и максимальное (?hours=)
+    "WINDOW_HOURS": 24,
+    "MAX_WINDOW_HOURS": 24 * 7,
+    "LIMIT": 20,
+    "MAX_LIMIT": 100,
+    "CACHE_TIMEOUT": int(os.getenv("BOOK_TRENDING_CACHE_TIMEOUT", 60)),
+}
+
+# Максимум книг в одном запросе POST /api/books/bulk/
+BOOK_BULK_MAX_ITEMS = int(os.getenv("BOOK_BULK_MAX_ITEMS", 5000))
+
+# Сколько строк читать из курсора БД за раз при выгрузке каталога
+BOOK_EXPORT_CHUNK_SIZE = int(os.getenv("BOOK_EXPORT_CHUNK_SIZE", 2000))
+
+# Производные изображения обложек книг (см. landing/images.py):
+# размеры (вписываются в прямоугольник ширина x высота) и форматы
+BOOK_COVER_SIZES = {
+    "thumb": (100, 150),
+    "small": (200, 300),
+    "medium": (400, 600),
+}
+BOOK_COVER_FORMATS = ["jpeg", "webp"]
+BOOK_COVER_QUALITY = 80
+BOOK_COVER_WORKERS = int(os.getenv("BOOK_COVER_WORKERS", 2))  # потоки для генерации
+# Через сколько секунд после готовых производных сбрасывать кэш ответов по книгам
+# (один сброс на все обложки, готовые за это время)
+BOOK_COVER_BUMP_DELAY = float(os.getenv("BOOK_COVER_BUMP_DELAY", 5))
+
+# Пул проверки паролей при входе через API (см. users/hashing.py)
+LOGIN_HASHING = {
+    "WORKERS": int(os.getenv("LOGIN_HASHING_WORKERS", 4)),  # одновременных хэшей
+    "MAX_QUEUE": int(os.getenv("LOGIN_HASHING_MAX_QUEUE", 64)),  # ожидающих проверок
+    "QUEUE_TIMEOUT": float(os.getenv("LOGIN_HASHING_QUEUE_TIMEOUT", 2.0)),  # секунды
+    "HASH_TIMEOUT": float(os.getenv("LOGIN_HASHING_HASH_TIMEOUT", 5.0)),  # секунды на сам хэш
+}
+
+# Массовое создание пользователей (см. users/provisioning.py)
+USER_PROVISIONING = {
+    # Максимум пользователей в одной пачке manage.py provision_users
+    "MAX_ITEMS": int(os.getenv("USER_PROVISIONING_MAX_ITEMS", 5000)),
+    # Максимум пользователей в одном запросе POST /api/users/bulk/ (пароли
+    # хэшируются в пуле LOGIN_HASHING, 500 - около минуты при 4 потоках)
+    "API_MAX_ITEMS": int(os.getenv("USER_PROVISIONING_API_MAX_ITEMS", 500)),
+    # Процессы для хэширования паролей в provision_users (0 - в текущем процессе)
+    "WORKERS": int(os.getenv("USER_PROVISIONING_WORKERS", os.cpu_count() or 1)),
+}
+
+# Учет SQL запросов на HTTP запрос (см. config/middleware.py)
+SQL_INSTRUMENTATION = {
+    # Доля учитываемых запросов (0 - выключено, 1 - все)
+    "SAMPLE_RATE": float(os.getenv("SQL_SAMPLE_RATE", 1.0 if DEBUG else 0.05)),
+    "SLOW_REQUEST_MS": int(os.getenv("SQL_SLOW_REQUEST_MS", 500)),
+    # Сколько одинаковых SQL за запрос считать подозрением на N+1
+    "N_PLUS_ONE_THRESHOLD": int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 5)),
+    "TOP_QUERIES": 5,  # сколько SQL показывать в логе
+    "SERVER_TIMING": os.getenv("SQL_SERVER_TIMING", "True") == "True",
+}
+
+# Метрики Prometheus (см. config/metrics.py): каждый процесс пишет свой
+# снимок в METRICS_DIR, GET /metrics суммирует снимки всех процессов
+METRICS = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "True") == "True",
+    "DIR": os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "bookstore-metrics")),
+    "FLUSH_INTERVAL": float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0)),  # секунды
+    # Authorization: Bearer <токен> для Prometheus; без токена /metrics только для staff
+    "TOKEN": os.getenv("METRICS_TOKEN", ""),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "config": {"handlers": ["console"], "level": "INFO"},
+        "landing": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Ограничение частоты запросов (см. config/throttling.py)
+# local - в памяти процесса (один узел), cache - в общем кэше (несколько узлов)
+THROTTLE_STORE = os.getenv("THROTTLE_STORE", "local")
+THROTTLE_CACHE_ALIAS = os.getenv("THROTTLE_CACHE_ALIAS", "default")
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -124,6 +338,25 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,  # Количество элементов на странице
 
+    # Ограничение частоты запросов: по IP, по токену и общий лимит на endpoint.
+    # Ключ лимита - "<scope>:ip", "<scope>:user" или "<scope>:endpoint", где scope -
+    # throttle_scope у view или имя URL. Без лимита для ключа запрос не ограничивается.
+    "DEFAULT_THROTTLE_CLASSES": [
+        "config.throttling.IPRateThrottle",
+        "config.throttling.TokenRateThrottle",
+        "config.throttling.EndpointRateThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "api-login:ip": "20/min",
+        "api-login:endpoint": "1200/min",
+        "api-register:ip": "10/hour",
+        "api-register:endpoint": "120/min",
+        "books-write:ip": "120/min",
+        "books-write:user": "60/min",
+        "books-write:endpoint": "1200/min",
+    },
+    "NUM_PROXIES": int(os.environ["NUM_PROXIES"]) if os.getenv("NUM_PROXIES") else None,
+
     # Формат дат и времени
     "DATETIME_FORMAT": "%Y-%m-%d %H:%M:%S",
     "DATE_FORMAT": "%Y-%m-%d",
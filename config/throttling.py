@@ -0,0 +1,327 @@
+"""
+Ограничение частоты запросов (throttling) для DRF.
+
+Три класса троттлинга, подключенные в REST_FRAMEWORK["DEFAULT_THROTTLE_CLASSES"]:
+
+- IPRateThrottle - по IP клиента (token bucket);
+- TokenRateThrottle - по токену или пользователю (token bucket);
+- EndpointRateThrottle - общий лимит на endpoint для всех клиентов
+  (sliding window), чтобы один endpoint не съел всю мощность.
+
+Область (scope) берется из view.throttle_scope, а если его нет - из имени
+URL (например, "api-login"). Лимиты задаются в DEFAULT_THROTTLE_RATES
+под ключами "<scope>:ip", "<scope>:user" и "<scope>:endpoint" в формате
+DRF ("20/min"). Если лимит для ключа не задан, запрос не ограничивается.
+
+Хранилище состояния выбирается настройкой THROTTLE_STORE:
+
+- "local" - словарь в памяти процесса с полосатыми блокировками
+  (атомарно, подходит для одного процесса/узла);
+- "cache" - общий кэш Django (Redis и т.п.) для нескольких узлов.
+  Sliding window там атомарен (cache.incr), token bucket - по алгоритму
+  GCRA с одним значением на ключ, чтение и запись которого идут под
+  короткой блокировкой на cache.add (атомарен в Redis и memcached).
+"""
+import hashlib
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """"20/min" -> (20, 60)"""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0]]
+
+
+class LocalStore:
+    """
+    Состояние лимитов в памяти процесса.
+
+    Ключи распределены по STRIPES блокировкам, чтобы параллельные запросы
+    разных клиентов не ждали друг друга на одной блокировке.
+    """
+    STRIPES = 64
+    # Сколько ключей хранить, прежде чем чистить давно не использованные
+    MAX_KEYS = 100_000
+    IDLE_SECONDS = 3600
+    # Чистка проходит по всем ключам под всеми блокировками, поэтому
+    # выполняется не чаще раза в PURGE_INTERVAL секунд и одним потоком
+    PURGE_INTERVAL = 60
+
+    def __init__(self):
+        self._locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self._purge_lock = threading.Lock()
+        self._purged_at = 0.0
+        self._buckets = {}  # ключ -> [токены, время обновления]
+        self._windows = {}  # ключ -> [номер окна, текущее окно, предыдущее окно, время]
+
+    def _lock(self, key):
+        return self._locks[hash(key) % self.STRIPES]
+
+    def _maybe_purge(self, now):
+        if len(self._buckets) + len(self._windows) <= self.MAX_KEYS:
+            return
+        if now - self._purged_at < self.PURGE_INTERVAL:
+            return
+        if not self._purge_lock.acquire(blocking=False):
+            return  # чистит другой поток
+        try:
+            if now - self._purged_at >= self.PURGE_INTERVAL:
+                self._purge(now)
+                self._purged_at = now
+        finally:
+            self._purge_lock.release()
+
+    @classmethod
+    def _evict(cls, states, updated_at, now, limit):
+        """Удаляет неактивные ключи, а если их все равно больше limit - самые старые"""
+        idle = [key for key, state in states.items() if now - state[updated_at] > cls.IDLE_SECONDS]
+        for key in idle:
+            del states[key]
+        extra = len(states) - limit
+        if extra > 0:
+            oldest = heapq.nsmallest(extra, states.items(), key=lambda item: item[1][updated_at])
+            for key, _ in oldest:
+                del states[key]
+
+    def _purge(self, now):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            # Запас в 10%, чтобы не чистить снова сразу после PURGE_INTERVAL
+            limit = int(self.MAX_KEYS * 0.9) // 2
+            self._evict(self._buckets, 1, now, limit)
+            self._evict(self._windows, 3, now, limit)
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def token_bucket(self, key, capacity, refill_rate, now):
+        """
+        Ведро на capacity токенов, пополняется на refill_rate токенов в секунду.
+        Возвращает (разрешено, сколько секунд ждать следующего токена).
+        """
+        self._maybe_purge(now)
+        with self._lock(key):
+            state = self._buckets.get(key)
+            if state is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, state[0] + (now - state[1]) * refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now]
+                return True, 0.0
+            self._buckets[key] = [tokens, now]
+            return False, (1 - tokens) / refill_rate
+
+    def sliding_window(self, key, limit, window, now):
+        """
+        Скользящее окно: счетчик текущего окна плюс доля предыдущего.
+        Возвращает (разрешено, сколько секунд ждать).
+        """
+        self._maybe_purge(now)
+        index = int(now // window)
+        elapsed = (now % window) / window
+        with self._lock(key):
+            state = self._windows.get(key)
+            if state is None or state[0] < index - 1:
+                current, previous = 0, 0
+            elif state[0] == index - 1:
+                current, previous = 0, state[1]
+            else:
+                current, previous = state[1], state[2]
+
+            if previous * (1 - elapsed) + current + 1 > limit:
+                self._windows[key] = [index, current, previous, now]
+                return False, _window_wait(limit, window, elapsed, current, previous)
+            self._windows[key] = [index, current + 1, previous, now]
+            return True, 0.0
+
+
+class CacheStore:
+    """Состояние лимитов в общем кэше Django (для нескольких узлов)"""
+
+    # Блокировка ключа token bucket: истекает сама, если узел упал, не сняв ее
+    LOCK_TIMEOUT = 1
+    # Сколько секунд ждать занятую блокировку
+    LOCK_WAIT = 0.1
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def _acquire(self, lock_key):
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not self.cache.add(lock_key, 1, timeout=self.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.002)
+        return True
+
+    @staticmethod
+    def _key(key):
+        return "throttle:" + hashlib.md5(key.encode()).hexdigest()
+
+    def token_bucket(self, key, capacity, refill_rate, now):
+        """
+        Token bucket в форме GCRA: хранится одно число - "теоретическое
+        время прибытия" (TAT) следующего запроса. Без блокировки два узла
+        могли бы прочитать один TAT и оба пропустить запрос.
+        """
+        cache_key = self._key(key)
+        lock_key = f"{cache_key}:lock"
+        interval = 1 / refill_rate
+        burst = capacity * interval
+        if not self._acquire(lock_key):
+            # Много одновременных запросов одного клиента (или блокировка
+            # упавшего узла): отказ надежнее, чем считать без блокировки
+            return False, interval
+        try:
+            tat = max(self.cache.get(cache_key) or now, now)
+            new_tat = tat + interval
+            if new_tat - now > burst:
+                return False, new_tat - now - burst
+            self.cache.set(cache_key, new_tat, timeout=math.ceil(burst) + 1)
+            return True, 0.0
+        finally:
+            self.cache.delete(lock_key)
+
+    def sliding_window(self, key, limit, window, now):
+        index = int(now // window)
+        elapsed = (now % window) / window
+        current_key = f"{self._key(key)}:{index}"
+        previous_key = f"{self._key(key)}:{index - 1}"
+
+        self.cache.add(current_key, 0, timeout=window * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Ключ вытеснен между add и incr
+            self.cache.set(current_key, 1, timeout=window * 2)
+            current = 1
+        previous = self.cache.get(previous_key) or 0
+
+        # current уже включает этот запрос. Отклоненный запрос не должен
+        # занимать место в окне (как в LocalStore), поэтому счетчик
+        # возвращается назад
+        if previous * (1 - elapsed) + current > limit:
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            return False, _window_wait(limit, window, elapsed, current - 1, previous)
+        return True, 0.0
+
+
+def _window_wait(limit, window, elapsed, current, previous):
+    """Через сколько секунд оценка скользящего окна опустится ниже лимита"""
+    if previous and limit - current - 1 >= 0:
+        needed = 1 - (limit - current - 1) / previous
+        return max(needed - elapsed, 0.0) * window
+    return (1 - elapsed) * window
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    name = settings.THROTTLE_STORE
+    with _stores_lock:
+        if name not in _stores:
+            if name == "local":
+                _stores[name] = LocalStore()
+            elif name == "cache":
+                _stores[name] = CacheStore(settings.THROTTLE_CACHE_ALIAS)
+            else:
+                raise ValueError(f"Неизвестное хранилище троттлинга: {name}")
+        return _stores[name]
+
+
+class BaseRateThrottle(BaseThrottle):
+    """
+    Общая логика: определить scope и лимит, вычислить ключ клиента
+    и спросить у хранилища, можно ли пропустить запрос.
+    """
+    kind = None  # суффикс ключа лимита: "ip", "user", "endpoint"
+    algorithm = "token_bucket"
+
+    def __init__(self):
+        self._wait = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        if scope:
+            return scope
+        match = getattr(request, "resolver_match", None)
+        return match.url_name if match else None
+
+    def get_rate(self, scope):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}:{self.kind}")
+
+    def get_ident_key(self, request, view):
+        """Идентификатор клиента; None - этот троттлинг к запросу не применяется"""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        if not scope:
+            return True
+        rate = self.get_rate(scope)
+        if rate is None:
+            return True
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+
+        count, period = parse_rate(rate)
+        key = f"{scope}:{self.kind}:{ident}"
+        store = get_store()
+        now = time.time()
+        if self.algorithm == "sliding_window":
+            allowed, wait = store.sliding_window(key, count, period, now)
+        else:
+            allowed, wait = store.token_bucket(key, count, count / period, now)
+        self._wait = wait
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class IPRateThrottle(BaseRateThrottle):
+    """Лимит на IP адрес клиента (учитывает NUM_PROXIES и X-Forwarded-For)"""
+    kind = "ip"
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class TokenRateThrottle(BaseRateThrottle):
+    """Лимит на токен (или пользователя при сессионной аутентификации)"""
+    kind = "user"
+
+    def get_ident_key(self, request, view):
+        key = getattr(request.auth, "key", None)
+        if key:
+            return f"token:{key}"
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return None
+
+
+class EndpointRateThrottle(BaseRateThrottle):
+    """Общий лимит на endpoint для всех клиентов"""
+    kind = "endpoint"
+    algorithm = "sliding_window"
+
+    def get_ident_key(self, request, view):
+        return "all"
@@ -22,8 +22,10 @@ from django.conf.urls.static import static
 from rest_framework import routers
 
 # Импортируем ViewSets для регистрации в router
+from config.metrics import metrics_view
+from landing import async_views
 from landing.views import BookViewSet
-from users.views import UserViewSet, register, login, logout
+from users.views import UserViewSet, register, login, login_stats, logout
 
 # Создаем router для автоматической регистрации ViewSet endpoints
 # Router автоматически создает стандартные CRUD endpoints для каждого ViewSet
@@ -47,8 +49,17 @@ urlpatterns = [
     # Кастомные API endpoints (не через router)
     path('api/register/', register, name='api-register'),
     path('api/login/', login, name='api-login'),
+    path('api/login/stats/', login_stats, name='api-login-stats'),
     path('api/logout/', logout, name='api-logout'),
 
+    # Асинхронные endpoints чтения каталога (для ASGI, см. landing/async_views.py)
+    path('api/async/books/', async_views.book_list, name='async-book-list'),
+    path('api/async/books/recent/', async_views.book_recent, name='async-book-recent'),
+    path('api/async/books/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+
+    # Метрики для Prometheus (см. config/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
+
     # HTML views (веб-интерфейс)
     path('', include('landing.urls')),
     path('users/', include('users.urls')),
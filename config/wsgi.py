@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# Индексы в памяти (подсказки и нечеткий поиск) строятся в фоне, не задерживая старт
+from django.db import connection  # noqa: E402
+from landing.fuzzy import TrigramIndex  # noqa: E402
+from landing.memory_index import warm_up  # noqa: E402
+from landing.suggest import PrefixIndex  # noqa: E402
+
+# На PostgreSQL нечеткий поиск идет через pg_trgm, индекс в памяти не нужен
+warm_up(PrefixIndex, *([] if connection.vendor == "postgresql" else [TrigramIndex]))
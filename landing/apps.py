@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+
+def install_search_backend(sender, using, **kwargs):
+    """
+    Восстанавливаем триггеры поиска после migrate.
+
+    SQLite пересоздает таблицу при изменении схемы, и триггеры FTS5 теряются.
+    """
+    from django.db import connections
+    from landing.search import install_search_backend as install
+
+    connection = connections[using]
+    if "landing_book" not in connection.introspection.table_names():
+        return
+    with connection.schema_editor() as schema_editor:
+        install(schema_editor)
 
 
 class LandingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "landing"
+
+    def ready(self):
+        from config.routers import check_replica_cache
+        from landing import signals
+
+        signals.connect_media_signals()
+        checks.register(check_replica_cache, checks.Tags.caches)
+        post_migrate.connect(install_search_backend, sender=self)
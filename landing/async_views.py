@@ -0,0 +1,228 @@
+"""
+Асинхронные endpoints чтения каталога для ASGI (uvicorn, daphne).
+
+Обычные DRF ViewSet синхронные: под ASGI каждый запрос к ним уходит
+в поток через sync_to_async. Эти views используют асинхронный ORM
+(afirst, aaggregate, асинхронная итерация по queryset) и не занимают поток
+на время запроса к БД.
+
+    GET /api/async/books/ - список книг (пагинация ?page=N, как в /api/books/)
+    GET /api/async/books/recent/ - последние 5 книг
+    GET /api/async/books/{id}/ - детальная информация о книге
+
+Доступ как у соответствующих действий BookViewSet: те же классы
+аутентификации (сессия и токен) и его get_permissions.
+
+Формат ответа совпадает с BookViewSet, включая отметки избранного
+(landing/favorites.py) для аутентифицированного пользователя. Кэш тот же:
+валидаторы (COUNT/MAX) и сериализованные данные лежат под версией модели
+(landing/caching.py), так что повторный запрос неизмененного каталога
+обходится без БД. ETag и Last-Modified - как в conditional_get.
+Обращения к кэшу, сериализация и отметки идут в потоке через
+sync_to_async, запросы к книгам - через асинхронный ORM.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from config.metrics import cache_event
+from landing.caching import cacheable_read, get_cache, model_changed_at, response_cache_key
+from landing.conditional import (
+    MISSING, acompute_validators, validator_headers, validators_cache_key,
+)
+from landing.favorites import overlay_favorites, user_favorites_etag
+from landing.models import Book, FavoriteBook
+from landing.serializers import BookSerializer
+from landing.views import BookViewSet
+
+RECENT_COUNT = 5
+
+
+def render_json(data, status=200):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type="application/json",
+        status=status,
+    )
+
+
+def not_found(detail="No Book matches the given query."):
+    return render_json({"detail": detail}, status=404)
+
+
+@sync_to_async
+def authenticate(request, action):
+    """
+    Аутентификация и проверка прав BookViewSet для действия action.
+
+    Возвращает (пользователь, None) или (None, ответ 401/403) - тот же,
+    что вернул бы BookViewSet.
+    """
+    view = BookViewSet(action_map={"get": action}, args=(), kwargs={}, format_kwarg=None)
+    view.headers = {}
+    view.request = view.initialize_request(request)
+    try:
+        view.perform_authentication(view.request)
+        view.check_permissions(view.request)
+    except APIException as exc:
+        denied = view.handle_exception(exc)
+        response = render_json(denied.data, status=denied.status_code)
+        if "WWW-Authenticate" in denied:
+            response["WWW-Authenticate"] = denied["WWW-Authenticate"]
+        return None, response
+    return view.request.user, None
+
+
+@sync_to_async
+def cache_lookup(key, event):
+    data = get_cache().get(key)
+    cache_event(event, data is not None)
+    return data
+
+
+@sync_to_async
+def cache_store(key, data):
+    if cacheable_read(Book):
+        get_cache().set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+
+
+async def cached_validators(request, action, queryset, detail=False):
+    """Валидаторы из кэша conditional_get; MISSING - объекта нет"""
+    key = await sync_to_async(validators_cache_key)(Book, action, request)
+    validators = await cache_lookup(key, "validators")
+    if validators is None:
+        validators = await acompute_validators(queryset)
+        if detail and validators[0] == 0:
+            validators = MISSING
+        await cache_store(key, validators)
+    return validators
+
+
+@sync_to_async
+def conditional_headers(request, validators, user, detail=False):
+    """(ETag, Last-Modified) с учетом избранного, как у BookViewSet"""
+    return validator_headers(
+        request, validators, Book, detail,
+        user_favorites_etag(user), model_changed_at(FavoriteBook),
+    )
+
+
+async def cached_data(request, action, build):
+    """Сериализованные данные из кэша cache_response или build()"""
+    key = await sync_to_async(response_cache_key)(Book, action, request)
+    data = await cache_lookup(key, "response")
+    if data is None:
+        data = await build()
+        if not isinstance(data, HttpResponse):
+            await cache_store(key, data)
+    return data
+
+
+@sync_to_async
+def serialize(request, books, many=False):
+    return BookSerializer(books, many=many, context={"request": request}).data
+
+
+@sync_to_async
+def render_with_favorites(data, items, user):
+    """Отметки избранного поверх данных (после кэша: он общий для всех)"""
+    overlay_favorites(items, user)
+    response = render_json(data)
+    # Ответ зависит от пользователя
+    patch_vary_headers(response, ("Authorization", "Cookie"))
+    return response
+
+
+async def respond(request, action, queryset, build, items, detail=False):
+    """
+    Общая часть endpoints: права, условный GET, кэш, избранное.
+
+    build(validators) - корутина, строящая данные ответа (или ответ
+    с ошибкой); items(data) - книги в них для отметок избранного.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    user, denied = await authenticate(request, action)
+    if denied is not None:
+        return denied
+
+    validators = await cached_validators(request, action, queryset, detail)
+    if validators == MISSING:
+        return not_found()
+    etag, timestamp = await conditional_headers(request, validators, user, detail)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+
+    data = await cached_data(request, action, lambda: build(validators))
+    if isinstance(data, HttpResponse):
+        return data
+    response = await render_with_favorites(data, items(data), user)
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+async def book_list(request):
+    queryset = Book.objects.all()
+
+    async def build(validators):
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        try:
+            page = int(request.GET.get("page", 1))
+        except ValueError:
+            page = 0
+        count = validators[0]
+        last_page = max((count + page_size - 1) // page_size, 1)
+        if page < 1 or page > last_page:
+            return not_found("Invalid page.")
+
+        offset = (page - 1) * page_size
+        books = [book async for book in queryset[offset:offset + page_size]]
+
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, "page", page + 1) if page < last_page else None
+        if page <= 1:
+            previous_url = None
+        elif page == 2:
+            previous_url = remove_query_param(url, "page")
+        else:
+            previous_url = replace_query_param(url, "page", page - 1)
+
+        return {
+            "count": count,
+            "next": next_url,
+            "previous": previous_url,
+            "results": await serialize(request, books, many=True),
+        }
+
+    return await respond(request, "list", queryset, build, lambda data: data["results"])
+
+
+async def book_recent(request):
+    queryset = Book.objects.order_by("-created_at")[:RECENT_COUNT]
+
+    async def build(validators):
+        return await serialize(request, [book async for book in queryset], many=True)
+
+    return await respond(request, "recent", queryset, build, lambda data: data)
+
+
+async def book_detail(request, pk):
+    queryset = Book.objects.filter(pk=pk)
+
+    async def build(validators):
+        book = await queryset.afirst()
+        if book is None:
+            # Удалена после того, как валидаторы попали в кэш
+            return not_found()
+        return await serialize(request, book)
+
+    return await respond(request, "retrieve", queryset, build, lambda data: [data], detail=True)
@@ -0,0 +1,52 @@
+"""
+Массовая запись книг.
+
+Используется командой import_books и пакетным endpoint API.
+Книги сохраняются через bulk_create с обновлением при конфликте
+по уникальному ISBN (upsert) - один запрос на пачку вместо
+INSERT/UPDATE на каждую книгу.
+"""
+from django.db import transaction
+
+from landing.caching import bump_model_version
+from landing.models import Book
+
+# Поля, которые обновляются у существующей книги (created_at не трогаем)
+UPSERT_FIELDS = [
+    "title",
+    "author",
+    "description",
+    "year_published",
+    "pages",
+    "updated_at",
+]
+
+
+def upsert_books(rows, batch_size=1000):
+    """
+    Создает или обновляет книги по ISBN.
+
+    rows - проверенные данные (validated_data сериализатора BookUpsertSerializer).
+    Если ISBN встречается в rows несколько раз, побеждает последняя запись:
+    PostgreSQL не позволяет обновить одну строку дважды в одном INSERT.
+
+    Возвращает словарь {isbn: Book}.
+
+    bulk_create не отправляет сигналы post_save, поэтому версия кэша
+    книг увеличивается здесь (после коммита транзакции).
+    """
+    books = {}
+    for row in rows:
+        books[row["isbn"]] = Book(**row)
+    if not books:
+        return books
+
+    Book.objects.bulk_create(
+        books.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["isbn"],
+        update_fields=UPSERT_FIELDS,
+    )
+    transaction.on_commit(lambda: bump_model_version(Book))
+    return books
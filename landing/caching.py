@@ -0,0 +1,145 @@
+"""
+Кэш ответов API для часто читаемых и редко изменяемых данных.
+
+Инвалидация через счетчик версии модели: версия входит в ключ кэша,
+и при изменении модели (сигналы в landing/signals.py) счетчик просто
+увеличивается. Старые ключи больше никто не читает, они вытесняются
+по таймауту - перебирать и удалять ключи не нужно.
+
+С репликами (config/routers.py) GET сразу после записи может прочитать
+с реплики еще старые данные и положить их в кэш уже под новой версией.
+Поэтому bump_model_version отмечает время изменения на PIN_SECONDS, и
+пока отметка есть, прочитанное с реплики не кэшируется (cacheable_read).
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from config.metrics import cache_event
+from config.routers import PRIMARY, current_read_alias
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _version_key(model):
+    return f"cache-version:{model._meta.label_lower}"
+
+
+def _changed_key(model):
+    return f"cache-changed:{model._meta.label_lower}"
+
+
+def _changed_at_key(model):
+    return f"cache-changed-at:{model._meta.label_lower}"
+
+
+def _initial_version():
+    # Если счетчик вытеснен из кэша, новая версия не должна совпасть
+    # ни с одной из прежних, поэтому начинаем не с 1, а с текущего времени
+    return time.time_ns() // 1000
+
+
+def get_model_version(model):
+    """Текущая версия данных модели"""
+    cache = get_cache()
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_model_version(model):
+    """
+    Увеличивает версию модели - все закэшированные ответы по ней устаревают.
+
+    Вызывается после коммита транзакции, иначе параллельный запрос может
+    успеть закэшировать еще не обновленные данные под новой версией.
+    """
+    cache = get_cache()
+    key = _version_key(model)
+    pin_seconds = settings.REPLICA_ROUTING["PIN_SECONDS"]
+    if settings.DATABASE_REPLICAS and pin_seconds > 0:
+        cache.set(_changed_key(model), 1, pin_seconds)
+    cache.set(_changed_at_key(model), time.time(), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Счетчика нет в кэше (еще не создан или вытеснен)
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def model_changed_at(model):
+    """
+    Время последнего изменения модели (секунды, для Last-Modified).
+
+    Если отметки нет (еще не было изменений или она вытеснена), считаем,
+    что модель изменилась сейчас: лишний ответ 200 лучше, чем 304 со
+    старыми данными.
+    """
+    cache = get_cache()
+    key = _changed_at_key(model)
+    changed_at = cache.get(key)
+    if changed_at is None:
+        cache.add(key, time.time(), timeout=None)
+        changed_at = cache.get(key)
+    return changed_at
+
+
+def cacheable_read(*models):
+    """
+    Можно ли кэшировать данные моделей, прочитанные в текущем запросе.
+
+    Нельзя, если чтение шло с реплики, а модель менялась меньше
+    PIN_SECONDS назад: реплика могла еще не получить изменение.
+    """
+    if current_read_alias() == PRIMARY:
+        return True
+    return not get_cache().get_many([_changed_key(model) for model in models])
+
+
+def response_cache_key(model, action, request):
+    """
+    Ключ кэша: модель, ее версия, действие, схема, хост и полный путь запроса.
+
+    Схема и хост нужны потому, что в ответах абсолютные URL
+    (build_absolute_uri: обложки, ссылки next/previous).
+    """
+    url = f"{request.scheme}://{request.get_host()}{request.get_full_path()}"
+    path = hashlib.md5(url.encode()).hexdigest()
+    version = get_model_version(model)
+    return f"response:{model._meta.label_lower}:v{version}:{action}:{path}"
+
+
+def cache_response(view_method):
+    """
+    Декоратор для безопасных (GET) действий ViewSet.
+
+    Кэширует response.data (уже сериализованные данные), а не готовый ответ:
+    формат (JSON, browsable API) выбирается при рендеринге, как обычно.
+    Разрешения проверяются до вызова действия, поэтому кэш их не обходит.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        cache = get_cache()
+        key = response_cache_key(self.queryset.model, self.action, request)
+        data = cache.get(key)
+        cache_event("response", data is not None)
+        if data is not None:
+            return Response(data)
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200 and cacheable_read(self.queryset.model):
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
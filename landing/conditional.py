@@ -0,0 +1,171 @@
+"""
+Условные GET запросы (ETag / Last-Modified) для каталога книг.
+
+Валидаторы считаются одним агрегирующим запросом (COUNT(*), MAX(id),
+MAX(updated_at)) по тому же queryset, из которого строится ответ, без
+сериализации. Если клиент прислал совпадающие If-None-Match /
+If-Modified-Since, возвращается 304 Not Modified без тела.
+
+Для списков валидаторы считаются по всему отфильтрованному queryset,
+а не по возвращаемой странице: состав страницы N зависит от всех книг
+перед ней (удаление книги на первой странице сдвигает остальные),
+а в ответе есть общее количество и ссылки next/previous. Путь с
+номером страницы входит в ETag, так что у каждой страницы он свой.
+
+Last-Modified одного объекта - его updated_at. У коллекции это
+MAX(updated_at) по тому же queryset, но не раньше последнего изменения
+книг вообще (model_changed_at в landing/caching.py): удаление книги или
+ее уход из-под фильтра не меняет MAX(updated_at) оставшихся, и клиент,
+приславший только If-Modified-Since, получил бы 304 со старым списком.
+
+Результат агрегата кэшируется под версией модели (см. landing/caching.py),
+так что повторный опрос неизмененного каталога обычно обходится без БД.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from config.metrics import cache_event
+from landing.caching import cacheable_read, get_cache, model_changed_at, response_cache_key
+
+# Значение в кэше для "объекта нет" (None в кэше означает промах)
+MISSING = "missing"
+
+
+def _aggregates():
+    return {
+        "count": Count("id"),
+        "max_id": Max("id"),
+        "last_modified": Max("updated_at"),
+    }
+
+
+def compute_validators(queryset):
+    """
+    Возвращает (количество, максимальный id, максимальный updated_at) для queryset.
+
+    Количество нужно, чтобы удаление книги тоже меняло ETag, максимальный
+    id - чтобы его меняла замена одной книги другой.
+    """
+    result = queryset.aggregate(**_aggregates())
+    return result["count"], result["max_id"], result["last_modified"]
+
+
+async def acompute_validators(queryset):
+    """Асинхронный вариант compute_validators (для async views)"""
+    result = await queryset.aaggregate(**_aggregates())
+    return result["count"], result["max_id"], result["last_modified"]
+
+
+def make_etag(request, validators, extra=""):
+    """
+    Сильный ETag: путь с параметрами, формат ответа и состояние данных.
+
+    extra - то, от чего ответ зависит помимо самих книг (например, избранное пользователя).
+    """
+    count, max_id, last_modified = validators
+    renderer = getattr(request, "accepted_renderer", None)
+    source = "|".join([
+        request.get_full_path(),
+        renderer.format if renderer else "",
+        str(count),
+        str(max_id),
+        last_modified.isoformat() if last_modified else "",
+        extra,
+    ])
+    return f'"{hashlib.sha1(source.encode()).hexdigest()}"'
+
+
+def last_modified_timestamp(validators, model, detail, extra=None):
+    """
+    Значение Last-Modified (секунды) или None для пустого списка.
+
+    extra - время изменения того, от чего ответ зависит помимо самих книг.
+    """
+    last_modified = validators[2]
+    if last_modified is None:
+        return None
+    timestamp = last_modified.timestamp()
+    if not detail:
+        timestamp = max(timestamp, model_changed_at(model))
+    if extra is not None:
+        timestamp = max(timestamp, extra)
+    return int(timestamp)
+
+
+def validators_cache_key(model, action, request):
+    """Ключ кэша валидаторов действия (рядом с кэшем ответа, под той же версией)"""
+    return response_cache_key(model, f"{action}:etag-validators", request)
+
+
+def validator_headers(request, validators, model, detail, etag_extra="", modified_extra=None):
+    """
+    (ETag, Last-Modified в секундах или None) по валидаторам.
+
+    etag_extra - строка для ETag (см. make_etag), modified_extra - время ее
+    изменения. Если etag_extra задан без modified_extra, Last-Modified нет:
+    по одному If-Modified-Since нельзя отвечать 304.
+    """
+    etag = make_etag(request, validators, etag_extra)
+    if etag_extra and modified_extra is None:
+        return etag, None
+    return etag, last_modified_timestamp(validators, model, detail, modified_extra)
+
+
+def conditional_get(get_queryset, detail=False, etag_extra=None, modified_extra=None):
+    """
+    Декоратор для безопасных действий ViewSet.
+
+    get_queryset(view) - queryset, по которому считаются валидаторы.
+    detail=True - действие над одним объектом: если его нет (или pk
+    некорректный), валидаторы не выставляются, и действие само вернет 404.
+    etag_extra(view) - строка, которая добавляется в ETag (см. make_etag).
+    modified_extra(view) - время ее изменения (секунды) для Last-Modified;
+    если etag_extra задан без modified_extra, Last-Modified не выставляется.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_cache()
+            key = validators_cache_key(self.queryset.model, self.action, request)
+            validators = cache.get(key)
+            cache_event("validators", validators is not None)
+            if validators is None:
+                try:
+                    validators = compute_validators(get_queryset(self))
+                except (ValueError, TypeError, ValidationError):
+                    # Например, pk=abc: queryset не построить, а действие
+                    # само ответит 404 (как get_object)
+                    return view_method(self, request, *args, **kwargs)
+                if detail and validators[0] == 0:
+                    validators = MISSING
+                if cacheable_read(self.queryset.model):
+                    cache.set(key, validators, settings.CATALOG_CACHE_TIMEOUT)
+            if validators == MISSING:
+                return view_method(self, request, *args, **kwargs)
+
+            etag, timestamp = validator_headers(
+                request, validators, self.queryset.model, detail,
+                etag_extra(self) if etag_extra else "",
+                modified_extra(self) if modified_extra else None,
+            )
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,149 @@
+"""
+Избранные книги пользователя.
+
+Book.favorites_count - денормализованный счетчик, его поддерживают
+сигналы FavoriteBook (landing/signals.py) F-выражением в той же
+транзакции, так что он верен и при каскадном удалении пользователя.
+
+is_favorited и favorites_count в ответах каталога добавляются уже после
+кэша ответов (with_favorites): закэшированные данные одинаковы для всех
+пользователей, а поверх них для всей страницы нужны счетчики по id книг
+и избранное пользователя среди этих id. Они читаются одним запросом
+(EXISTS по избранному, для анонимного пользователя - только счетчики)
+и кэшируются под версией модели FavoriteBook, которая меняется при
+любом изменении избранного. Количество запросов не зависит от размера
+страницы, при попадании в кэш запросов нет.
+
+Версия модели FavoriteBook (landing/caching.py) и пользователь входят
+в ETag (см. favorites_etag), а время последнего изменения избранного -
+в Last-Modified (favorites_last_modified), поэтому после изменения
+избранного клиент не получит 304 со старыми отметками или счетчиками.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.cache import patch_vary_headers
+
+from config.metrics import cache_event
+from landing.caching import cacheable_read, get_cache, get_model_version, model_changed_at
+from landing.models import Book, FavoriteBook
+
+
+def add_favorite(user, book):
+    """Добавляет книгу в избранное. Возвращает True, если ее там не было"""
+    try:
+        with transaction.atomic():
+            FavoriteBook.objects.create(user=user, book=book)
+    except IntegrityError:
+        # Уже в избранном (в том числе параллельный запрос успел раньше)
+        return False
+    return True
+
+
+def remove_favorite(user, book):
+    """Убирает книгу из избранного. Возвращает True, если она там была"""
+    deleted, _ = FavoriteBook.objects.filter(user=user, book=book).delete()
+    return deleted > 0
+
+
+def toggle_favorite(user, book):
+    """Переключает отметку. Возвращает новое состояние (True - в избранном)"""
+    if remove_favorite(user, book):
+        return False
+    add_favorite(user, book)
+    return True
+
+
+def favorite_state(user, book):
+    """{"book_id", "is_favorited", "favorites_count"} - ответ действий избранного"""
+    return {
+        "book_id": book.pk,
+        "is_favorited": FavoriteBook.objects.filter(user=user, book=book).exists(),
+        "favorites_count": Book.objects.filter(pk=book.pk).values_list("favorites_count", flat=True).first() or 0,
+    }
+
+
+def _overlay_key(ids, user):
+    """Ключ кэша отметок для набора книг: общий для анонимных, свой у пользователя"""
+    digest = hashlib.md5(",".join(map(str, ids)).encode()).hexdigest()
+    owner = user.pk if user.is_authenticated else "anonymous"
+    return f"favorites:v{get_model_version(FavoriteBook)}:{owner}:{digest}"
+
+
+def _load_overlay(ids, user):
+    """{id книги: (favorites_count, is_favorited)} одним запросом"""
+    books = Book.objects.filter(id__in=ids)
+    if not user.is_authenticated:
+        return {pk: (count, False) for pk, count in books.values_list("id", "favorites_count")}
+    favorited = FavoriteBook.objects.filter(user=user, book=OuterRef("pk"))
+    rows = books.annotate(favorited=Exists(favorited)).values_list("id", "favorites_count", "favorited")
+    return {pk: (count, is_favorited) for pk, count, is_favorited in rows}
+
+
+def overlay_favorites(items, user):
+    """Проставляет is_favorited и favorites_count в сериализованные книги"""
+    ids = sorted(item["id"] for item in items)
+    if not ids:
+        return
+    cache = get_cache()
+    key = _overlay_key(ids, user)
+    overlay = cache.get(key)
+    cache_event("favorites", overlay is not None)
+    if overlay is None:
+        overlay = _load_overlay(ids, user)
+        if cacheable_read(Book, FavoriteBook):
+            cache.set(key, overlay, settings.CATALOG_CACHE_TIMEOUT)
+    for item in items:
+        item["favorites_count"], item["is_favorited"] = overlay.get(item["id"], (0, False))
+
+
+def _items(data):
+    """Книги в данных ответа: страница, список или одна книга"""
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        return data["results"]
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and "id" in data:
+        return [data]
+    return []
+
+
+def with_favorites(view_method):
+    """
+    Декоратор действий ViewSet: отметки избранного поверх ответа.
+
+    Ставится над cache_response, чтобы в кэш попадали данные без них.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            overlay_favorites(_items(response.data), request.user)
+            # Ответ зависит от пользователя
+            patch_vary_headers(response, ("Authorization", "Cookie"))
+        return response
+
+    return wrapper
+
+
+def user_favorites_etag(user):
+    """Часть ETag, зависящая от избранного: пользователь и версия избранного"""
+    return f"{user.pk if user.is_authenticated else ''}:{get_model_version(FavoriteBook)}"
+
+
+def favorites_etag(view):
+    """user_favorites_etag для conditional_get (etag_extra)"""
+    return user_favorites_etag(view.request.user)
+
+
+def favorites_last_modified(view):
+    """
+    Время последнего изменения избранного для conditional_get (modified_extra).
+
+    Любого пользователя, а не только текущего: favorites_count меняется
+    update() и не трогает Book.updated_at.
+    """
+    return model_changed_at(FavoriteBook)
@@ -0,0 +1,185 @@
+"""
+Фильтры и фасеты каталога книг.
+
+    GET /api/books/?author=Лев Толстой&author=Антон Чехов&year_min=1850&year_max=1900
+    GET /api/books/?pages_min=100&pages_max=300
+    GET /api/books/facets/?year_min=2000
+
+Фильтры работают во всех действиях, которые вызывают filter_queryset
+(список, выгрузка, поиск, ETag). Под них в модели Book есть индексы:
+(author, year_published), (year_published, pages) и (pages).
+
+Фасеты - количество книг по авторам (первые AUTHOR_LIMIT), по диапазонам
+лет и страниц. Каждый фасет считается с учетом всех фильтров, кроме
+своего собственного: выбрав год, клиент все равно видит, сколько книг
+в соседних диапазонах. Один фасет - один запрос (диапазоны - условные
+агрегаты COUNT(*) FILTER (WHERE ...) за один проход). Результат
+кэшируется на FACET_CACHE_TIMEOUT секунд под версией модели Book,
+так что изменение каталога сбрасывает его сразу.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from config.metrics import cache_event
+from landing.caching import cacheable_read, get_cache, get_model_version
+
+# Диапазоны фасетов (границы включительно, None - без ограничения).
+# Те же значения клиент передает в year_min/year_max и pages_min/pages_max.
+YEAR_BUCKETS = (
+    (None, 1899),
+    (1900, 1949),
+    (1950, 1999),
+    (2000, 2009),
+    (2010, 2019),
+    (2020, None),
+)
+PAGES_BUCKETS = (
+    (None, 99),
+    (100, 199),
+    (200, 299),
+    (300, 499),
+    (500, 999),
+    (1000, None),
+)
+
+# Параметр -> (поле, lookup)
+RANGE_PARAMS = {
+    "year_min": ("year_published", "gte"),
+    "year_max": ("year_published", "lte"),
+    "pages_min": ("pages", "gte"),
+    "pages_max": ("pages", "lte"),
+}
+
+
+def parse_filters(request):
+    """
+    Фильтры из параметров запроса: {"author": [...], "year_min": 1900, ...}.
+
+    Некорректные числа - ValidationError (400).
+    """
+    filters = {}
+    authors = [author.strip() for author in request.query_params.getlist("author") if author.strip()]
+    if authors:
+        filters["author"] = sorted(set(authors))
+    errors = {}
+    for param in RANGE_PARAMS:
+        value = request.query_params.get(param, "").strip()
+        if not value:
+            continue
+        try:
+            filters[param] = int(value)
+        except ValueError:
+            errors[param] = ["Ожидается целое число"]
+    if errors:
+        raise ValidationError(errors)
+    return filters
+
+
+def filter_condition(filters, exclude=None):
+    """Условие Q по фильтрам; exclude - поле, фильтры по которому не учитываются"""
+    condition = Q()
+    if "author" in filters and exclude != "author":
+        condition &= Q(author__in=filters["author"])
+    for param, (field, lookup) in RANGE_PARAMS.items():
+        if param in filters and field != exclude:
+            condition &= Q(**{f"{field}__{lookup}": filters[param]})
+    return condition
+
+
+def _bucket_condition(field, low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(**{f"{field}__gte": low})
+    if high is not None:
+        condition &= Q(**{f"{field}__lte": high})
+    return condition
+
+
+def _range_facet(queryset, field, buckets):
+    counts = queryset.aggregate(**{
+        f"bucket{index}": Count("id", filter=_bucket_condition(field, low, high))
+        for index, (low, high) in enumerate(buckets)
+    })
+    return [
+        {"min": low, "max": high, "count": counts[f"bucket{index}"]}
+        for index, (low, high) in enumerate(buckets)
+    ]
+
+
+def compute_facets(queryset, filters):
+    """Количество книг по фасетам (без кэша)"""
+    limit = settings.BOOK_FACETS["AUTHOR_LIMIT"]
+    authors = (
+        queryset.filter(filter_condition(filters, exclude="author"))
+        .order_by()
+        .values("author")
+        .annotate(count=Count("id"))
+        .order_by("-count", "author")[:limit]
+    )
+    return {
+        "count": queryset.filter(filter_condition(filters)).order_by().count(),
+        "facets": {
+            "author": [{"value": row["author"], "count": row["count"]} for row in authors],
+            "year_published": _range_facet(
+                queryset.filter(filter_condition(filters, exclude="year_published")).order_by(),
+                "year_published",
+                YEAR_BUCKETS,
+            ),
+            "pages": _range_facet(
+                queryset.filter(filter_condition(filters, exclude="pages")).order_by(),
+                "pages",
+                PAGES_BUCKETS,
+            ),
+        },
+    }
+
+
+def get_facets(queryset, filters):
+    """
+    Фасеты с кэшем. Ключ - версия модели и нормализованные фильтры
+    (порядок и посторонние параметры запроса на ключ не влияют).
+    """
+    cache = get_cache()
+    model = queryset.model
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    key = f"facets:{model._meta.label_lower}:v{get_model_version(model)}:{digest}"
+    facets = cache.get(key)
+    cache_event("facets", facets is not None)
+    if facets is None:
+        facets = compute_facets(queryset, filters)
+        if cacheable_read(model):
+            cache.set(key, facets, settings.BOOK_FACETS["CACHE_TIMEOUT"])
+    return facets
+
+
+class BookFilterBackend(BaseFilterBackend):
+    """Фильтры ?author=, ?year_min=, ?year_max=, ?pages_min=, ?pages_max="""
+
+    def filter_queryset(self, request, queryset, view):
+        filters = parse_filters(request)
+        if not filters:
+            return queryset
+        return queryset.filter(filter_condition(filters))
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [{
+            "name": "author",
+            "required": False,
+            "in": "query",
+            "description": "Автор (точное совпадение, можно указать несколько раз)",
+            "schema": {"type": "string"},
+        }]
+        for param, (field, lookup) in RANGE_PARAMS.items():
+            parameters.append({
+                "name": param,
+                "required": False,
+                "in": "query",
+                "description": f"{field} {'не меньше' if lookup == 'gte' else 'не больше'}",
+                "schema": {"type": "integer"},
+            })
+        return parameters
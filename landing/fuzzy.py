@@ -0,0 +1,200 @@
+"""
+Нечеткий поиск книг по названию и автору (опечатки в фамилиях).
+
+    GET /api/books/search/?q=дастаевский&mode=fuzzy
+
+Сходство - по триграммам, как в pg_trgm: текст разбивается на слова,
+каждое слово дополняется пробелами ("  толстой ") и режется на тройки
+символов. Похожие слова имеют много общих триграмм, даже если в них
+пропущена или заменена буква.
+
+- PostgreSQL: операторы pg_trgm word similarity (<%) по GIN индексам
+  gin_trgm_ops на title и author (миграция 0008). Из найденных по индексу
+  книг (с учетом фильтров) в ответ идут не больше MAX_CANDIDATES самых
+  похожих, поэтому размер ответа и его сортировка ограничены и на
+  миллионах строк.
+- Другие БД: TrigramIndex в памяти процесса (жизненный цикл - см.
+  landing/memory_index.py) по уникальным значениям title и author.
+  Кандидаты - значения с общими триграммами, списки вхождений
+  просматриваются от самых коротких и не больше MAX_POSTINGS записей.
+  Лучшие MAX_VALUES значений затем ищутся в БД по равенству (индекс).
+  Пока индекс строится, используется обычный полнотекстовый поиск.
+"""
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from landing.memory_index import ENTRY_OVERHEAD, BookValueIndex, get_index, normalize
+from landing.search import search_books
+
+# Оценка памяти на одну триграмму значения (ссылка в множестве вхождений)
+POSTING_SIZE = 40
+
+
+def _word_trigrams(word):
+    padded = f"  {word} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def trigrams(text):
+    """Множество триграмм текста (по словам, с дополнением пробелами как в pg_trgm)"""
+    result = set()
+    for word in normalize(text).split():
+        result |= _word_trigrams(word)
+    return result
+
+
+def word_similarity(query, value, query_trigrams=None):
+    """
+    Сходство запроса с наиболее похожим фрагментом значения (0..1).
+
+    Сравнивается с каждым окном из стольких же подряд идущих слов, сколько
+    в запросе: "толстои" с "Лев Толстой" сравнивается со словом "толстой",
+    и длинное название не снижает сходство.
+    """
+    if query_trigrams is None:
+        query_trigrams = trigrams(query)
+    if not query_trigrams:
+        return 0.0
+    size = len(normalize(query).split())
+    words = [_word_trigrams(word) for word in normalize(value).split()] or [set()]
+    best = 0.0
+    for start in range(max(len(words) - size + 1, 1)):
+        window = set().union(*words[start:start + size])
+        best = max(best, len(query_trigrams & window) / len(query_trigrams | window))
+    return best
+
+
+class TrigramIndex(BookValueIndex):
+    config_name = "BOOK_FUZZY"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.values = []  # номер -> (поле, значение) или None (удалено)
+        self.numbers = {}  # (поле, значение) -> номер
+        self.free = []
+        self.postings = {}  # триграмма -> множество номеров значений
+
+    def entry_size(self, field, value):
+        return ENTRY_OVERHEAD + sys.getsizeof(value) + len(trigrams(value)) * POSTING_SIZE
+
+    def insert(self, field, value):
+        if self.free:
+            number = self.free.pop()
+            self.values[number] = (field, value)
+        else:
+            number = len(self.values)
+            self.values.append((field, value))
+        self.numbers[(field, value)] = number
+        for trigram in trigrams(value):
+            self.postings.setdefault(trigram, set()).add(number)
+
+    def remove(self, field, value):
+        number = self.numbers.pop((field, value), None)
+        if number is None:
+            return
+        for trigram in trigrams(value):
+            posting = self.postings.get(trigram)
+            if posting is not None:
+                posting.discard(number)
+                if not posting:
+                    del self.postings[trigram]
+        self.values[number] = None
+        self.free.append(number)
+
+    def query(self, text):
+        """[(поле, значение, сходство)] по убыванию сходства"""
+        # Под блокировкой: сигналы изменения книг меняют множества вхождений
+        with self.lock:
+            return self._query(text)
+
+    def _query(self, text):
+        config = self.config
+        query_trigrams = trigrams(text)
+        postings = sorted(
+            (self.postings[trigram] for trigram in query_trigrams if trigram in self.postings),
+            key=len,
+        )
+        shared = Counter()
+        visited = 0
+        # Короткие списки (редкие триграммы) - самые избирательные;
+        # длинные списки частых триграмм дочитываются только в пределах лимита
+        for posting in postings:
+            if visited + len(posting) > config["MAX_POSTINGS"] and shared:
+                break
+            shared.update(posting)
+            visited += len(posting)
+
+        results = []
+        threshold = config["MIN_SIMILARITY"]
+        for number, common in shared.most_common(config["MAX_CANDIDATES"]):
+            # Сходство не больше доли общих триграмм запроса, а кандидаты
+            # идут по убыванию общих триграмм - дальше проверять незачем
+            if common < threshold * len(query_trigrams):
+                break
+            item = self.values[number]
+            if item is None:
+                continue
+            field, value = item
+            score = word_similarity(text, value, query_trigrams)
+            if score >= threshold:
+                results.append((field, value, score))
+        results.sort(key=lambda result: (-result[2], -self.counts.get(result[:2], 0)))
+        return results[:config["MAX_VALUES"]]
+
+
+def _postgres_fuzzy(queryset, query):
+    config = settings.BOOK_FUZZY
+    # "title %> запрос" - то же, что "запрос <% title": использует GIN индексы
+    # gin_trgm_ops, порог - pg_trgm.word_similarity_threshold
+    matches = Q(TrigramWordSimilar(F("title"), Value(query))) | Q(
+        TrigramWordSimilar(F("author"), Value(query))
+    )
+    rank = Greatest(TrigramWordSimilarity(query, "title"), TrigramWordSimilarity(query, "author"))
+    # Кандидаты - самые похожие среди подходящих под фильтры запроса,
+    # а не первые найденные по индексу
+    candidates = (
+        queryset.filter(matches)
+        .annotate(rank=rank)
+        .order_by("-rank", "-id")
+        .values("id")[:config["MAX_CANDIDATES"]]
+    )
+    return queryset.filter(id__in=candidates).annotate(rank=rank).order_by("-rank", "-id")
+
+
+def _memory_fuzzy(queryset, query):
+    index = get_index(TrigramIndex)
+    if index is None:
+        return search_books(queryset, query)
+    matches = index.query(query)
+    if not matches:
+        return queryset.none()
+    condition = Q()
+    title_rank, author_rank = [], []
+    for field, value, score in matches:
+        condition |= Q(**{field: value})
+        (title_rank if field == "title" else author_rank).append(
+            When(**{field: value}, then=Value(score))
+        )
+    rank = Greatest(
+        Case(*title_rank, default=Value(0.0), output_field=FloatField()),
+        Case(*author_rank, default=Value(0.0), output_field=FloatField()),
+    )
+    return queryset.filter(condition).annotate(rank=rank).order_by("-rank", "-id")
+
+
+def fuzzy_search_books(queryset, query):
+    """
+    Нечеткий поиск: queryset с аннотацией rank (0..1), по убыванию сходства.
+    """
+    if not normalize(query):
+        return queryset.none()
+    if connection.vendor == "postgresql":
+        return _postgres_fuzzy(queryset, query)
+    return _memory_fuzzy(queryset, query)
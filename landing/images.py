@@ -0,0 +1,201 @@
+"""
+Производные изображения обложек книг (миниатюры и WebP).
+
+Для каждой обложки создаются уменьшенные копии из BOOK_COVER_SIZES
+в форматах из BOOK_COVER_FORMATS. Имена производных вычисляются из имени
+оригинала, поэтому сериализатору не нужна БД, чтобы построить их URL:
+
+    books/covers/dune.jpg -> derived/books/covers/dune/thumb.webp
+
+Генерация идет в пуле потоков (Pillow отпускает GIL при ресайзе и
+кодировании), после коммита сохранения книги. Если производной нет
+(старая обложка, сбой, новый размер в настройках), сериализатор
+ставит ее в очередь и пока отдает URL оригинала.
+
+Готовность производных хранится в кэше (ключ из имени оригинала и
+набора размеров и форматов), а не проверяется в хранилище: сериализация
+страницы - один get_many, без обращения к файлам. Хранилище проверяет
+только поток генерации. После готовности производных кэш ответов по
+книгам сбрасывается один раз на все обложки, готовые за
+BOOK_COVER_BUMP_DELAY секунд.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from landing.caching import bump_model_version, get_cache
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "derived"
+
+# Расширение файла и параметры сохранения Pillow для каждого формата
+FORMAT_OPTIONS = {
+    "jpeg": ("jpg", {"format": "JPEG", "optimize": True, "progressive": True}),
+    "webp": ("webp", {"format": "WEBP", "method": 4}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+# Оригиналы, для которых генерация упала (битый или удаленный файл):
+# не пытаемся повторять на каждый запрос, до перезапуска процесса
+_failed = set()
+_bump_timer = None
+
+
+def get_formats():
+    """Форматы из настроек, которые поддерживает установленный Pillow"""
+    return [
+        fmt for fmt in settings.BOOK_COVER_FORMATS
+        if fmt != "webp" or features.check("webp")
+    ]
+
+
+def derivative_name(original, size, fmt):
+    """Имя файла производной для оригинала original"""
+    stem = posixpath.splitext(original)[0]
+    extension = FORMAT_OPTIONS[fmt][0]
+    return f"{DERIVED_DIR}/{stem}/{size}.{extension}"
+
+
+def derivative_names(original):
+    """Все производные оригинала: {(размер, формат): имя файла}"""
+    return {
+        (size, fmt): derivative_name(original, size, fmt)
+        for size in settings.BOOK_COVER_SIZES
+        for fmt in get_formats()
+    }
+
+
+def generate_derivatives(original):
+    """Создает (или пересоздает) все производные для оригинала"""
+    with default_storage.open(original, "rb") as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    for (size, fmt), name in derivative_names(original).items():
+        copy = image.copy()
+        copy.thumbnail(settings.BOOK_COVER_SIZES[size], Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and copy.mode != "RGB":
+            copy = copy.convert("RGB")
+
+        buffer = io.BytesIO()
+        copy.save(buffer, quality=settings.BOOK_COVER_QUALITY, **FORMAT_OPTIONS[fmt][1])
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _ready_key(original):
+    config = repr((sorted(settings.BOOK_COVER_SIZES.items()), get_formats()))
+    signature = hashlib.md5(config.encode()).hexdigest()[:8]
+    return f"cover-derivatives:{signature}:{original}"
+
+
+def ready_originals(originals):
+    """Оригиналы из originals, все производные которых уже созданы (по кэшу)"""
+    keys = {_ready_key(original): original for original in originals}
+    found = get_cache().get_many(list(keys))
+    return {keys[key] for key in found}
+
+
+def forget_derivatives(original):
+    """Вызывается при удалении производных (gc_media)"""
+    get_cache().delete(_ready_key(original))
+
+
+def _bump():
+    from landing.models import Book
+
+    global _bump_timer
+    with _executor_lock:
+        _bump_timer = None
+    # В закэшированных ответах вместо производных стоят URL оригинала
+    bump_model_version(Book)
+
+
+def _schedule_bump():
+    """Один сброс кэша ответов на все обложки, готовые за BOOK_COVER_BUMP_DELAY секунд"""
+    global _bump_timer
+    with _executor_lock:
+        if _bump_timer is not None:
+            return
+        _bump_timer = threading.Timer(settings.BOOK_COVER_BUMP_DELAY, _bump)
+        _bump_timer.daemon = True
+        _bump_timer.start()
+
+
+def _run(original):
+    try:
+        if missing_derivatives(original):
+            generate_derivatives(original)
+        # Имя оригинала не переиспользуется для другого содержимого,
+        # так что отметка о готовности не устаревает
+        get_cache().set(_ready_key(original), True, None)
+        _schedule_bump()
+    except Exception:
+        logger.exception("Не удалось создать производные обложки %s", original)
+        with _executor_lock:
+            _failed.add(original)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(original)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BOOK_COVER_WORKERS,
+            thread_name_prefix="cover-derivatives",
+        )
+    return _executor
+
+
+def schedule_derivatives(original):
+    """Ставит генерацию в пул, если она уже не выполняется для этого файла"""
+    with _executor_lock:
+        if original in _in_flight or original in _failed:
+            return
+        _in_flight.add(original)
+        _get_executor().submit(_run, original)
+
+
+def missing_derivatives(original):
+    """Производные, которых еще нет в хранилище"""
+    return [
+        key for key, name in derivative_names(original).items()
+        if not default_storage.exists(name)
+    ]
+
+
+def cover_variants(original, ready=None):
+    """
+    URL производных: {размер: {формат: url}}.
+
+    ready - готовы ли производные (если уже известно, см. ready_originals).
+    Неготовые производные ставятся в очередь на генерацию (поток сам
+    проверит, каких файлов нет), а вместо них пока отдается URL оригинала.
+    """
+    if ready is None:
+        ready = bool(ready_originals([original]))
+    if not ready:
+        schedule_derivatives(original)
+        original_url = default_storage.url(original)
+    variants = {}
+    for (size, fmt), name in derivative_names(original).items():
+        url = default_storage.url(name) if ready else original_url
+        variants.setdefault(size, {})[fmt] = url
+    return variants
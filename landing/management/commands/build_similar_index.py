@@ -0,0 +1,35 @@
+"""
+Сборка индекса похожих книг (landing/similar.py).
+
+    python manage.py build_similar_index          # по изменениям с прошлой сборки
+    python manage.py build_similar_index --full   # полностью, с пересчетом IDF
+
+Инкрементальную сборку удобно запускать по расписанию (например, раз
+в час), полную - реже (раз в сутки): она обновляет IDF и убирает
+накопленные неточности. Работающие процессы подхватывают новую сборку
+сами в течение BOOK_SIMILAR["CHECK_INTERVAL"] секунд.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from landing.similar import build_index
+
+
+class Command(BaseCommand):
+    help = "Строит индекс похожих книг (TF-IDF по хэшированным признакам, готовые списки соседей)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Полная сборка вместо инкрементальной",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stats = build_index(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс похожих книг: {stats['mode']}, книг {stats['books']}, "
+            f"пересчитано {stats['recomputed']} за {time.monotonic() - started:.1f} сек"
+        ))
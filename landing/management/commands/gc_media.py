@@ -0,0 +1,160 @@
+"""
+Сборка мусора в хранилище с адресацией по содержимому.
+
+    python manage.py gc_media
+    python manage.py gc_media --grace-hours 1 --dry-run
+
+1. Пересчитывает MediaBlob.ref_count по фактическим ссылкам в
+   Book.cover_image, News.image и CustomUser.avatar (сигналы не видят
+   queryset.update() и bulk-операции, поэтому счетчики могут разойтись).
+2. Удаляет файлы без ссылок, которые старше --grace-hours (свежий файл
+   может быть только что загружен, а запись о нем еще не сохранена),
+   вместе с их производными (миниатюрами обложек).
+3. Удаляет файлы в cas/, о которых нет записи в БД, и брошенные
+   временные файлы недописанных загрузок.
+"""
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from landing.images import derivative_names, forget_derivatives
+from landing.models import Book, MediaBlob, News
+from landing.storage import BLOB_PREFIX, media_storage
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает ссылки на медиафайлы и удаляет файлы, на которые никто не ссылается"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Не удалять файлы моложе этого возраста (по умолчанию 24 часа)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+
+    def count_references(self):
+        """Количество ссылок на каждый файл cas/ по всем трем полям (агрегатом в БД)"""
+        references = Counter()
+        for model, field in (
+            (Book, "cover_image"),
+            (News, "image"),
+            (get_user_model(), "avatar"),
+        ):
+            rows = (
+                model._default_manager
+                .filter(**{f"{field}__startswith": f"{BLOB_PREFIX}/"})
+                .values(field)
+                .annotate(references=Count("pk"))
+                .values_list(field, "references")
+            )
+            for name, count in rows.iterator():
+                references[name] += count
+        return references
+
+    def sync_ref_counts(self, references, dry_run):
+        """Приводит MediaBlob.ref_count к фактическому числу ссылок"""
+        changed = []
+        known = set()
+        now = timezone.now()
+        for blob in MediaBlob.objects.iterator():
+            known.add(blob.name)
+            actual = references.get(blob.name, 0)
+            if blob.ref_count != actual:
+                blob.ref_count = actual
+                # Файл, только что оставшийся без ссылок, удаляется не раньше
+                # чем через --grace-hours
+                blob.updated_at = now
+                changed.append(blob)
+
+        missing = [
+            MediaBlob(
+                name=name,
+                ref_count=count,
+                size=media_storage.size(name) if media_storage.exists(name) else 0,
+            )
+            for name, count in references.items()
+            if name not in known
+        ]
+        if not dry_run:
+            with transaction.atomic():
+                MediaBlob.objects.bulk_update(changed, ["ref_count", "updated_at"], batch_size=1000)
+                MediaBlob.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return len(changed), len(missing), known
+
+    def delete_file(self, name):
+        if media_storage.exists(name):
+            media_storage.delete(name)
+        forget_derivatives(name)
+        for derivative in derivative_names(name).values():
+            if default_storage.exists(derivative):
+                default_storage.delete(derivative)
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        grace = timedelta(hours=options["grace_hours"])
+        cutoff = timezone.now() - grace
+
+        references = self.count_references()
+        changed, created, known = self.sync_ref_counts(references, dry_run)
+        self.stdout.write(f"Исправлено счетчиков: {changed}, добавлено записей: {created}")
+
+        # Файлы без ссылок
+        orphans = MediaBlob.objects.filter(ref_count=0, updated_at__lt=cutoff)
+        if dry_run:
+            orphans = [
+                blob for blob in MediaBlob.objects.filter(updated_at__lt=cutoff)
+                if references.get(blob.name, 0) == 0
+            ]
+        freed = removed = 0
+        for blob in orphans:
+            if not dry_run:
+                # Условие проверяется еще раз при удалении: пока шла сборка,
+                # на файл могли сослаться или загрузить его заново
+                deleted, _ = MediaBlob.objects.filter(
+                    pk=blob.pk, ref_count=0, updated_at__lt=cutoff
+                ).delete()
+                if not deleted:
+                    continue
+                self.delete_file(blob.name)
+            freed += blob.size
+            removed += 1
+
+        # Файлы на диске без записи в БД и брошенные временные файлы
+        root = media_storage.path(BLOB_PREFIX)
+        temp_dir = media_storage.temp_dir()
+        cutoff_ts = time.time() - grace.total_seconds()
+        untracked = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, media_storage.location).replace(os.sep, "/")
+                if name in known or name in references or os.path.getmtime(path) >= cutoff_ts:
+                    continue
+                freed += os.path.getsize(path)
+                untracked += 1
+                if dry_run:
+                    continue
+                if directory == temp_dir:
+                    os.unlink(path)
+                else:
+                    self.delete_file(name)
+
+        prefix = "Будет удалено" if dry_run else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}: файлов без ссылок {removed}, файлов без записи {untracked}, "
+            f"освобождено {freed / 1024 / 1024:.1f} МБ"
+        ))
@@ -0,0 +1,72 @@
+"""
+Генерация тестовых данных для разработки и нагрузочных тестов.
+
+    python manage.py generate_data --books 1000000 --users 100000 --news 10000
+    python manage.py generate_data --books 5000000 --seed 42 --chunk-size 50000
+
+Размеры - итоговые: повторный запуск дозаполняет данные до указанных
+значений. В PostgreSQL строки загружаются через COPY FROM STDIN,
+в остальных БД - executemany (см. landing/fake_data.py).
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from landing.fake_data import DEFAULT_PASSWORD, EMAIL_DOMAIN, generate
+
+
+class Command(BaseCommand):
+    help = "Генерация книг, пользователей и новостей для разработки и нагрузочных тестов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=0, help="Сколько должно быть сгенерированных книг")
+        parser.add_argument("--users", type=int, default=0, help="Сколько должно быть сгенерированных пользователей")
+        parser.add_argument("--news", type=int, default=0, help="Сколько должно быть сгенерированных новостей")
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Зерно генератора: одинаковые параметры дают одинаковые данные",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Количество строк в одной пачке (по умолчанию 10000)",
+        )
+        parser.add_argument(
+            "--password",
+            default=DEFAULT_PASSWORD,
+            help=f"Пароль всех сгенерированных пользователей (по умолчанию {DEFAULT_PASSWORD})",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["books"], options["users"], options["news"]) < 0:
+            raise CommandError("Размеры не могут быть отрицательными")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size должен быть больше 0")
+
+        def progress(kind, added, elapsed):
+            if added:
+                self.stdout.write(
+                    f"{kind}: добавлено {added} строк за {elapsed:.1f} сек "
+                    f"({added / max(elapsed, 1e-9):.0f} строк/сек)"
+                )
+
+        try:
+            added = generate(
+                books=options["books"],
+                users=options["users"],
+                news=options["news"],
+                seed=options["seed"],
+                chunk_rows=options["chunk_size"],
+                password=options["password"],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: книг +{added['books']}, пользователей +{added['users']}, "
+            f"новостей +{added['news']}"
+        ))
+        if added["users"]:
+            self.stdout.write(f"Пользователи: user<N>@{EMAIL_DOMAIN}, пароль {options['password']}")
@@ -0,0 +1,274 @@
+"""
+Потоковый импорт каталога книг.
+
+    python manage.py import_books books.csv
+    python manage.py import_books books.jsonl --batch-size 5000 --workers 4
+    python manage.py import_books onix.xml --format onix --rejects bad.jsonl
+
+Файл читается построчно (ONIX - через iterparse), в памяти одновременно
+находится только несколько пачек. Пачки проверяются сериализатором
+BookUpsertSerializer (при --workers - в пуле процессов) и записываются
+одним bulk_create с обновлением по ISBN. Отклоненные строки вместе
+с ошибками пишутся в файл отказов (JSON Lines).
+"""
+import csv
+import itertools
+import json
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from landing.bulk import upsert_books
+from landing.serializers import BookUpsertSerializer
+
+FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".xml": "onix",
+    ".onix": "onix",
+}
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        # Первая строка - заголовок, поэтому данные начинаются со второй
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            yield line, row
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as file:
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                row = {"_raw": text.rstrip("\n"), "_error": f"Некорректный JSON: {e}"}
+            yield line, row
+
+
+def _local_name(tag):
+    """Имя тега без пространства имен ONIX"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find_all(element, name):
+    return (child for child in element.iter() if _local_name(child.tag) == name)
+
+
+def _find_text(element, name):
+    for child in _find_all(element, name):
+        if child.text and child.text.strip():
+            return child.text.strip()
+    return None
+
+
+def _onix_product(product):
+    """
+    Извлекает поля книги из элемента <Product> (ONIX 3.0, частично 2.1).
+
+    ProductIDType 15 - ISBN-13, ExtentType 00 - основной объем в страницах.
+    """
+    isbn = None
+    for identifier in _find_all(product, "ProductIdentifier"):
+        if _find_text(identifier, "ProductIDType") in ("15", "03"):
+            isbn = _find_text(identifier, "IDValue")
+            break
+
+    title = _find_text(product, "TitleText")
+    if title is None:
+        prefix = _find_text(product, "TitlePrefix")
+        rest = _find_text(product, "TitleWithoutPrefix")
+        title = " ".join(part for part in (prefix, rest) if part) or None
+
+    authors = []
+    for contributor in _find_all(product, "Contributor"):
+        name = _find_text(contributor, "PersonName")
+        if name is None:
+            name = " ".join(
+                part for part in (
+                    _find_text(contributor, "NamesBeforeKey"),
+                    _find_text(contributor, "KeyNames"),
+                ) if part
+            )
+        if name:
+            authors.append(name)
+
+    pages = _find_text(product, "NumberOfPages")
+    for extent in _find_all(product, "Extent"):
+        if _find_text(extent, "ExtentType") == "00":
+            pages = _find_text(extent, "ExtentValue")
+            break
+
+    date = _find_text(product, "Date") or _find_text(product, "PublicationDate")
+
+    return {
+        "isbn": isbn,
+        "title": title,
+        "author": ", ".join(authors),
+        "description": _find_text(product, "Text") or "",
+        "year_published": date[:4] if date else None,
+        "pages": pages,
+    }
+
+
+def read_onix(path):
+    """
+    Читает ONIX потоково: каждый разобранный <Product> сразу удаляется
+    из дерева, иначе iterparse накопит весь документ в памяти.
+    """
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    number = 0
+    for event, element in context:
+        if event == "end" and _local_name(element.tag) == "Product":
+            number += 1
+            yield number, _onix_product(element)
+            root.clear()
+
+
+READERS = {
+    "csv": read_csv,
+    "jsonl": read_jsonl,
+    "onix": read_onix,
+}
+
+
+def validate_batch(batch):
+    """
+    Проверяет пачку строк.
+
+    Возвращает (валидные данные, отказы). Выполняется и в основном процессе,
+    и в воркерах пула, поэтому возвращает только простые типы.
+    Запросов в БД нет: уникальность ISBN не проверяется (это upsert).
+    """
+    valid, rejected = [], []
+    for line, row in batch:
+        if "_error" in row:
+            rejected.append({"line": line, "row": row.get("_raw"), "errors": [row["_error"]]})
+            continue
+        serializer = BookUpsertSerializer(data=row)
+        if serializer.is_valid():
+            valid.append(dict(serializer.validated_data))
+        else:
+            errors = json.loads(json.dumps(serializer.errors))
+            rejected.append({"line": line, "row": row, "errors": errors})
+    return valid, rejected
+
+
+def _init_worker():
+    django.setup()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def validated_batches(batches, workers):
+    """
+    Проверка пачек последовательно или в пуле процессов.
+
+    В пул одновременно отправляется не больше workers * 2 пачек,
+    чтобы чтение файла не убегало вперед записи в БД.
+    Порядок пачек сохраняется.
+    """
+    if not workers:
+        yield from map(validate_batch, batches)
+        return
+
+    # Соединения с БД не должны наследоваться дочерними процессами
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(validate_batch, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Command(BaseCommand):
+    help = "Потоковый импорт книг из CSV, JSON Lines или ONIX с обновлением по ISBN"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу с книгами")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Формат файла (по умолчанию определяется по расширению)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одной пачке (по умолчанию 1000)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Количество процессов для разбора и проверки (0 - без пула)",
+        )
+        parser.add_argument(
+            "--rejects",
+            help="Файл для отклоненных строк (по умолчанию <path>.rejects.jsonl)",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+
+        file_format = options["format"] or FORMATS.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError("Не удалось определить формат файла, укажите --format")
+
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size должен быть больше 0")
+
+        rejects_path = Path(options["rejects"] or f"{path}.rejects.jsonl")
+        rejects_file = None
+
+        imported = rejected = 0
+        started = time.monotonic()
+        batches = chunked(READERS[file_format](path), batch_size)
+        try:
+            for valid, bad in validated_batches(batches, options["workers"]):
+                with transaction.atomic():
+                    imported += len(upsert_books(valid, batch_size=batch_size))
+
+                if bad:
+                    if rejects_file is None:
+                        rejects_file = open(rejects_path, "w", encoding="utf-8")
+                    for reject in bad:
+                        rejects_file.write(json.dumps(reject, ensure_ascii=False) + "\n")
+                    rejected += len(bad)
+
+                elapsed = max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"Обработано {imported + rejected} строк "
+                    f"({(imported + rejected) / elapsed:.0f} строк/сек)"
+                )
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано книг: {imported}, отклонено строк: {rejected} "
+            f"за {elapsed:.1f} сек ({(imported + rejected) / elapsed:.0f} строк/сек)"
+        ))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"Отклоненные строки записаны в {rejects_path}"))
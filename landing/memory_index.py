@@ -0,0 +1,245 @@
+"""
+Индексы по названиям и авторам книг в памяти процесса.
+
+Для запросов, которые должны отвечать за единицы миллисекунд на каждое
+нажатие клавиши (подсказки, нечеткий поиск): никакой запрос к БД так
+быстро не отвечает. Индекс хранит уникальные значения полей FIELDS
+(название, автор) с количеством книг у каждого значения.
+
+Жизненный цикл общий для всех индексов (BookValueIndex):
+
+- строится в фоновом потоке при старте процесса (warm_up из wsgi/asgi)
+  или при первом обращении; пока индекс строится, get_index возвращает
+  None, и вызывающий отвечает запросом к БД;
+- изменения книг в этом процессе применяются сразу (сигналы Book, после
+  коммита транзакции);
+- изменения из других процессов и массовые загрузки (bulk_create,
+  COPY, update()) видны по версии модели Book (landing/caching.py):
+  если версия отличается от той, с которой построен индекс, он
+  перестраивается в фоне не чаще раза в REBUILD_INTERVAL секунд,
+  а пока отвечает старый;
+- память ограничена MAX_MEMORY_MB (оценка по sys.getsizeof): при
+  построении значения добавляются от самых частых, и все, что не
+  поместилось, не индексируется (truncated=True).
+
+Индекс свой в каждом процессе и после fork строится заново.
+"""
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+
+from landing.caching import get_model_version
+from landing.models import Book
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("title", "author")
+
+# Размер служебных структур на одно значение: запись в словаре
+# счетчиков, кортеж ключа, слот в списке
+ENTRY_OVERHEAD = 200
+
+_SEPARATORS = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    """Ключ для сравнения: без регистра, ё = е, знаки препинания - пробелы"""
+    return " ".join(_SEPARATORS.sub(" ", text.casefold().replace("ё", "е")).split())
+
+
+class BookValueIndex:
+    """
+    Базовый класс индекса. Подкласс задает config_name (имя словаря в
+    settings) и структуру поиска: load (начальная загрузка), insert и
+    remove (одно значение), entry_size (оценка памяти на значение).
+    """
+    config_name = None
+
+    def __init__(self, config):
+        self.config = config
+        self.max_memory = config["MAX_MEMORY_MB"] * 1024 * 1024
+        self.counts = {}  # (поле, значение) -> количество книг
+        self.memory = 0
+        self.truncated = False
+        self.version = None
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def entry_size(self, field, value):
+        raise NotImplementedError
+
+    def load(self, entries):
+        """Начальная загрузка: entries - список (поле, значение)"""
+        for field, value in entries:
+            self.insert(field, value)
+
+    def insert(self, field, value):
+        raise NotImplementedError
+
+    def remove(self, field, value):
+        raise NotImplementedError
+
+    @staticmethod
+    def _value_counts(field):
+        """(поле, значение, количество книг) от самых частых значений"""
+        rows = (
+            Book.objects.order_by()
+            .values_list(field)
+            .annotate(count=Count("id"))
+            .order_by("-count")
+            .iterator(chunk_size=10000)
+        )
+        for value, count in rows:
+            yield field, value, count
+
+    @classmethod
+    def build(cls):
+        config = getattr(settings, cls.config_name)
+        index = cls(config)
+        # Версию запоминаем до чтения: изменения во время чтения вызовут
+        # еще одно перестроение, а не потеряются
+        index.version = get_model_version(Book)
+        sources = [cls._value_counts(field) for field in FIELDS]
+        entries = []
+        # Самые частые значения первыми: при нехватке памяти остаются они
+        for field, value, count in heapq.merge(*sources, key=lambda row: -row[2]):
+            if not value:
+                continue
+            size = index.entry_size(field, value)
+            if index.memory + size > index.max_memory:
+                index.truncated = True
+                break
+            index.memory += size
+            index.counts[(field, value)] = count
+            entries.append((field, value))
+        index.load(entries)
+        index.built_at = index.checked_at = time.monotonic()
+        return index
+
+    def change(self, field, value, delta):
+        """Изменяет количество книг со значением (новое значение добавляется, исчезнувшее удаляется)"""
+        if not value:
+            return
+        key = (field, value)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            if count + delta > 0:
+                if count == 0:
+                    size = self.entry_size(field, value)
+                    if self.memory + size > self.max_memory:
+                        self.truncated = True
+                        return
+                    self.memory += size
+                    self.insert(field, value)
+                self.counts[key] = count + delta
+            elif count:
+                del self.counts[key]
+                self.memory -= self.entry_size(field, value)
+                self.remove(field, value)
+
+    def stats(self):
+        return {
+            "values": len(self.counts),
+            "memory_bytes": self.memory,
+            "truncated": self.truncated,
+            "version": self.version,
+        }
+
+
+_indexes = {}  # класс -> построенный индекс
+_building = {}  # класс -> pid процесса, который его строит
+_lock = threading.Lock()
+
+
+def _build_in_background(cls):
+    def run():
+        started = time.monotonic()
+        try:
+            index = cls.build()
+        except Exception:
+            logger.exception("Не удалось построить индекс %s", cls.__name__)
+            return
+        finally:
+            # Соединения этого потока больше не нужны (с пулом - вернутся в пул)
+            connections.close_all()
+            with _lock:
+                _building.pop(cls, None)
+        with _lock:
+            _indexes[cls] = index
+        logger.info(
+            "Индекс %s построен за %.1f сек: %s",
+            cls.__name__, time.monotonic() - started, index.stats(),
+        )
+
+    with _lock:
+        # Поток построения родителя после fork не существует - смотрим на pid
+        if _building.get(cls) == os.getpid():
+            return
+        _building[cls] = os.getpid()
+    threading.Thread(target=run, name=f"build-{cls.__name__}", daemon=True).start()
+
+
+def get_index(cls):
+    """
+    Готовый индекс класса cls или None, если он еще строится.
+
+    Заодно раз в CHECK_INTERVAL секунд сверяет версию модели Book и при
+    необходимости запускает перестроение в фоне.
+    """
+    index = _indexes.get(cls)
+    if index is None or index.pid != os.getpid():
+        _build_in_background(cls)
+        return None
+    now = time.monotonic()
+    config = index.config
+    if now - index.checked_at >= config["CHECK_INTERVAL"]:
+        index.checked_at = now
+        if (
+            get_model_version(Book) != index.version
+            and now - index.built_at >= config["REBUILD_INTERVAL"]
+        ):
+            _build_in_background(cls)
+    return index
+
+
+def warm_up(*classes):
+    """Запускает построение индексов в фоне (при старте процесса)"""
+    for cls in classes:
+        _build_in_background(cls)
+
+
+def book_changed(old, new):
+    """
+    Применяет изменение книги к построенным индексам процесса.
+
+    old, new - словари {поле: значение} до и после (None - книги не было/нет).
+    Вызывается после коммита, когда версия модели уже увеличена.
+    """
+    indexes = [index for index in _indexes.values() if index.pid == os.getpid()]
+    if not indexes:
+        return
+    version = get_model_version(Book)
+    for index in indexes:
+        for field in FIELDS:
+            before = old.get(field) if old else None
+            after = new.get(field) if new else None
+            if before == after:
+                continue
+            index.change(field, before, -1)
+            index.change(field, after, 1)
+        # Свое изменение уже учтено - перестраивать из-за него не нужно
+        if index.version is not None:
+            index.version = version
+
+
+def has_indexes():
+    return any(index.pid == os.getpid() for index in _indexes.values())
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0002_book_news_alter_item_options_alter_item_created_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="news",
+            name="author",
+            field=models.ForeignKey(
+                help_text="Пользователь, создавший новость",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="news",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Автор",
+            ),
+        ),
+    ]
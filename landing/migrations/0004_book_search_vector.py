@@ -0,0 +1,60 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def install_search_backend(apps, schema_editor):
+    from landing.search import install_search_backend as install
+
+    install(schema_editor)
+
+
+def uninstall_search_backend(apps, schema_editor):
+    from landing.search import uninstall_search_backend as uninstall
+
+    uninstall(schema_editor)
+
+
+def create_gin_index(apps, schema_editor):
+    # GIN индекс есть только в PostgreSQL, на SQLite его роль играет FTS5
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS book_search_vector_gin "
+            "ON landing_book USING gin (search_vector)"
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS book_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0003_news_author"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="book",
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="book_search_vector_gin"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_gin_index, drop_gin_index),
+            ],
+        ),
+        migrations.RunPython(install_search_backend, uninstall_search_backend),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0004_book_search_vector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="book_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="news",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="news_created_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0006_mediablob_alter_book_cover_image_alter_news_image"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["author", "year_published"], name="book_author_year_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["year_published", "pages"], name="book_year_pages_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["pages"], name="book_pages_idx"),
+        ),
+    ]
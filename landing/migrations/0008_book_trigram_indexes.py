@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm есть только в PostgreSQL, на других БД нечеткий поиск
+    # идет по индексу в памяти (см. landing/fuzzy.py)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS book_title_trgm "
+            "ON landing_book USING gin (title gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS book_author_trgm "
+            "ON landing_book USING gin (author gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS book_title_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS book_author_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0007_book_filter_indexes"),
+    ]
+
+    # Только в БД: в состоянии моделей индексов нет (см. Book.Meta), иначе
+    # SQLite пытается создать gin_trgm_ops при каждом пересоздании таблицы
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
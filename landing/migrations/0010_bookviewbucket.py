@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0009_favoritebook"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookViewBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(verbose_name="Начало часа")),
+                (
+                    "views",
+                    models.PositiveIntegerField(default=0, verbose_name="Просмотры"),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="view_buckets",
+                        to="landing.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Просмотры книги за час",
+                "verbose_name_plural": "Просмотры книг по часам",
+                "indexes": [
+                    models.Index(
+                        fields=["hour", "book"], name="book_view_bucket_hour_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "hour"), name="book_view_bucket_unique"
+                    )
+                ],
+            },
+        ),
+    ]
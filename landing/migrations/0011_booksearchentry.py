@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("landing", "0010_bookviewbucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSearchEntry",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_entry",
+                        serialize=False,
+                        to="landing.book",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "landing_book_fts",
+                "managed": False,
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+
+from landing.storage import get_media_storage
 
 # Получаем модель пользователя (кастомную)
 User = get_user_model()
@@ -61,6 +65,7 @@ class Book(models.Model):
     )
     cover_image = models.ImageField(
         upload_to="books/covers/",
+        storage=get_media_storage,
         blank=True,
         null=True,
         verbose_name="Обложка",
@@ -74,14 +79,138 @@ class Book(models.Model):
         auto_now=True,
         verbose_name="Дата обновления"
     )
+    # Сколько пользователей добавили книгу в избранное. Поддерживается
+    # сигналами FavoriteBook (landing/signals.py), чтобы списки не считали
+    # COUNT по таблице избранного. db_default - для загрузки в обход ORM (COPY).
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        db_default=0,
+        editable=False,
+        verbose_name="В избранном у пользователей"
+    )
+    # Поисковый вектор (title, author, description) для полнотекстового поиска.
+    # Заполняется триггером в PostgreSQL (см. landing/search.py), вручную не меняется.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый вектор"
+    )
 
     def __str__(self):
         return f"{self.title} - {self.author}"
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # favorites_count меняется только F-выражением из сигналов избранного:
+        # UPDATE при обычном сохранении не перезаписывает его прочитанным ранее
+        # значением. Если строки уже нет, INSERT идет со всеми полями, как обычно
+        if update_fields is None:
+            values = [value for value in values if value[0].name != "favorites_count"]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
     class Meta:
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
         ordering = ["-created_at"]  # Сортировка по дате добавления (новые сначала)
+        indexes = [
+            GinIndex(fields=["search_vector"], name="book_search_vector_gin"),
+            # Для курсорной пагинации (см. landing/pagination.py)
+            models.Index(fields=["-created_at", "-id"], name="book_created_id_idx"),
+            # Для фильтров и фасетов (см. landing/filters.py): автор с
+            # диапазоном лет, диапазон лет со страницами, только страницы
+            models.Index(fields=["author", "year_published"], name="book_author_year_idx"),
+            models.Index(fields=["year_published", "pages"], name="book_year_pages_idx"),
+            models.Index(fields=["pages"], name="book_pages_idx"),
+            # Триграммные индексы нечеткого поиска (book_title_trgm,
+            # book_author_trgm) создаются миграцией 0008 только в PostgreSQL
+            # и в состоянии моделей не описаны: иначе SQLite пытается создать
+            # их при каждом пересоздании таблицы (см. landing/fuzzy.py)
+        ]
+
+
+class BookSearchEntry(models.Model):
+    """
+    Строка FTS5 таблицы SQLite (landing/search.py).
+
+    Таблицу создают и заполняют триггеры, модель нужна только для
+    соединения с ней в запросах поиска.
+    """
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="search_entry",
+    )
+
+    class Meta:
+        managed = False
+        db_table = "landing_book_fts"
+
+
+class FavoriteBook(models.Model):
+    """Книга в избранном у пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="favorite_books",
+        verbose_name="Пользователь"
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="favorites",
+        verbose_name="Книга"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата добавления"
+    )
+
+    def __str__(self):
+        return f"{self.user} - {self.book}"
+
+    class Meta:
+        verbose_name = "Избранная книга"
+        verbose_name_plural = "Избранные книги"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "book"], name="favorite_user_book_unique"),
+        ]
+        indexes = [
+            # Список избранного пользователя, новые сначала
+            models.Index(fields=["user", "-created_at"], name="favorite_user_created_idx"),
+        ]
+
+
+class BookViewBucket(models.Model):
+    """
+    Просмотры книги за час (для "популярного", см. landing/trending.py).
+
+    Строки пишутся пачками из буфера процесса, счетчик увеличивается
+    upsert-ом, поэтому на один час и книгу всегда одна строка.
+    """
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="view_buckets",
+        verbose_name="Книга"
+    )
+    hour = models.DateTimeField(verbose_name="Начало часа")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
+
+    def __str__(self):
+        return f"{self.book_id} {self.hour:%Y-%m-%d %H}:00 - {self.views}"
+
+    class Meta:
+        verbose_name = "Просмотры книги за час"
+        verbose_name_plural = "Просмотры книг по часам"
+        constraints = [
+            models.UniqueConstraint(fields=["book", "hour"], name="book_view_bucket_unique"),
+        ]
+        indexes = [
+            # Сумма просмотров за окно: диапазон часов, группировка по книге
+            models.Index(fields=["hour", "book"], name="book_view_bucket_hour_idx"),
+        ]
 
 
 class News(models.Model):
@@ -109,6 +238,7 @@ class News(models.Model):
     )
     image = models.ImageField(
         upload_to="news/images/",
+        storage=get_media_storage,
         blank=True,
         null=True,
         verbose_name="Изображение",
@@ -135,3 +265,45 @@ class News(models.Model):
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
         ordering = ["-created_at"]  # Сортировка по дате (новые сначала)
+        indexes = [
+            # Для курсорной пагинации (см. landing/pagination.py)
+            models.Index(fields=["-created_at", "-id"], name="news_created_id_idx"),
+        ]
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с адресацией по содержимому (см. landing/storage.py).
+
+    ref_count - сколько полей (Book.cover_image, News.image, CustomUser.avatar)
+    ссылаются на файл. Поддерживается сигналами, а команда gc_media
+    пересчитывает его по БД и удаляет файлы без ссылок.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="Имя файла"
+    )
+    size = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Размер (байт)"
+    )
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество ссылок"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+    class Meta:
+        verbose_name = "Медиафайл"
+        verbose_name_plural = "Медиафайлы"
@@ -0,0 +1,73 @@
+"""
+Пагинация для списков API.
+
+По умолчанию используется обычная постраничная пагинация (?page=N),
+как и раньше. Курсорный режим включается параметром ?pagination=cursor:
+вместо OFFSET и COUNT(*) следующая страница выбирается условием по
+полю сортировки (keyset), поэтому страница N стоит столько же, сколько
+первая. Ссылки next/previous сохраняют параметр pagination=cursor.
+"""
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация, которая включается только по запросу клиента.
+
+    ordering должен совпадать с составным индексом модели
+    (поле сортировки + id для однозначного порядка).
+    """
+    mode_query_param = "pagination"
+    mode_query_value = "cursor"
+    fallback_class = PageNumberPagination
+
+    def __init__(self):
+        self.fallback = None
+
+    def use_cursor(self, request):
+        """Курсорный режим: явный ?pagination=cursor или уже выданный курсор"""
+        params = request.query_params
+        return (
+            params.get(self.mode_query_param) == self.mode_query_value
+            or self.cursor_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.fallback = None
+            return super().paginate_queryset(queryset, request, view)
+        self.fallback = self.fallback_class()
+        page = self.fallback.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.fallback.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response_schema(schema)
+        return super().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            self.fallback_class().get_schema_operation_parameters(view)
+            + super().get_schema_operation_parameters(view)
+        )
+
+    def to_html(self):
+        if self.fallback is not None:
+            return self.fallback.to_html()
+        return super().to_html()
+
+
+class BookPagination(OptInCursorPagination):
+    """Книги: новые сначала, совпадает с индексом book_created_id_idx"""
+    ordering = ("-created_at", "-id")
+
+
+class NewsPagination(OptInCursorPagination):
+    """Новости: новые сначала, совпадает с индексом news_created_id_idx"""
+    ordering = ("-created_at", "-id")
@@ -0,0 +1,84 @@
+"""
+Рендереры для потоковой выгрузки каталога (GET /api/books/export/).
+
+Формат выбирается стандартным для DRF параметром ?format=ndjson|csv
+(или заголовком Accept). Помимо обычного render() для небольших ответов
+(например, ошибок) каждый рендерер умеет stream(): генератор байтовых
+чанков из потока строк queryset, который отдается в StreamingHttpResponse.
+"""
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+# Размер чанка, отдаваемого клиенту: строки копятся в буфере, чтобы не
+# отправлять по одному мелкому куску на каждую книгу
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write() просто возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def _chunks(lines):
+    """Склеивает строки в чанки примерно по STREAM_CHUNK_SIZE байт"""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= STREAM_CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _as_rows(data):
+    """Приводит обычные данные ответа (словарь или список словарей) к строкам"""
+    items = data if isinstance(data, list) else [data]
+    fields = list(items[0]) if items and isinstance(items[0], dict) else ["detail"]
+    rows = (
+        [item.get(field) for field in fields] if isinstance(item, dict) else [item]
+        for item in items
+    )
+    return fields, rows
+
+
+class NDJSONRenderer(BaseRenderer):
+    """JSON Lines: по одному JSON объекту на строку"""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.stream(*_as_rows(data)))
+
+    def stream(self, fields, rows):
+        return _chunks(
+            json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        )
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV с заголовком из названий полей"""
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.stream(*_as_rows(data)))
+
+    def stream(self, fields, rows):
+        writer = csv.writer(_Echo())
+        # Заголовок уходит клиенту сразу, еще до первой строки из БД
+        yield writer.writerow(fields).encode("utf-8")
+        yield from _chunks(writer.writerow(row) for row in rows)
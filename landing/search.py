@@ -0,0 +1,181 @@
+"""
+Полнотекстовый поиск по книгам.
+
+На PostgreSQL поиск идет по полю Book.search_vector (tsvector с русским
+стеммингом), которое поддерживает триггер в БД, и GIN индексу по нему.
+На SQLite используется виртуальная таблица FTS5, которую синхронизируют
+триггеры на landing_book; в запросах она соединяется с книгами через
+неуправляемую модель BookSearchEntry.
+
+Триггеры (а не сигналы Django) выбраны специально: они срабатывают и для
+bulk_create/update(), которые обходят save().
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import BooleanField, F
+from django.db.models.expressions import RawSQL
+
+# Конфигурация текстового поиска PostgreSQL (стемминг для русского языка)
+SEARCH_CONFIG = "russian"
+
+# Веса полей: название важнее автора, автор важнее описания
+SEARCH_WEIGHTS = (("title", "A"), ("author", "B"), ("description", "C"))
+
+BOOK_TABLE = "landing_book"
+FTS_TABLE = "landing_book_fts"
+
+# Веса bm25 для колонок FTS5 (title, author, description)
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+POSTGRES_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {vector};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};
+CREATE TRIGGER {table}_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, description ON {table}
+    FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+"""
+
+POSTGRES_DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};
+DROP FUNCTION IF EXISTS {table}_search_vector_update();
+"""
+
+SQLITE_FTS_SQL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        title, author, description,
+        content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO {fts}(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+)
+
+SQLITE_DROP_FTS_SQL = (
+    "DROP TRIGGER IF EXISTS {fts}_ai",
+    "DROP TRIGGER IF EXISTS {fts}_ad",
+    "DROP TRIGGER IF EXISTS {fts}_au",
+    "DROP TABLE IF EXISTS {fts}",
+)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _postgres_vector_sql(prefix):
+    """SQL выражение tsvector с весами для строки prefix (NEW или таблица)"""
+    parts = [
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({prefix}.{field}, '')), '{weight}')"
+        for field, weight in SEARCH_WEIGHTS
+    ]
+    return " || ".join(parts)
+
+
+def install_search_backend(schema_editor):
+    """
+    Создает триггеры, поддерживающие поисковый индекс, и заполняет его.
+
+    Вызывается из миграции и после каждого migrate (см. LandingConfig.ready):
+    на SQLite Django пересоздает таблицу при изменении схемы, и триггеры
+    при этом теряются. Все операции идемпотентны.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(POSTGRES_TRIGGER_SQL.format(
+            table=BOOK_TABLE, vector=_postgres_vector_sql("NEW")
+        ))
+        schema_editor.execute(
+            f"UPDATE {BOOK_TABLE} SET search_vector = {_postgres_vector_sql(BOOK_TABLE)} "
+            f"WHERE search_vector IS NULL"
+        )
+    elif vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [FTS_TABLE],
+            )
+            exists = cursor.fetchone() is not None
+        for statement in SQLITE_FTS_SQL:
+            schema_editor.execute(statement.format(fts=FTS_TABLE, table=BOOK_TABLE))
+        if not exists:
+            schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_backend(schema_editor):
+    """Удаляет триггеры и FTS таблицу (откат миграции)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(POSTGRES_DROP_TRIGGER_SQL.format(table=BOOK_TABLE))
+    elif vendor == "sqlite":
+        for statement in SQLITE_DROP_FTS_SQL:
+            schema_editor.execute(statement.format(fts=FTS_TABLE))
+
+
+def _fts_match_expression(query):
+    """
+    Превращает пользовательский запрос в выражение MATCH для FTS5.
+
+    Каждое слово берется в кавычки (чтобы спецсимволы FTS5 не ломали запрос)
+    и ищется как префикс: стемминга для русского в FTS5 нет, и поиск по
+    префиксу "толст*" находит и "Толстой", и "Толстого".
+    """
+    tokens = TOKEN_RE.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_books(queryset, query):
+    """
+    Ранжированный полнотекстовый поиск.
+
+    Возвращает queryset, отфильтрованный по запросу, с аннотацией rank
+    и отсортированный по убыванию релевантности.
+    """
+    if connection.vendor == "postgresql":
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        return (
+            queryset
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .order_by("-rank", "-id")
+        )
+
+    match = _fts_match_expression(query)
+    if not match:
+        return queryset.none()
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    # Соединение с FTS таблицей (BookSearchEntry), а не подзапрос на каждую
+    # строку: bm25 считается в рамках одного MATCH, коррелированный подзапрос
+    # повторял бы полнотекстовый поиск для каждой найденной книги
+    return (
+        queryset
+        .filter(search_entry__isnull=False)
+        .filter(RawSQL(f"{FTS_TABLE} MATCH %s", (match,), output_field=BooleanField()))
+        .annotate(rank=RawSQL(f"-bm25({FTS_TABLE}, {weights})", ()))
+        .order_by("-rank", "-id")
+    )
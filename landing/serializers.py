@@ -1,8 +1,31 @@
+from django.conf import settings
+from django.db import models, transaction
 from rest_framework import serializers
 
+from landing.bulk import upsert_books
+from landing.images import cover_variants, ready_originals
+from landing.models import Book
+
+
+class BookListSerializer(serializers.ListSerializer):
+    """Список книг: готовность производных обложек узнается для всей страницы сразу"""
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        books = list(data)
+        self.child.prefetch_variants(books)
+        return super().to_representation(books)
+
 
 class BookSerializer(serializers.ModelSerializer):
+    cover_image_url = serializers.SerializerMethodField()
+    cover_image_variants = serializers.SerializerMethodField()
+    cover_image_srcset = serializers.SerializerMethodField()
+    # Проставляется для всей страницы после кэша ответов (landing/favorites.py)
+    is_favorited = serializers.SerializerMethodField()
+
     class Meta:
+        model = Book
         fields = (
             "id",
             "title",
@@ -13,10 +36,42 @@ class BookSerializer(serializers.ModelSerializer):
             "pages",
             "cover_image",
             "cover_image_url",
+            "cover_image_variants",
+            "cover_image_srcset",
+            "favorites_count",
+            "is_favorited",
             "created_at",
             "updated_at",
         )
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "favorites_count", "created_at", "updated_at"]
+        list_serializer_class = BookListSerializer
+
+    def _absolute_url(self, url):
+        request = self.context.get("request")
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+    def _variants(self, obj):
+        """
+        Производные обложки (см. landing/images.py).
+
+        Запоминаются на время сериализации, чтобы cover_image_variants и
+        cover_image_srcset не спрашивали кэш дважды.
+        """
+        cache = self.__dict__.setdefault("_variants_cache", {})
+        name = obj.cover_image.name
+        if name not in cache:
+            cache[name] = cover_variants(name)
+        return cache[name]
+
+    def prefetch_variants(self, books):
+        """Производные обложек для списка книг - одним get_many к кэшу"""
+        cache = self.__dict__.setdefault("_variants_cache", {})
+        names = {book.cover_image.name for book in books if book.cover_image} - cache.keys()
+        ready = ready_originals(names)
+        for name in names:
+            cache[name] = cover_variants(name, ready=name in ready)
 
     def get_cover_image_url(self, obj):
         """
@@ -28,8 +83,136 @@ class BookSerializer(serializers.ModelSerializer):
         Если нет - возвращаем None.
         """
         if obj.cover_image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(obj.cover_image.url)
-            return obj.cover_image.url
+            return self._absolute_url(obj.cover_image.url)
         return None
+
+    def get_cover_image_variants(self, obj):
+        """
+        URL уменьшенных копий обложки: {"thumb": {"jpeg": url, "webp": url}, ...}
+
+        Пока копия не создана, вместо нее отдается URL оригинала.
+        """
+        if not obj.cover_image:
+            return None
+        return {
+            size: {fmt: self._absolute_url(url) for fmt, url in formats.items()}
+            for size, formats in self._variants(obj).items()
+        }
+
+    def get_cover_image_srcset(self, obj):
+        """Готовые значения атрибута srcset для <img>/<source>: {"webp": "url 100w, ..."}"""
+        if not obj.cover_image:
+            return None
+        srcset = {}
+        for size, formats in self._variants(obj).items():
+            width = settings.BOOK_COVER_SIZES[size][0]
+            for fmt, url in formats.items():
+                srcset.setdefault(fmt, []).append(f"{self._absolute_url(url)} {width}w")
+        return {fmt: ", ".join(items) for fmt, items in srcset.items()}
+
+    def get_is_favorited(self, obj):
+        """
+        Без запроса в БД: реальное значение для всей страницы проставляет
+        with_favorites (landing/favorites.py), здесь - значение по умолчанию.
+        """
+        return False
+
+
+class BookBulkListSerializer(serializers.ListSerializer):
+    """
+    Пакетное создание и обновление книг (POST /api/books/bulk/).
+
+    В отличие от обычного ListSerializer, ошибка в одной книге не отменяет
+    весь пакет: каждая книга проверяется отдельно, корректные записываются
+    одной транзакцией через upsert по ISBN, а по каждой книге формируется
+    результат (self.results) - created, updated или error.
+    """
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({
+                "non_field_errors": ["Ожидается список книг"]
+            })
+        if not data:
+            raise serializers.ValidationError({
+                "non_field_errors": ["Список книг пуст"]
+            })
+        if len(data) > settings.BOOK_BULK_MAX_ITEMS:
+            raise serializers.ValidationError({
+                "non_field_errors": [
+                    f"Не больше {settings.BOOK_BULK_MAX_ITEMS} книг за один запрос"
+                ]
+            })
+
+        # Индексы корректных книг в запросе (параллельно validated_data)
+        self.valid_indexes = []
+        self.item_errors = {}
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append(self.child.run_validation(item))
+                self.valid_indexes.append(index)
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+        return valid
+
+    def create(self, validated_data):
+        isbns = [row["isbn"] for row in validated_data]
+
+        with transaction.atomic():
+            existing = set(
+                Book.objects.filter(isbn__in=isbns).values_list("isbn", flat=True)
+            )
+            books = upsert_books(validated_data)
+
+        ids = {isbn: book.pk for isbn, book in books.items()}
+        if None in ids.values():
+            # Старые версии БД не возвращают id при upsert - добираем одним запросом
+            ids = dict(Book.objects.filter(isbn__in=isbns).values_list("isbn", "id"))
+
+        results = {}
+        for index, row in zip(self.valid_indexes, validated_data):
+            isbn = row["isbn"]
+            results[index] = {
+                "index": index,
+                "isbn": isbn,
+                "id": ids[isbn],
+                "status": "updated" if isbn in existing else "created",
+            }
+            # Повтор ISBN в том же пакете - уже обновление
+            existing.add(isbn)
+        for index, errors in self.item_errors.items():
+            results[index] = {"index": index, "status": "error", "errors": errors}
+        self.results = [results[index] for index in sorted(results)]
+
+        return list(books.values())
+
+
+class BookUpsertSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для массовой загрузки книг (импорт, пакетное создание).
+
+    Книга с уже существующим ISBN не ошибка, а обновление, поэтому
+    проверка уникальности ISBN отключена (и не делает запрос в БД на
+    каждую строку). Обложки при массовой загрузке не принимаются.
+    """
+    # Объявлено явно: без UniqueValidator и с запасом длины для дефисов
+    isbn = serializers.CharField(max_length=32)
+
+    class Meta:
+        model = Book
+        fields = (
+            "title",
+            "author",
+            "description",
+            "isbn",
+            "year_published",
+            "pages",
+        )
+        list_serializer_class = BookBulkListSerializer
+
+    def validate_isbn(self, value):
+        """ISBN может прийти с дефисами и пробелами - храним только 13 цифр"""
+        isbn = value.replace("-", "").replace(" ", "")
+        if len(isbn) != 13 or not isbn.isdigit():
+            raise serializers.ValidationError("ISBN должен состоять из 13 цифр")
+        return isbn
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from landing.caching import bump_model_version
+from landing.images import ready_originals, schedule_derivatives
+from landing.memory_index import FIELDS, book_changed, has_indexes
+from landing.models import Book, FavoriteBook, MediaBlob, News
+from landing.storage import media_storage
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book_cache(sender, using, **kwargs):
+    """Сбрасываем кэш ответов по книгам после коммита изменения"""
+    transaction.on_commit(lambda: bump_model_version(sender), using=using)
+
+
+@receiver(pre_save, sender=Book)
+def remember_indexed_values(sender, instance, **kwargs):
+    """Запоминаем прежние название и автора для индексов в памяти (landing/memory_index.py)"""
+    instance._indexed_values = None
+    if instance._state.adding or not has_indexes():
+        return
+    instance._indexed_values = (
+        sender._default_manager.filter(pk=instance.pk).values(*FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Book)
+def update_memory_indexes(sender, instance, using, **kwargs):
+    if not has_indexes():
+        return
+    old = getattr(instance, "_indexed_values", None)
+    new = {field: getattr(instance, field) for field in FIELDS}
+    transaction.on_commit(lambda: book_changed(old, new), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_memory_indexes(sender, instance, using, **kwargs):
+    if not has_indexes():
+        return
+    old = {field: getattr(instance, field) for field in FIELDS}
+    transaction.on_commit(lambda: book_changed(old, None), using=using)
+
+
+@receiver(post_save, sender=Book)
+def create_cover_derivatives(sender, instance, using, **kwargs):
+    """
+    Ставим в очередь генерацию миниатюр новой обложки.
+
+    При загрузке новой обложки у нее новое имя файла, и производных
+    для него еще нет, поэтому отдельно отслеживать изменение поля не нужно.
+    Здесь только проверка по кэшу: есть ли файлы в хранилище, смотрит
+    поток генерации.
+    """
+    if not instance.cover_image:
+        return
+    name = instance.cover_image.name
+    if name not in ready_originals([name]):
+        transaction.on_commit(lambda: schedule_derivatives(name), using=using)
+
+
+@receiver(post_save, sender=FavoriteBook)
+def increment_favorites_count(sender, instance, created, using, **kwargs):
+    """Book.favorites_count меняется в той же транзакции, F-выражением (без гонок)"""
+    if not created:
+        return
+    Book.objects.using(using).filter(pk=instance.book_id).update(
+        favorites_count=F("favorites_count") + 1
+    )
+    transaction.on_commit(lambda: bump_model_version(sender), using=using)
+
+
+@receiver(post_delete, sender=FavoriteBook)
+def decrement_favorites_count(sender, instance, using, **kwargs):
+    """Срабатывает и при каскадном удалении пользователя или книги"""
+    Book.objects.using(using).filter(pk=instance.book_id, favorites_count__gt=0).update(
+        favorites_count=F("favorites_count") - 1
+    )
+    transaction.on_commit(lambda: bump_model_version(sender), using=using)
+
+
+def _media_fields():
+    """Поля с изображениями в хранилище с адресацией по содержимому"""
+    return {
+        Book: "cover_image",
+        News: "image",
+        get_user_model(): "avatar",
+    }
+
+
+def _skip_media(sender, update_fields):
+    """save(update_fields=[...]) без поля с файлом (например, last_login) не трогаем"""
+    return update_fields is not None and _media_fields()[sender] not in update_fields
+
+
+def _change_ref_count(name, delta):
+    """
+    Изменить счетчик ссылок на файл (запись MediaBlob создается при первой ссылке).
+
+    update() не трогает auto_now, а от updated_at gc_media отсчитывает
+    время, сколько файл пролежал без ссылок, поэтому он ставится явно.
+    """
+    if not media_storage.is_blob(name):
+        return
+    if delta > 0:
+        blob, _ = MediaBlob.objects.get_or_create(
+            name=name,
+            defaults={"size": media_storage.size(name) if media_storage.exists(name) else 0},
+        )
+        MediaBlob.objects.filter(pk=blob.pk).update(
+            ref_count=F("ref_count") + delta, updated_at=timezone.now()
+        )
+    else:
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(
+            ref_count=F("ref_count") + delta, updated_at=timezone.now()
+        )
+
+
+def remember_media_name(sender, instance, update_fields=None, **kwargs):
+    """Запоминаем старое имя файла, чтобы после сохранения уменьшить его счетчик"""
+    instance._old_media_name = None
+    if _skip_media(sender, update_fields) or instance._state.adding:
+        return
+    instance._old_media_name = (
+        sender._default_manager.filter(pk=instance.pk)
+        .values_list(_media_fields()[sender], flat=True)
+        .first()
+    )
+
+
+def update_media_refs(sender, instance, update_fields=None, **kwargs):
+    if _skip_media(sender, update_fields):
+        return
+    old = getattr(instance, "_old_media_name", None) or ""
+    new = getattr(instance, _media_fields()[sender]).name or ""
+    if old != new:
+        _change_ref_count(new, 1)
+        _change_ref_count(old, -1)
+
+
+def release_media_ref(sender, instance, **kwargs):
+    _change_ref_count(getattr(instance, _media_fields()[sender]).name or "", -1)
+
+
+def connect_media_signals():
+    """Вызывается из LandingConfig.ready, когда загружены модели всех приложений"""
+    for model in _media_fields():
+        uid = model._meta.label_lower
+        pre_save.connect(remember_media_name, sender=model, dispatch_uid=f"media-pre-{uid}")
+        post_save.connect(update_media_refs, sender=model, dispatch_uid=f"media-post-{uid}")
+        post_delete.connect(release_media_ref, sender=model, dispatch_uid=f"media-delete-{uid}")
@@ -0,0 +1,453 @@
+"""
+Похожие книги (GET /api/books/{id}/similar/) по заранее построенному индексу.
+
+Индекс строит команда build_similar_index (по расписанию, например
+раз в час, и с --full раз в сутки). Запрос к API - поиск позиции книги
+в отсортированном массиве id и чтение готовой строки соседей, без
+сравнения с каталогом.
+
+Векторы книг - TF-IDF по хэшированным признакам (feature hashing):
+- признаки - слова и пары соседних слов названия, автор целиком и слова
+  автора, слова начала описания (MAX_DESCRIPTION_WORDS), с весами полей
+  FIELD_WEIGHTS; вес признака в книге - log(1 + сумма весов);
+- IDF считается по корзинам хэша признака (DF_BITS бит, без словаря);
+- признак прибавляется со знаком +-1 в одну из DIMENSIONS координат
+  (другие биты того же хэша). Это случайная проекция TF-IDF: скалярное
+  произведение сохраняется в среднем, а вектор книги занимает
+  DIMENSIONS чисел вместо словаря на сотни тысяч слов.
+Сходство - косинус (векторы нормированы), соседи - NEIGHBORS лучших.
+
+Файлы индекса (каталог BOOK_SIMILAR["INDEX_DIR"]):
+    CURRENT - имя каталога текущей сборки (меняется атомарно)
+    <сборка>/ids.npy - id книг по возрастанию (int64)
+    <сборка>/neighbors.npy - позиции соседей в ids (int32, книги x NEIGHBORS)
+    <сборка>/scores.npy - сходство соседей (float16)
+    <сборка>/vectors.npy, df.npy, meta.json - для инкрементальной сборки
+Процессы открывают массивы через mmap: страницы общие в кэше ОС.
+
+Инкрементальная сборка берет книги, измененные с прошлой сборки, новые
+и удаленные: пересчитывает соседей измененных, у остальных книг убирает
+из списков удаленные и измененные и добавляет измененные как кандидатов
+(потерявшие больше половины списка пересчитываются полностью). IDF при этом остается от последней полной
+сборки. Если изменений больше FULL_REBUILD_RATIO каталога - полная сборка.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from landing.memory_index import normalize
+from landing.models import Book
+
+logger = logging.getLogger(__name__)
+
+# Корзин документной частоты: младшие DF_BITS бит хэша признака;
+# биты с DF_BITS по 30 - координата (DIMENSIONS не больше 2048), бит 31 - знак
+DF_BITS = 20
+DF_SIZE = 1 << DF_BITS
+MAX_DIMENSIONS = 1 << (31 - DF_BITS)
+
+FIELD_WEIGHTS = {"title": 2.0, "author": 3.0, "author_word": 1.0, "description": 1.0}
+MAX_DESCRIPTION_WORDS = 300
+
+# Книг на одну пачку при чтении из БД и векторизации
+CHUNK_SIZE = 5000
+
+CURRENT = "CURRENT"
+FIELDS = ("title", "author", "description")
+
+
+def book_features(title, author, description):
+    """Признаки книги: {признак: вес}"""
+    features = Counter()
+    words = normalize(title or "").split()
+    for word in words:
+        features[f"w:{word}"] += FIELD_WEIGHTS["title"]
+    for first, second in zip(words, words[1:]):
+        features[f"b:{first} {second}"] += FIELD_WEIGHTS["title"]
+    author = normalize(author or "")
+    if author:
+        features[f"a:{author}"] += FIELD_WEIGHTS["author"]
+        for word in author.split():
+            features[f"w:{word}"] += FIELD_WEIGHTS["author_word"]
+    for word in normalize(description or "").split()[:MAX_DESCRIPTION_WORDS]:
+        features[f"w:{word}"] += FIELD_WEIGHTS["description"]
+    return features
+
+
+def _hashes(features):
+    # crc32 не зависит от PYTHONHASHSEED - одинаков во всех процессах и сборках
+    return np.fromiter((zlib.crc32(feature.encode()) for feature in features), dtype=np.uint32)
+
+
+def count_documents(rows):
+    """Документная частота корзин признаков: (df, количество книг)"""
+    df = np.zeros(DF_SIZE, dtype=np.int64)
+    documents = 0
+    buckets = []
+    for title, author, description in rows:
+        buckets.append(_hashes(book_features(title, author, description)) & (DF_SIZE - 1))
+        documents += 1
+        if len(buckets) >= CHUNK_SIZE:
+            df += np.bincount(np.concatenate(buckets), minlength=DF_SIZE)
+            buckets = []
+    if buckets:
+        df += np.bincount(np.concatenate(buckets), minlength=DF_SIZE)
+    return df, documents
+
+
+class Vectorizer:
+    def __init__(self, dimensions, df, documents):
+        if not 0 < dimensions <= MAX_DIMENSIONS:
+            raise ValueError(f"DIMENSIONS должно быть от 1 до {MAX_DIMENSIONS}")
+        self.dimensions = dimensions
+        self.idf = (np.log((1 + documents) / (1 + df)) + 1).astype(np.float32)
+
+    def transform(self, rows):
+        """Нормированные векторы книг: rows - список (title, author, description)"""
+        positions, hashes, weights = [], [], []
+        for position, (title, author, description) in enumerate(rows):
+            features = book_features(title, author, description)
+            hashes.append(_hashes(features))
+            weights.append(np.fromiter(features.values(), dtype=np.float32))
+            positions.append(np.full(len(features), position, dtype=np.int64))
+        vectors = np.zeros((len(rows), self.dimensions), dtype=np.float32)
+        if not hashes:
+            return vectors
+        hashes = np.concatenate(hashes)
+        values = np.log1p(np.concatenate(weights)) * self.idf[hashes & (DF_SIZE - 1)]
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        columns = ((hashes >> DF_BITS) & (MAX_DIMENSIONS - 1)) % self.dimensions
+        np.add.at(vectors, (np.concatenate(positions), columns), signs * values)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors
+
+
+def _block_rows(total, other, block_memory):
+    """Сколько строк матрицы сходства (строка - other чисел float32) считать за раз"""
+    return max(1, min(total, block_memory // max(other * 4, 1)))
+
+
+def _top(scores, k):
+    """Лучшие k по каждой строке: (позиции, значения) по убыванию"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return (
+            np.empty((scores.shape[0], 0), dtype=np.int64),
+            np.empty((scores.shape[0], 0), dtype=np.float32),
+        )
+    # Без -scores: копия матрицы блока стоит почти как сам выбор
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    values = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def nearest(vectors, rows, k, block_memory):
+    """Соседи строк rows среди всех векторов (без самой книги): (позиции, сходство)"""
+    neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    block = _block_rows(len(rows), len(vectors), block_memory)
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        similarity = vectors[chunk] @ vectors.T
+        similarity[np.arange(len(chunk)), chunk] = -np.inf
+        top, values = _top(similarity, k)
+        neighbors[start:start + len(chunk), :top.shape[1]] = top
+        scores[start:start + len(chunk), :top.shape[1]] = values
+    return neighbors, scores
+
+
+def merge_candidates(vectors, neighbors, scores, rows, candidates, block_memory):
+    """Добавляет книги candidates в списки соседей строк rows (на месте)"""
+    if not len(rows) or not len(candidates):
+        return
+    k = neighbors.shape[1]
+    block = _block_rows(len(rows), len(candidates) + k, block_memory)
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        similarity = vectors[chunk] @ vectors[candidates].T
+        similarity[chunk[:, None] == candidates[None, :]] = -np.inf
+        current = np.where(neighbors[chunk] >= 0, scores[chunk], -np.inf)
+        top, values = _top(np.hstack([current, similarity]), k)
+        positions = np.hstack([neighbors[chunk], np.broadcast_to(candidates, (len(chunk), len(candidates)))])
+        neighbors[chunk] = np.take_along_axis(positions, top, axis=1)
+        scores[chunk] = values
+
+
+def _read_books(ids=None):
+    """(id, (title, author, description)) пачками, по возрастанию id"""
+    queryset = Book.objects.order_by("id")
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.values_list("id", *FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _vectorize(vectorizer, ids=None):
+    """Векторы книг (все или ids): (ids, векторы)"""
+    book_ids, parts, rows = [], [], []
+    for book_id, *row in _read_books(ids):
+        book_ids.append(book_id)
+        rows.append(row)
+        if len(rows) >= CHUNK_SIZE:
+            parts.append(vectorizer.transform(rows))
+            rows = []
+    parts.append(vectorizer.transform(rows))
+    return np.array(book_ids, dtype=np.int64), np.vstack(parts)
+
+
+def _chunked(ids):
+    ids = [int(book_id) for book_id in ids]
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _index_dir():
+    return str(settings.BOOK_SIMILAR["INDEX_DIR"])
+
+
+def current_build():
+    """Каталог текущей сборки или None"""
+    try:
+        with open(os.path.join(_index_dir(), CURRENT)) as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(_index_dir(), name) if name else None
+
+
+def write_index(arrays, meta):
+    """Записывает сборку в новый каталог и атомарно делает ее текущей"""
+    directory = _index_dir()
+    # Доли секунды в имени: две сборки подряд не попадут в один каталог,
+    # а сортировка по имени остается хронологической
+    now = time.time_ns()
+    stamp = time.strftime("%Y%m%d%H%M%S", time.localtime(now // 10**9))
+    name = f"build-{stamp}-{now % 10**9:09d}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    for key, array in arrays.items():
+        np.save(os.path.join(path, f"{key}.npy"), array)
+    with open(os.path.join(path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+    temp = os.path.join(directory, f"{CURRENT}.tmp")
+    with open(temp, "w") as file:
+        file.write(name)
+    os.replace(temp, os.path.join(directory, CURRENT))
+    # Предыдущую сборку оставляем: процессы могут еще читать ее через mmap
+    builds = sorted(entry for entry in os.listdir(directory) if entry.startswith("build-"))
+    for old in builds[:-2]:
+        if old != name:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return path
+
+
+def _load_build(path, mmap_mode=None):
+    arrays = {
+        key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode=mmap_mode)
+        for key in ("ids", "neighbors", "scores", "vectors", "df")
+    }
+    with open(os.path.join(path, "meta.json")) as file:
+        meta = json.load(file)
+    return arrays, meta
+
+
+def build_index(full=False):
+    """
+    Строит индекс (полностью или по изменениям с прошлой сборки).
+
+    Возвращает статистику: {"mode": "full" | "incremental" | "unchanged", ...}.
+    """
+    config = settings.BOOK_SIMILAR
+    # Время запоминаем до чтения: изменения во время сборки попадут в следующую
+    started = timezone.now()
+    previous = current_build()
+    if previous and not full:
+        arrays, meta = _load_build(previous)
+        if (
+            meta["dimensions"] == config["DIMENSIONS"]
+            and meta["neighbors"] == config["NEIGHBORS"]
+        ):
+            stats = _build_incremental(arrays, meta, started, config)
+            if stats is not None:
+                return stats
+    return _build_full(started, config)
+
+
+def _meta(started, config, ids, documents):
+    return {
+        "built_at": started.isoformat(),
+        "books": len(ids),
+        "documents": documents,
+        "dimensions": config["DIMENSIONS"],
+        "neighbors": config["NEIGHBORS"],
+    }
+
+
+def _build_full(started, config):
+    block_memory = config["BLOCK_MEMORY_MB"] * 1024 * 1024
+    df, documents = count_documents(row for _, *row in _read_books())
+    vectorizer = Vectorizer(config["DIMENSIONS"], df, documents)
+    ids, vectors = _vectorize(vectorizer)
+    neighbors, scores = nearest(vectors, np.arange(len(ids)), config["NEIGHBORS"], block_memory)
+    write_index(
+        {
+            "ids": ids,
+            "neighbors": neighbors,
+            "scores": scores.astype(np.float16),
+            "vectors": vectors.astype(np.float16),
+            "df": df.astype(np.int32),
+        },
+        _meta(started, config, ids, documents),
+    )
+    return {"mode": "full", "books": len(ids), "recomputed": len(ids)}
+
+
+def _build_incremental(arrays, meta, started, config):
+    """None - изменений слишком много, нужна полная сборка"""
+    block_memory = config["BLOCK_MEMORY_MB"] * 1024 * 1024
+    old_ids = arrays["ids"]
+    ids = np.fromiter(Book.objects.order_by("id").values_list("id", flat=True), dtype=np.int64)
+    changed = np.fromiter(
+        Book.objects.filter(updated_at__gte=parse_datetime(meta["built_at"])).values_list("id", flat=True),
+        dtype=np.int64,
+    )
+    added = np.setdiff1d(ids, old_ids, assume_unique=True)
+    deleted = np.setdiff1d(old_ids, ids, assume_unique=True)
+    changed = np.union1d(np.intersect1d(changed, ids), added)
+    if not len(changed) and not len(deleted):
+        return {"mode": "unchanged", "books": len(ids), "recomputed": 0}
+    if len(changed) + len(deleted) > config["FULL_REBUILD_RATIO"] * max(len(ids), 1):
+        return None
+
+    # Позиции сохранившихся книг: старая -> новая (-1 - удалена)
+    kept = np.isin(old_ids, ids, assume_unique=True)
+    remap = np.full(len(old_ids), -1, dtype=np.int32)
+    remap[kept] = np.searchsorted(ids, old_ids[kept])
+    old_positions = np.flatnonzero(kept)
+    new_positions = remap[kept]
+
+    vectors = np.zeros((len(ids), config["DIMENSIONS"]), dtype=np.float32)
+    vectors[new_positions] = arrays["vectors"][old_positions]
+    vectorizer = Vectorizer(config["DIMENSIONS"], arrays["df"], meta["documents"])
+    changed_positions = np.searchsorted(ids, changed).astype(np.int64)
+    for chunk in _chunked(changed):
+        chunk_ids, chunk_vectors = _vectorize(vectorizer, chunk)
+        vectors[np.searchsorted(ids, chunk_ids)] = chunk_vectors
+
+    k = config["NEIGHBORS"]
+    neighbors = np.full((len(ids), k), -1, dtype=np.int32)
+    scores = np.zeros((len(ids), k), dtype=np.float32)
+    old_neighbors = arrays["neighbors"][old_positions]
+    neighbors[new_positions] = np.where(old_neighbors >= 0, remap[old_neighbors], -1)
+    scores[new_positions] = arrays["scores"][old_positions]
+
+    # Устаревшие записи в списках соседей: удаленные книги (позиция -1
+    # при непустом старом соседе) и измененные (их сходство другое).
+    # Такие записи выбрасываются, а измененные книги снова добавляются
+    # как кандидаты с новым сходством. Полностью пересчитываются
+    # измененные и новые книги и те, кто потерял больше половины списка.
+    is_changed = np.zeros(len(ids), dtype=bool)
+    is_changed[changed_positions] = True
+    stale = np.where(neighbors >= 0, is_changed[np.maximum(neighbors, 0)], False)
+    stale[new_positions] |= (old_neighbors >= 0) & (neighbors[new_positions] < 0)
+    neighbors[stale] = -1
+    scores[stale] = -np.inf
+    recompute_mask = is_changed | (stale.sum(axis=1) > k // 2)
+    recompute = np.flatnonzero(recompute_mask)
+    if len(recompute) > config["FULL_REBUILD_RATIO"] * max(len(ids), 1):
+        return None
+
+    merge_candidates(vectors, neighbors, scores, np.flatnonzero(~recompute_mask), changed_positions, block_memory)
+    neighbors[recompute], scores[recompute] = nearest(vectors, recompute, k, block_memory)
+
+    write_index(
+        {
+            "ids": ids,
+            "neighbors": neighbors,
+            "scores": scores.astype(np.float16),
+            "vectors": vectors.astype(np.float16),
+            "df": arrays["df"],
+        },
+        _meta(started, config, ids, meta["documents"]),
+    )
+    return {"mode": "incremental", "books": len(ids), "recomputed": len(recompute)}
+
+
+class SimilarIndex:
+    """Текущая сборка, открытая только для чтения (mmap)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.neighbors = np.load(os.path.join(path, "neighbors.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(path, "scores.npy"), mmap_mode="r")
+
+    def similar(self, book_id, limit):
+        """[(id книги, сходство)] или None, если книги нет в индексе"""
+        position = int(np.searchsorted(self.ids, book_id))
+        if position >= len(self.ids) or self.ids[position] != book_id:
+            return None
+        return [
+            (int(self.ids[neighbor]), float(score))
+            for neighbor, score in zip(self.neighbors[position, :limit], self.scores[position, :limit])
+            if neighbor >= 0 and score > 0
+        ]
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Текущий индекс процесса или None, если он еще не построен.
+
+    Раз в CHECK_INTERVAL секунд проверяет, не появилась ли новая сборка.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < settings.BOOK_SIMILAR["CHECK_INTERVAL"] and _checked_at:
+        return _index
+    with _lock:
+        _checked_at = now
+        path = current_build()
+        if path is None:
+            _index = None
+        elif _index is None or _index.path != path:
+            try:
+                _index = SimilarIndex(path)
+            except (OSError, ValueError):
+                logger.exception("Не удалось открыть индекс похожих книг %s", path)
+    return _index
+
+
+def similar_books(book, limit):
+    """
+    [(id книги, сходство)] для книги.
+
+    Книги, которой еще нет в индексе (добавлена после сборки), - книги
+    того же автора (сходство None).
+    """
+    index = get_index()
+    found = index.similar(book.pk, limit) if index is not None else None
+    if found is not None:
+        return found
+    same_author = (
+        Book.objects.filter(author=book.author)
+        .exclude(pk=book.pk)
+        .order_by("-created_at", "-id")
+        .values_list("id", flat=True)[:limit]
+    )
+    return [(book_id, None) for book_id in same_author]
@@ -0,0 +1,98 @@
+"""
+Хранилище файлов с адресацией по содержимому (дедупликация).
+
+Используется для обложек книг, изображений новостей и аватаров.
+При загрузке файл потоково хэшируется (SHA-256) во временный файл,
+а затем сохраняется под именем, полученным из хэша:
+
+    cas/3f/a2/3fa2...e1.jpg
+
+Одинаковые файлы (например, повторно загруженная обложка) хранятся
+один раз. Сколько полей ссылается на файл, учитывает модель MediaBlob
+(сигналы в landing/signals.py), а удаляет файлы, на которые никто
+не ссылается, команда manage.py gc_media.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.utils import timezone
+
+BLOB_PREFIX = "cas"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage, где имя файла - хэш содержимого.
+
+    Файлы, загруженные до перехода на это хранилище, остаются под
+    старыми именами и продолжают открываться как обычно.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменяется хэшем в _save, а одинаковое содержимое
+        # должно попадать в один и тот же файл, а не получать суффикс
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+    @staticmethod
+    def is_blob(name):
+        return bool(name) and name.startswith(f"{BLOB_PREFIX}/")
+
+    def blob_name(self, digest, original_name):
+        extension = posixpath.splitext(original_name)[1].lower()
+        return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def temp_dir(self):
+        return self.path(f"{BLOB_PREFIX}/tmp")
+
+    @staticmethod
+    def touch_record(name):
+        from landing.models import MediaBlob
+
+        MediaBlob.objects.filter(name=name).update(updated_at=timezone.now())
+
+    def _save(self, name, content):
+        temp_dir = self.temp_dir()
+        os.makedirs(temp_dir, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            for chunk in content.chunks():
+                hasher.update(chunk)
+                temp.write(chunk)
+
+        blob = self.blob_name(hasher.hexdigest(), name)
+        full_path = self.path(blob)
+        if os.path.exists(full_path):
+            # Такой файл уже есть - новая копия не нужна. Файл мог лежать
+            # без ссылок и ждать gc_media: обновляем время изменения и файла,
+            # и записи, чтобы он не был удален до сохранения новой ссылки
+            os.unlink(temp.name)
+            os.utime(full_path)
+            self.touch_record(blob)
+            return blob
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # os.replace атомарен: параллельная загрузка того же файла
+        # просто перезапишет его тем же содержимым
+        os.replace(temp.name, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return blob
+
+
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    """
+    Хранилище для полей с изображениями.
+
+    Передается в поля как callable: в миграции попадает ссылка на функцию,
+    а не параметры конкретного хранилища.
+    """
+    return media_storage
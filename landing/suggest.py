@@ -0,0 +1,122 @@
+"""
+Подсказки для строки поиска (GET /api/books/suggest/?q=).
+
+Индекс - отсортированный список ключей в памяти процесса (см.
+landing/memory_index.py): для каждого названия и автора по ключу на
+каждое слово, с которого может начинаться ввод ("золотой сад" находится
+и по "зол", и по "сад"). Ключи нормализованы (регистр, ё = е), поиск -
+bisect по префиксу и просмотр не больше MAX_SCAN соседних ключей, так
+что время ответа не зависит от размера каталога.
+
+Найденные значения ранжируются: сначала совпадение с начала значения,
+затем по количеству книг, затем по алфавиту.
+"""
+import bisect
+import sys
+
+from django.conf import settings
+from django.db.models import Count
+
+from landing.memory_index import ENTRY_OVERHEAD, BookValueIndex, get_index, normalize
+from landing.models import Book
+
+# Разделитель частей ключа: меньше любого печатного символа, поэтому
+# "сад" + SEPARATOR сортируется раньше "сада"
+SEPARATOR = "\x1f"
+
+
+def _word_keys(value):
+    """Ключи значения: нормализованный текст, начиная с каждого слова"""
+    normalized = normalize(value)
+    keys = [normalized]
+    position = normalized.find(" ")
+    while position != -1:
+        keys.append(normalized[position + 1:])
+        position = normalized.find(" ", position + 1)
+    return keys
+
+
+class PrefixIndex(BookValueIndex):
+    config_name = "BOOK_SUGGEST"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.keys = []
+
+    @staticmethod
+    def _entries(field, value):
+        # После ключа - признак "с начала значения" (0 - да, 1 - с другого слова)
+        return [
+            f"{key}{SEPARATOR}{int(position > 0)}{field}{SEPARATOR}{value}"
+            for position, key in enumerate(_word_keys(value))
+        ]
+
+    def entry_size(self, field, value):
+        entries = self._entries(field, value)
+        return ENTRY_OVERHEAD + sys.getsizeof(value) + sum(sys.getsizeof(entry) + 8 for entry in entries)
+
+    def load(self, entries):
+        # Одна сортировка вместо вставки по одному
+        self.keys = sorted(key for field, value in entries for key in self._entries(field, value))
+
+    def insert(self, field, value):
+        for entry in self._entries(field, value):
+            bisect.insort(self.keys, entry)
+
+    def remove(self, field, value):
+        for entry in self._entries(field, value):
+            position = bisect.bisect_left(self.keys, entry)
+            if position < len(self.keys) and self.keys[position] == entry:
+                del self.keys[position]
+
+    def query(self, text, limit):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        keys = self.keys
+        position = bisect.bisect_left(keys, prefix)
+        found = {}
+        for entry in keys[position:position + self.config["MAX_SCAN"]]:
+            if not entry.startswith(prefix):
+                break
+            _, field, value = entry.split(SEPARATOR, 2)
+            from_start = field[0] == "0"
+            key = (field[1:], value)
+            found[key] = found.get(key, False) or from_start
+        counts = self.counts
+        ranked = sorted(
+            found.items(),
+            key=lambda item: (not item[1], -counts.get(item[0], 0), item[0][1]),
+        )
+        return [
+            {"text": value, "field": field, "books": counts.get((field, value), 0)}
+            for (field, value), _ in ranked[:limit]
+        ]
+
+
+def _query_database(text, limit):
+    """Пока индекс строится: префиксный поиск в БД (медленнее, но без ожидания)"""
+    results = []
+    for field in ("title", "author"):
+        rows = (
+            Book.objects.filter(**{f"{field}__istartswith": text})
+            .order_by()
+            .values_list(field)
+            .annotate(count=Count("id"))
+            .order_by("-count", field)[:limit]
+        )
+        results.extend({"text": value, "field": field, "books": count} for value, count in rows)
+    results.sort(key=lambda item: (-item["books"], item["text"]))
+    return results[:limit]
+
+
+def suggest(text, limit=None):
+    config = settings.BOOK_SUGGEST
+    limit = min(max(limit or config["LIMIT"], 1), config["MAX_LIMIT"])
+    text = text.strip()
+    if len(text) < config["MIN_LENGTH"]:
+        return []
+    index = get_index(PrefixIndex)
+    if index is None:
+        return _query_database(text, limit)
+    return index.query(text, limit)
@@ -1,3 +1,1568 @@
-from django.test import TestCase
+import csv
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import psycopg2
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from benchmarks.run import DEFAULT_THRESHOLDS, check, run_client, scenarios, summarize
+from benchmarks.seed import isbn as benchmark_isbn
+from benchmarks.seed import seed
+from config import metrics
+from config.middleware import DatabaseUnavailableMiddleware, QueryInstrumentationMiddleware
+from config.postgresql_pool.base import ConnectionPool, PoolTimeout
+from config.routers import ReplicaRoutingMiddleware, check_replica_cache, current_read_alias
+from landing.caching import (
+    bump_model_version, cacheable_read, get_cache, get_model_version, response_cache_key,
+)
+from landing import images
+from landing.async_views import serialize
+from landing.conditional import acompute_validators, compute_validators, last_modified_timestamp
+from landing import fake_data
+from landing.favorites import add_favorite
+from landing.fuzzy import TrigramIndex, word_similarity
+from landing.models import Book, BookViewBucket, MediaBlob, News
+from landing.renderers import NDJSONRenderer
+from landing.similar import build_index
+from landing.storage import media_storage
+from landing.suggest import PrefixIndex
+from landing.trending import ViewBuffer, current_hour
+
+User = get_user_model()
+
+_isbns = itertools.count(9780000000000)
+
+
+def make_book(**fields):
+    """Книга с уникальным ISBN и заполненными обязательными полями"""
+    defaults = {
+        "title": "Книга",
+        "author": "Автор",
+        "isbn": str(next(_isbns)),
+        "year_published": 2000,
+        "pages": 100,
+    }
+    return Book.objects.create(**{**defaults, **fields})
+
+
+class ApiTestCase(TestCase):
+    """Клиент API от имени пользователя; кэш ответов между тестами сбрасывается"""
+
+    def setUp(self):
+        # Версии моделей меняются после коммита, а TestCase не коммитит -
+        # без очистки тест мог бы получить ответ, закэшированный другим тестом
+        caches["default"].clear()
+        # Просмотры - в свой буфер без фонового потока записи
+        self.view_buffer = ViewBuffer(settings.BOOK_TRENDING)
+        self.enterContext(mock.patch("landing.trending.get_buffer", return_value=self.view_buffer))
+        self.user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="Secret-pass-123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class SearchRankingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.in_title = make_book(title="Война и мир", author="Лев Толстой")
+        self.in_description = make_book(
+            title="Севастопольские рассказы", author="Лев Толстой",
+            description="Очерки о Крымской войне и война глазами офицера",
+        )
+        self.unrelated = make_book(title="Мастер и Маргарита", author="Михаил Булгаков")
+
+    def search(self, query, **params):
+        response = self.client.get("/api/books/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_title_match_ranks_above_description_match(self):
+        self.assertEqual(self.search("война"), [self.in_title.id, self.in_description.id])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.search("война мир"), [self.in_title.id])
+
+    def test_author_match(self):
+        ids = self.search("булгаков")
+        self.assertEqual(ids, [self.unrelated.id])
+
+    def test_empty_query_is_rejected(self):
+        response = self.client.get("/api/books/search/", {"q": "  "})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination_is_rejected(self):
+        cursor = {"pagination": "cursor"}
+        for params in (cursor, {"mode": "fuzzy", **cursor}, {"cursor": "x"}):
+            response = self.client.get("/api/books/search/", {"q": "война", **params})
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_pages_keep_rank_order(self):
+        # Более новые книги с совпадением только в описании - на страницах после названия
+        later = [make_book(title=f"Очерк {index}", description="война") for index in range(10)]
+        first = self.search("война", page=1)
+        second = self.search("война", page=2)
+        self.assertEqual(first[0], self.in_title.id)
+        expected = [self.in_title.id, self.in_description.id] + [book.id for book in later]
+        self.assertEqual(sorted(first + second), sorted(expected))
+
+    def test_filters_narrow_the_ranked_results(self):
+        make_book(title="Война миров", author="Герберт Уэллс")
+        self.assertEqual(
+            self.search("война", author="Лев Толстой"), [self.in_title.id, self.in_description.id]
+        )
+
+    def test_index_follows_edits_and_deletes(self):
+        self.unrelated.title = "Белая гвардия"
+        self.unrelated.save()
+        self.in_description.delete()
+
+        self.assertEqual(self.search("гвардия"), [self.unrelated.id])
+        self.assertEqual(self.search("война"), [self.in_title.id])
+
+
+class FuzzySearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crime = make_book(
+            title="Преступление и наказание", author="Фёдор Достоевский", year_published=1866
+        )
+        self.brothers = make_book(
+            title="Братья Карамазовы", author="Фёдор Достоевский", year_published=1880
+        )
+        self.anna = make_book(title="Анна Каренина", author="Лев Толстой", year_published=1877)
+        # Индекс строится здесь же, а не в фоновом потоке, и получает
+        # изменения книг от сигналов, как построенный индекс процесса
+        self.index = TrigramIndex.build()
+        self.enterContext(mock.patch("landing.fuzzy.get_index", return_value=self.index))
+        self.enterContext(
+            mock.patch.dict("landing.memory_index._indexes", {TrigramIndex: self.index})
+        )
+
+    def search(self, query, **params):
+        response = self.client.get("/api/books/search/", {"q": query, "mode": "fuzzy", **params})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_misspelled_author_is_found(self):
+        self.assertEqual(
+            sorted(self.search("достаевский")), sorted([self.crime.id, self.brothers.id])
+        )
+
+    def test_closest_title_ranks_first(self):
+        self.assertEqual(self.search("карамазавы")[0], self.brothers.id)
+
+    def test_filters_apply_to_fuzzy_matches(self):
+        self.assertEqual(self.search("достаевский", year_max=1870), [self.crime.id])
+
+    def test_no_similar_values(self):
+        self.assertEqual(self.search("шекспир"), [])
+
+    def test_index_follows_book_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            added = make_book(title="Бесы", author="Фёдор Достоевский")
+            self.anna.delete()
+
+        self.assertIn(added.id, self.search("достаевский"))
+        self.assertEqual(self.search("каренена"), [])
+
+    def test_fulltext_is_used_while_the_index_builds(self):
+        with mock.patch("landing.fuzzy.get_index", return_value=None):
+            self.assertEqual(self.search("каренина"), [self.anna.id])
+
+    def test_unknown_mode_is_rejected(self):
+        response = self.client.get("/api/books/search/", {"q": "толстой", "mode": "exact"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TrigramSimilarityTests(SimpleTestCase):
+    def test_word_similarity_compares_with_the_best_window(self):
+        short = word_similarity("толстои", "Лев Толстой")
+        self.assertGreater(short, settings.BOOK_FUZZY["MIN_SIMILARITY"])
+        # Длинное значение не снижает сходство, если в нем есть похожее слово
+        self.assertEqual(word_similarity("толстои", "Граф Лев Николаевич Толстой"), short)
+        self.assertLess(
+            word_similarity("толстои", "Антон Чехов"), settings.BOOK_FUZZY["MIN_SIMILARITY"]
+        )
+
+    def test_trigram_index_ranks_values(self):
+        index = TrigramIndex(settings.BOOK_FUZZY)
+        for value in ("Лев Толстой", "Алексей Толстой", "Антон Чехов"):
+            index.counts[("author", value)] = 1
+            index.insert("author", value)
+        index.remove("author", "Алексей Толстой")
+
+        results = index.query("лев толстои")
+        self.assertEqual([value for _, value, _ in results], ["Лев Толстой"])
+
+
+class TrigramMigrationTests(TransactionTestCase):
+    """Триграммные индексы целиком в 0008: миграции после нее пересоздают таблицу книг на SQLite"""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("landing", target)])
+
+    def test_migrations_roll_back_and_forward(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes("landing")[0][1]
+        try:
+            self.migrate("0007_book_filter_indexes")
+            self.migrate(latest)
+        finally:
+            self.migrate(latest)
+
+    def test_model_state_matches_migrations(self):
+        call_command("makemigrations", "landing", check=True, dry_run=True, stdout=io.StringIO())
+
+
+class SuggestTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_book(title="Братья Карамазовы", author="Фёдор Достоевский")
+        make_book(title="Бедные люди", author="Фёдор Достоевский")
+        make_book(title="Карамзин. Письма", author="Николай Карамзин")
+
+    def setUp(self):
+        super().setUp()
+        self.index = PrefixIndex.build()
+        self.enterContext(mock.patch("landing.suggest.get_index", return_value=self.index))
+
+    def suggest(self, query, **params):
+        response = self.client.get("/api/books/suggest/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item["field"], item["text"], item["books"]) for item in response.data]
+
+    def test_index_keeps_fields_apart(self):
+        self.assertEqual(self.index.counts[("title", "Бедные люди")], 1)
+        self.assertEqual(self.index.counts[("author", "Фёдор Достоевский")], 2)
+
+    def test_match_from_the_start_ranks_first(self):
+        self.assertEqual(self.suggest("карам"), [
+            ("title", "Карамзин. Письма", 1),
+            # Дальше - по алфавиту
+            ("title", "Братья Карамазовы", 1),
+            ("author", "Николай Карамзин", 1),
+        ])
+
+    def test_case_and_yo_are_ignored(self):
+        self.assertEqual(self.suggest("ФЕДОР"), [("author", "Фёдор Достоевский", 2)])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.suggest("карам", limit=-1)), 1)
+        self.assertEqual(len(self.suggest("карам", limit=1000)), 3)
+        response = self.client.get("/api/books/suggest/", {"q": "карам", "limit": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_database_is_used_while_the_index_builds(self):
+        # SQLite в LIKE сравнивает без учета регистра только ASCII
+        with mock.patch("landing.suggest.get_index", return_value=None):
+            self.assertEqual(self.suggest("Бед", limit=-1), [("title", "Бедные люди", 1)])
+
+
+class FacetsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for author, year, pages in (
+            ("Лев Толстой", 1869, 1300),
+            ("Лев Толстой", 1877, 800),
+            ("Антон Чехов", 1895, 50),
+            ("Антон Чехов", 1901, 250),
+            ("Виктор Пелевин", 2003, 350),
+        ):
+            make_book(author=author, year_published=year, pages=pages)
+
+    def facets(self, query=""):
+        response = self.client.get(f"/api/books/facets/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_combines_filters(self):
+        response = self.client.get(
+            "/api/books/?author=Лев Толстой&author=Антон Чехов&pages_max=300&year_min=1890"
+        )
+        self.assertEqual(
+            sorted((book["author"], book["year_published"]) for book in response.data["results"]),
+            [("Антон Чехов", 1895), ("Антон Чехов", 1901)],
+        )
+
+    def test_facet_ignores_its_own_filter(self):
+        data = self.facets("?author=Антон Чехов")
+        self.assertEqual(data["count"], 2)
+        # Выбранный автор не скрывает остальных
+        self.assertEqual(
+            [(row["value"], row["count"]) for row in data["facets"]["author"]],
+            [("Антон Чехов", 2), ("Лев Толстой", 2), ("Виктор Пелевин", 1)],
+        )
+        # А другие фасеты считаются только по его книгам
+        years = {(row["min"], row["max"]): row["count"] for row in data["facets"]["year_published"]}
+        self.assertEqual((years[(None, 1899)], years[(1900, 1949)], years[(2000, 2009)]), (1, 1, 0))
+
+        data = self.facets("?year_min=1900")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(
+            [row["count"] for row in data["facets"]["year_published"]], [3, 1, 0, 1, 0, 0]
+        )
+        self.assertEqual(
+            {row["value"] for row in data["facets"]["author"]}, {"Антон Чехов", "Виктор Пелевин"}
+        )
+        pages = [row["count"] for row in data["facets"]["pages"]]
+        self.assertEqual(pages, [0, 0, 1, 1, 0, 0])
+
+    def test_invalid_numbers_are_rejected(self):
+        for path in ("/api/books/", "/api/books/facets/"):
+            response = self.client.get(f"{path}?year_min=abc&pages_max=1.5&year_max=2000")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(set(response.data), {"year_min", "pages_max"})
+        # Пустые значения и пустой автор - без фильтра, а не ошибка
+        self.assertEqual(self.facets("?year_min=&author= ")["count"], 5)
+
+    def test_cached_under_model_version(self):
+        self.facets("?author=Лев Толстой&author=Антон Чехов")
+        # Порядок параметров и посторонние параметры на ключ не влияют
+        with self.assertNumQueries(0):
+            data = self.facets("?author=Антон Чехов&author=Лев Толстой&page=2")
+        self.assertEqual(data["count"], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book(author="Антон Чехов", year_published=1904, pages=60)
+        self.assertEqual(self.facets("?author=Лев Толстой&author=Антон Чехов")["count"], 5)
+
+
+class ResponseCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(title="Обломов", author="Иван Гончаров")
+
+    def titles(self):
+        return [item["title"] for item in self.client.get("/api/books/").data["results"]]
+
+    def test_reads_are_cached_until_the_version_changes(self):
+        self.assertEqual(self.titles(), ["Обломов"])
+        # update() не шлет сигналов: версия та же, ответ из кэша
+        Book.objects.filter(pk=self.book.pk).update(title="Обрыв")
+        self.assertEqual(self.titles(), ["Обломов"])
+
+        bump_model_version(Book)
+        self.assertEqual(self.titles(), ["Обрыв"])
+
+    def test_version_changes_after_commit(self):
+        self.titles()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book.title = "Обрыв"
+            self.book.save()
+        # До коммита версия прежняя
+        self.assertEqual(self.titles(), ["Обломов"])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.titles(), ["Обрыв"])
+
+    @override_settings(ALLOWED_HOSTS=["*"])
+    def test_key_includes_scheme_host_and_query(self):
+        factory = RequestFactory()
+
+        def key(path, **extra):
+            return response_cache_key(Book, "list", factory.get(path, **extra))
+
+        self.assertEqual(key("/api/books/?page=2"), key("/api/books/?page=2"))
+        self.assertNotEqual(key("/api/books/?page=2"), key("/api/books/?page=3"))
+        self.assertNotEqual(key("/api/books/"), key("/api/books/", HTTP_HOST="mirror.example.com"))
+        self.assertNotEqual(key("/api/books/"), key("/api/books/", secure=True))
+
+    def test_evicted_version_counter_does_not_reuse_old_versions(self):
+        version = get_model_version(Book)
+        bump_model_version(Book)
+        get_cache().delete(f"cache-version:{Book._meta.label_lower}")
+        self.assertNotIn(get_model_version(Book), (version, version + 1))
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(title="Обломов", author="Иван Гончаров")
+
+    def test_detail_not_modified_with_matching_etag(self):
+        response = self.client.get(f"/api/books/{self.book.id}/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(f"/api/books/{self.book.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_etag_changes_with_the_book(self):
+        etag = self.client.get(f"/api/books/{self.book.id}/")["ETag"]
+        self.book.title = "Обрыв"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+
+        response = self.client.get(f"/api/books/{self.book.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_not_modified(self):
+        response = self.client.get("/api/books/")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/api/books/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_modified_since(self):
+        response = self.client.get(f"/api/books/{self.book.id}/")
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(
+            f"/api/books/{self.book.id}/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_is_modified_since_after_a_deletion(self):
+        other = make_book()
+        last_modified = self.client.get("/api/books/")["Last-Modified"]
+        later = time.time() + 60
+        with mock.patch("landing.caching.time.time", return_value=later), \
+                self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+
+        response = self.client.get("/api/books/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Last-Modified"], http_date(int(later)))
+
+    def test_list_etag_changes_when_a_book_is_deleted(self):
+        other = make_book()
+        etag = self.client.get("/api/books/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+
+        response = self.client.get("/api/books/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_collection_last_modified_moves_on_any_book_change(self):
+        other = make_book()
+        Book.objects.update(updated_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        validators = compute_validators(Book.objects.all())
+        edited_at = datetime(2021, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+        with mock.patch("landing.caching.time.time", return_value=edited_at):
+            bump_model_version(Book)
+        other.delete()
+
+        # Удаление не меняет MAX(updated_at) оставшихся книг
+        self.assertEqual(compute_validators(Book.objects.all())[2], validators[2])
+        self.assertEqual(last_modified_timestamp(validators, Book, detail=False), int(edited_at))
+        self.assertEqual(
+            last_modified_timestamp(validators, Book, detail=True), int(validators[2].timestamp())
+        )
+
+    def test_missing_book_is_404(self):
+        self.assertEqual(self.client.get("/api/books/999999/").status_code, 404)
+
+    def test_invalid_pk_is_404(self):
+        self.assertEqual(self.client.get("/api/books/abc/").status_code, 404)
+
+
+class AsyncViewsTests(ApiTestCase):
+    """/api/async/books/: доступ, кэш и избранное как у BookViewSet"""
+
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(title="Мертвые души", author="Николай Гоголь")
+        add_favorite(self.user, self.book)
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, path, data=None, **headers):
+        headers["Authorization"] = f"Token {self.token.key}"
+        return self.async_client.get(path, data, headers=headers)
+
+    async def test_anonymous_is_denied_like_the_viewset(self):
+        expected = (await sync_to_async(APIClient().get)("/api/books/")).status_code
+        self.assertIn(expected, (401, 403))
+        paths = (
+            "/api/async/books/", "/api/async/books/recent/", f"/api/async/books/{self.book.id}/",
+        )
+        for path in paths:
+            response = await self.async_client.get(path)
+            self.assertEqual(response.status_code, expected, path)
+
+    async def test_token_client_sees_own_favorites(self):
+        response = await self.get("/api/async/books/")
+        self.assertEqual(response.status_code, 200)
+        [item] = response.json()["results"]
+        self.assertTrue(item["is_favorited"])
+        self.assertIn("Authorization", response["Vary"])
+
+        response = await self.get(f"/api/async/books/{self.book.id}/")
+        self.assertTrue(response.json()["is_favorited"])
+
+    async def test_repeated_request_is_served_from_cache(self):
+        with mock.patch(
+            "landing.async_views.acompute_validators", wraps=acompute_validators
+        ) as validators, mock.patch(
+            "landing.async_views.serialize", wraps=serialize
+        ) as serialized:
+            first = await self.get("/api/async/books/")
+            second = await self.get("/api/async/books/")
+        self.assertEqual(validators.call_count, 1)
+        self.assertEqual(serialized.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    async def test_not_modified(self):
+        detail = f"/api/async/books/{self.book.id}/"
+        response = await self.get(detail)
+        self.assertEqual(response.status_code, 200)
+        by_etag = await self.get(detail, **{"If-None-Match": response["ETag"]})
+        self.assertEqual(by_etag.status_code, 304)
+
+        last_modified = (await self.get("/api/async/books/recent/"))["Last-Modified"]
+        by_date = await self.get("/api/async/books/recent/", **{"If-Modified-Since": last_modified})
+        self.assertEqual(by_date.status_code, 304)
+
+    async def test_change_invalidates_cache(self):
+        await self.get(f"/api/async/books/{self.book.id}/")
+
+        def rename():
+            self.book.title = "Шинель"
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.save()
+
+        await sync_to_async(rename)()
+        response = await self.get(f"/api/async/books/{self.book.id}/")
+        self.assertEqual(response.json()["title"], "Шинель")
+
+    async def test_missing_book_and_page(self):
+        self.assertEqual((await self.get("/api/async/books/999999/")).status_code, 404)
+        self.assertEqual((await self.get("/api/async/books/", {"page": 2})).status_code, 404)
+
+
+class BulkUpsertTests(ApiTestCase):
+    def payload(self, isbn, **fields):
+        return {"title": "Книга", "author": "Автор", "isbn": isbn,
+                "year_published": 2001, "pages": 200, **fields}
+
+    def post(self, items):
+        return self.client.post("/api/books/bulk/", items, format="json")
+
+    def test_all_valid_creates_and_updates_by_isbn(self):
+        existing = make_book(title="Старое название")
+        response = self.post([
+            self.payload("978-5-00000-000-1"),
+            self.payload(existing.isbn, title="Новое название"),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]], ["created", "updated"]
+        )
+        self.assertTrue(Book.objects.filter(isbn="9785000000001").exists())
+        existing.refresh_from_db()
+        self.assertEqual(existing.title, "Новое название")
+
+    def test_mixed_batch_is_multi_status(self):
+        response = self.post([self.payload("9785000000002"), self.payload("123")])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["errors"], 1)
+        error = response.data["results"][1]
+        self.assertEqual((error["index"], error["status"]), (1, "error"))
+        self.assertIn("isbn", error["errors"])
+        self.assertTrue(Book.objects.filter(isbn="9785000000002").exists())
+
+    def test_all_invalid_is_rejected(self):
+        response = self.post([self.payload("123"), self.payload("9785000000003", title="")])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result["index"] for result in response.data["results"]], [0, 1])
+        self.assertFalse(Book.objects.filter(isbn="9785000000003").exists())
+
+
+class ImportBooksTests(TestCase):
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def run_import(self, name, content, *args):
+        path = self.directory / name
+        path.write_text(content, encoding="utf-8")
+        call_command("import_books", str(path), "--batch-size", "2", *args, stdout=io.StringIO())
+        rejects = Path(f"{path}.rejects.jsonl")
+        if not rejects.exists():
+            return []
+        return [json.loads(line) for line in rejects.read_text(encoding="utf-8").splitlines()]
+
+    def test_csv_upserts_by_isbn_and_writes_rejects(self):
+        make_book(title="Старое название", isbn="9785170000001")
+        rejects = self.run_import("books.csv", (
+            "title,author,isbn,year_published,pages\n"
+            "Анна Каренина,Лев Толстой,978-5-17-000000-1,1877,864\n"
+            "Бесы,Федор Достоевский,9785170000002,1872,768\n"
+            "Без страниц,Автор,9785170000003,1900,много\n"
+        ))
+        self.assertEqual(Book.objects.get(isbn="9785170000001").title, "Анна Каренина")
+        self.assertTrue(Book.objects.filter(isbn="9785170000002").exists())
+        self.assertFalse(Book.objects.filter(isbn="9785170000003").exists())
+        # Номер строки файла (заголовок - первая строка) и поле с ошибкой
+        [reject] = rejects
+        self.assertEqual(reject["line"], 4)
+        self.assertIn("pages", reject["errors"])
+
+    def test_jsonl_keeps_going_after_a_broken_line(self):
+        rejects = self.run_import("books.jsonl", "\n".join([
+            json.dumps({"title": "Нос", "author": "Гоголь", "isbn": "9785170000011",
+                        "year_published": 1836, "pages": 40}, ensure_ascii=False),
+            "{не json",
+            "",
+            json.dumps({"title": "Шинель", "author": "Гоголь", "isbn": "9785170000012",
+                        "year_published": 1842, "pages": 60}, ensure_ascii=False),
+        ]))
+        self.assertEqual(Book.objects.filter(author="Гоголь").count(), 2)
+        self.assertEqual([(reject["line"], reject["row"]) for reject in rejects], [(2, "{не json")])
+
+    def test_onix_with_namespace(self):
+        self.run_import("catalog.xml", """<?xml version="1.0" encoding="UTF-8"?>
+<ONIXMessage xmlns="http://ns.editeur.org/onix/3.0/reference">
+  <Product>
+    <ProductIdentifier>
+      <ProductIDType>15</ProductIDType><IDValue>9785170000021</IDValue>
+    </ProductIdentifier>
+    <DescriptiveDetail>
+      <TitleDetail><TitleElement><TitlePrefix>The</TitlePrefix>
+        <TitleWithoutPrefix>Master</TitleWithoutPrefix></TitleElement></TitleDetail>
+      <Contributor><NamesBeforeKey>Mikhail</NamesBeforeKey><KeyNames>Bulgakov</KeyNames></Contributor>
+      <Contributor><PersonName>Translator Name</PersonName></Contributor>
+      <Extent><ExtentType>03</ExtentType><ExtentValue>9</ExtentValue></Extent>
+      <Extent><ExtentType>00</ExtentType><ExtentValue>480</ExtentValue></Extent>
+    </DescriptiveDetail>
+    <PublishingDetail><PublishingDate><Date>19670101</Date></PublishingDate></PublishingDetail>
+  </Product>
+</ONIXMessage>
+""")
+        book = Book.objects.get(isbn="9785170000021")
+        self.assertEqual(
+            (book.title, book.author, book.pages, book.year_published),
+            ("The Master", "Mikhail Bulgakov, Translator Name", 480, 1967),
+        )
+
+    def test_unknown_format_is_an_error(self):
+        path = self.directory / "books.txt"
+        path.write_text("", encoding="utf-8")
+        with self.assertRaisesMessage(CommandError, "--format"):
+            call_command("import_books", str(path), stdout=io.StringIO())
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [
+            make_book(title="Идиот", author="Федор Достоевский", year_published=1869),
+            make_book(title="Нос", author="Николай Гоголь", year_published=1836),
+            make_book(title="Бесы", author="Федор Достоевский", year_published=1872),
+        ]
+
+    def export(self, **params):
+        response = self.client.get("/api/books/export/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson_by_default(self):
+        response, body = self.export(author="Федор Достоевский")
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.books[0].id, self.books[2].id])
+        self.assertEqual(rows[0]["title"], "Идиот")
+        self.assertFalse(rows[0]["cover_image"])
+
+    def test_csv(self):
+        response, body = self.export(format="csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="books.csv"')
+        header, *rows = csv.reader(io.StringIO(body))
+        self.assertEqual(header[:3], ["id", "title", "author"])
+        self.assertEqual([row[1] for row in rows], ["Идиот", "Нос", "Бесы"])
+
+    def test_unsupported_format(self):
+        response = self.client.get("/api/books/export/", HTTP_ACCEPT="application/xml")
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(self.client.get("/api/books/export/", {"format": "xml"}).status_code, 404)
+
+    def test_errors_are_rendered_in_the_requested_format(self):
+        response = APIClient().get("/api/books/export/", {"format": "ndjson"})
+        self.assertIn(response.status_code, (401, 403))
+        self.assertIn("detail", json.loads(response.content))
+
+    def test_stream_is_sent_in_chunks(self):
+        rows = ([index, "x" * 10] for index in range(20))
+        with mock.patch("landing.renderers.STREAM_CHUNK_SIZE", 64):
+            chunks = list(NDJSONRenderer().stream(["id", "title"], rows))
+        self.assertGreater(len(chunks), 1)
+        lines = b"".join(chunks).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], list(range(20)))
+
+
+def png_bytes(size=(800, 1200), mode="RGBA"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class CoverVariantsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        # Состояние генерации - свое у каждого теста, без фоновых потоков
+        self.enterContext(mock.patch.object(images, "_in_flight", set()))
+        self.enterContext(mock.patch.object(images, "_failed", set()))
+        self.enterContext(mock.patch.object(images, "_bump_timer", None))
+        self.executor = self.enterContext(mock.patch.object(images, "_get_executor"))
+        self.original = default_storage.save("books/covers/dune.png", ContentFile(png_bytes()))
+
+    def test_derivatives_fit_each_size_in_each_format(self):
+        images.generate_derivatives(self.original)
+        for (size, fmt), name in images.derivative_names(self.original).items():
+            with default_storage.open(name) as file, Image.open(file) as image:
+                width, height = settings.BOOK_COVER_SIZES[size]
+                self.assertLessEqual(image.width, width)
+                self.assertLessEqual(image.height, height)
+                self.assertEqual(image.format, {"jpeg": "JPEG", "webp": "WEBP"}[fmt])
+                if fmt == "jpeg":
+                    self.assertEqual(image.mode, "RGB")
+
+    def test_original_url_until_derivatives_are_ready(self):
+        variants = images.cover_variants(self.original)
+        urls = {url for formats in variants.values() for url in formats.values()}
+        self.assertEqual(urls, {default_storage.url(self.original)})
+        self.executor.return_value.submit.assert_called_once_with(images._run, self.original)
+
+        with mock.patch.object(images, "_schedule_bump"):
+            images._run(self.original)
+        self.executor.reset_mock()
+        variants = images.cover_variants(self.original)
+        self.assertEqual(
+            variants["thumb"]["jpeg"],
+            default_storage.url(images.derivative_name(self.original, "thumb", "jpeg")),
+        )
+        self.executor.return_value.submit.assert_not_called()
+
+    def test_broken_original_is_not_retried(self):
+        broken = default_storage.save("books/covers/broken.png", ContentFile(b"not an image"))
+        with self.assertLogs("landing.images", "ERROR"):
+            images._run(broken)
+        images.schedule_derivatives(broken)
+        self.executor.return_value.submit.assert_not_called()
+
+    def test_ready_covers_bump_the_cache_once(self):
+        version = get_model_version(Book)
+        with mock.patch("landing.images.threading.Timer") as timer:
+            images._schedule_bump()
+            images._schedule_bump()
+        timer.assert_called_once()
+        self.assertEqual(get_model_version(Book), version)
+        _, callback = timer.call_args.args
+        callback()
+        self.assertNotEqual(get_model_version(Book), version)
+
+    def test_api_lists_variants_and_srcset(self):
+        book = make_book(cover_image=ContentFile(png_bytes(), name="cover.png"))
+        data = self.client.get(f"/api/books/{book.id}/").data
+        self.assertEqual(set(data["cover_image_variants"]), set(settings.BOOK_COVER_SIZES))
+        self.assertEqual(set(data["cover_image_srcset"]), set(images.get_formats()))
+        self.assertIn(" 100w", data["cover_image_srcset"]["jpeg"])
+
+
+INSTRUMENT_ALL = {
+    "SAMPLE_RATE": 1.0, "SLOW_REQUEST_MS": 60_000, "N_PLUS_ONE_THRESHOLD": 5,
+    "TOP_QUERIES": 5, "SERVER_TIMING": True,
+}
+
+
+@override_settings(SQL_INSTRUMENTATION=INSTRUMENT_ALL)
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get("/api/books/")
+
+    def run_view(self, view):
+        return QueryInstrumentationMiddleware(view)(self.request)
+
+    def test_server_timing_counts_queries(self):
+        def view(request):
+            Book.objects.count()
+            Book.objects.filter(author="Гоголь").exists()
+            return HttpResponse()
+
+        header = self.run_view(view)["Server-Timing"]
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="2 queries", app;dur=[\d.]+$')
+        self.assertEqual(self.request.query_stats.count, 2)
+
+    def test_repeated_sql_is_reported_as_n_plus_one(self):
+        def view(request):
+            for pk in range(6):
+                Book.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        with self.assertLogs("config.middleware", "WARNING") as logs:
+            self.run_view(view)
+        [message] = logs.output
+        self.assertIn("N+1: GET /api/books/, 6", message)
+        self.assertIn("6 x", message)
+
+    def test_different_queries_are_not_n_plus_one(self):
+        def view(request):
+            for field in ("title", "author", "isbn", "description", "pages", "year_published"):
+                Book.objects.filter(**{field: "1"}).exists()
+            return HttpResponse()
+
+        with self.assertNoLogs("config.middleware", "WARNING"):
+            self.run_view(view)
+
+    def test_slow_request_lists_slowest_queries(self):
+        def view(request):
+            Book.objects.count()
+            return HttpResponse()
+
+        with override_settings(SQL_INSTRUMENTATION={**INSTRUMENT_ALL, "SLOW_REQUEST_MS": 0}), \
+                self.assertLogs("config.middleware", "WARNING") as logs:
+            self.run_view(view)
+        self.assertIn("Медленный запрос", logs.output[0])
+        self.assertIn("COUNT(*)", logs.output[0])
+
+    @override_settings(SQL_INSTRUMENTATION={**INSTRUMENT_ALL, "SAMPLE_RATE": 0})
+    def test_unsampled_requests_pass_through(self):
+        response = self.run_view(lambda request: HttpResponse())
+        self.assertNotIn("Server-Timing", response)
+        self.assertFalse(hasattr(self.request, "query_stats"))
+
+    async def test_async_requests(self):
+        async def view(request):
+            await Book.objects.acount()
+            await Book.objects.filter(pages__gt=100).aexists()
+            return HttpResponse()
+
+        response = await QueryInstrumentationMiddleware(view)(self.request)
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+    def test_api_responses_have_server_timing(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            email="reader@example.com", username="reader", password="Secret-pass-123"
+        ))
+        self.assertIn("db;dur=", client.get("/api/books/")["Server-Timing"])
+
+
+class MetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS={
+            "ENABLED": True, "DIR": self.directory, "FLUSH_INTERVAL": 60, "TOKEN": "scrape-token",
+        }))
+        # Свой реестр без фонового потока записи; "живой" - только текущий процесс
+        self.registry = metrics.Registry(self.directory, 60)
+        self.enterContext(mock.patch.object(metrics, "_registry", self.registry))
+        self.enterContext(mock.patch.object(metrics, "_pid_alive", lambda pid: pid == os.getpid()))
+
+    def write_process(self, pid, requests, in_flight):
+        labels = [["view", "book-list"], ["method", "GET"], ["status", "200"]]
+        with open(os.path.join(self.directory, f"{pid}.json"), "w") as file:
+            json.dump({
+                "pid": pid,
+                "counters": [["http_requests_total", labels, requests]],
+                "gauges": [["http_requests_in_flight", [], in_flight]],
+                "histograms": [],
+            }, file)
+
+    def scrape(self, **headers):
+        return self.client.get("/metrics", **headers)
+
+    def test_processes_are_summed_and_dead_ones_archived(self):
+        labels = (("view", "book-list"), ("method", "GET"), ("status", "200"))
+        self.registry.inc("http_requests_total", labels, 2)
+        self.registry.add_gauge("http_requests_in_flight", (), 1)
+        self.write_process(os.getpid() + 1, requests=5, in_flight=3)
+
+        counters, gauges, _ = metrics.collect()
+        self.assertEqual(counters[("http_requests_total", labels)], 7)
+        # Gauge завершенного процесса не учитывается, счетчик - переносится в архив
+        self.assertEqual(gauges[("http_requests_in_flight", ())], 1)
+        self.assertEqual(
+            set(os.listdir(self.directory)), {".lock", metrics.ARCHIVE, f"{os.getpid()}.json"}
+        )
+        counters, _, _ = metrics.collect()
+        self.assertEqual(counters[("http_requests_total", labels)], 7)
+
+    def test_histogram_is_cumulative(self):
+        for value in (0.003, 0.003, 0.2, 60):
+            self.registry.observe("http_request_duration_seconds", (("view", 'a"b'),), value)
+        text = metrics.render(*metrics.collect())
+        self.assertIn('http_request_duration_seconds_bucket{view="a\\"b",le="0.005"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="a\\"b",le="0.25"} 3', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="a\\"b",le="+Inf"} 4', text)
+        self.assertIn('http_request_duration_seconds_count{view="a\\"b"} 4', text)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+
+    def test_requests_and_cache_hits_are_recorded(self):
+        make_book()
+        self.client.get("/api/books/")
+        self.client.get("/api/books/")
+        text = self.scrape(HTTP_AUTHORIZATION="Bearer scrape-token").content.decode()
+        self.assertIn('http_requests_total{view="book-list",method="GET",status="200"} 2', text)
+        self.assertIn('cache_requests_total{layer="response",result="hit"} 1', text)
+        self.assertIn('db_queries_total{view="book-list"}', text)
+        # Сам /metrics не учитывается
+        self.assertNotIn('view="metrics"', text)
+
+    def test_access(self):
+        self.assertEqual(APIClient().get("/metrics").status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        staff = APIClient()
+        staff.force_login(User.objects.create_user(
+            email="ops@example.com", username="ops", password="Secret-pass-123", is_staff=True
+        ))
+        self.assertEqual(staff.get("/metrics").status_code, 200)
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера: состояние транзакции и "живость" задаются в тесте"""
+
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if connection.dead:
+                    raise psycopg2.OperationalError("server closed the connection")
+
+        return Cursor()
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **options):
+        options = {
+            "min_size": 0, "max_size": 2, "timeout": 0.05,
+            "max_lifetime": 3600, "max_idle": 300, "check_idle": 30, **options,
+        }
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+        pool = ConnectionPool("test", connect, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_checkout_reuses_and_times_out_when_exhausted(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        stats = pool.stats()
+        self.assertEqual(
+            (stats["in_use"], stats["timeouts"], stats["connections_opened"]), (2, 1, 2)
+        )
+
+        # Ожидающий поток получает соединение, как только его вернут
+        pool.timeout = 5
+        threading.Timer(0.05, pool.putconn, [first]).start()
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_dead_and_dirty_connections_are_not_reused(self):
+        pool = self.make_pool(check_idle=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.dead = True
+        # Проверка перед выдачей отбрасывает мертвое соединение и открывает новое
+        fresh = pool.getconn()
+        self.assertIsNot(fresh, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["health_check_failures"], 1)
+
+        # Незавершенная транзакция откатывается при возврате
+        fresh.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        pool.putconn(fresh)
+        self.assertEqual(fresh.rollbacks, 1)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_old_connection_is_closed_on_return(self):
+        pool = self.make_pool(max_lifetime=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.stats()["size"], pool.stats()["connections_closed"]), (0, 1))
+
+
+def pool_exhausted(*args, **kwargs):
+    # Так Django оборачивает ошибки драйвера: OperationalError с __cause__
+    try:
+        raise PoolTimeout("Нет свободного соединения")
+    except PoolTimeout as e:
+        raise OperationalError(*e.args) from e
+
+
+class DatabaseUnavailableTests(ApiTestCase):
+    def test_pool_timeout_returns_503(self):
+        with mock.patch("landing.views.BookViewSet.list", side_effect=pool_exhausted):
+            with self.assertLogs("config.middleware", "WARNING"):
+                response = self.client.get("/api/books/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertIn("detail", response.json())
+
+    def test_other_database_errors_are_not_handled(self):
+        middleware = DatabaseUnavailableMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get("/api/books/")
+        self.assertIsNone(middleware.process_exception(request, OperationalError("disk I/O error")))
+        self.assertIsNone(middleware.process_exception(request, ValueError()))
+
+
+class BenchmarkCheckTests(SimpleTestCase):
+    def result(self, **values):
+        return {
+            "requests": 10, "errors": 0, "p50_ms": 5.0, "p95_ms": 10.0, "p99_ms": 12.0,
+            "mean_ms": 6.0, "rps": 100.0, "queries": 3.0, **values,
+        }
+
+    def test_within_thresholds(self):
+        thresholds = {"client:book-list": {"p95_ms": 50, "queries": 4, "min_rps": 50}}
+        self.assertEqual(check({"client:book-list": self.result()}, thresholds, {}, 0.25), [])
+
+    def test_threshold_violations(self):
+        thresholds = {"live:book-list": {"p95_ms": 5, "queries": 2, "min_rps": 500}}
+        failures = check({"live:book-list": self.result(errors=1)}, thresholds, {}, 0.25)
+        self.assertEqual(len(failures), 4)
+        self.assertTrue(all(failure.startswith("live:book-list: ") for failure in failures))
+
+    def test_missing_rps_fails_the_rps_threshold(self):
+        failures = check({"live:x": self.result(rps=None)}, {"live:x": {"min_rps": 1}}, {}, 0.25)
+        self.assertEqual(failures, ["live:x: rps не измерен, порог 1"])
+
+    def test_regression_against_baseline(self):
+        baseline = {"client:x": self.result(p95_ms=8.0, queries=3.0)}
+        # p95 10 > 8 * 1.2, количество SQL не изменилось
+        failures = check({"client:x": self.result()}, {}, baseline, 0.2)
+        self.assertEqual(len(failures), 1)
+        self.assertIn("p95_ms 10.0", failures[0])
+        self.assertEqual(check({"client:x": self.result()}, {}, baseline, 0.3), [])
+
+    def test_summary_percentiles(self):
+        latencies = [index / 1000 for index in range(1, 101)]
+        summary = summarize(latencies, [2, 4], wall_time=2.0, errors=1)
+        self.assertEqual((summary["p50_ms"], summary["p99_ms"]), (50.5, 99.01))
+        self.assertEqual((summary["rps"], summary["queries"], summary["errors"]), (50.0, 3.0, 1))
+        self.assertIsNone(summarize([0.01], [], wall_time=0, errors=0)["rps"])
+
+    def test_every_scenario_has_thresholds(self):
+        thresholds = json.loads(DEFAULT_THRESHOLDS.read_text())
+        names = scenarios([1], books=10, users=10)
+        expected = {f"{mode}:{name}" for mode in ("client", "live") for name in names}
+        self.assertEqual(set(thresholds), expected)
+
+
+class BenchmarkSeedTests(TestCase):
+    def test_seed_is_repeatable_and_scenarios_run(self):
+        admin, token, added = seed(books=20, users=3, news=2)
+        self.assertTrue(admin.is_staff)
+        self.assertEqual(added, {"books": 20, "users": 3, "news": 2})
+        self.assertEqual(Book.objects.filter(isbn=benchmark_isbn(0)).count(), 1)
+        # Повторный запуск с теми же размерами ничего не добавляет, с большими - дозаполняет
+        nothing = {"books": 0, "users": 0, "news": 0}
+        self.assertEqual(seed(books=20, users=3, news=2)[1:], (token, nothing))
+        self.assertEqual(seed(books=25, users=3, news=2)[2]["books"], 5)
+
+        result = run_client(
+            "GET", lambda i: "/api/books/recent/", None, count=3, warmup=1, token=token
+        )
+        self.assertEqual((result["requests"], result["errors"]), (3, 0))
+        self.assertGreater(result["queries"], 0)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class GenerateDataTests(TestCase):
+    def generate(self, **sizes):
+        call_command("generate_data", "--chunk-size", "7", *(
+            f"--{name}={size}" for name, size in sizes.items()
+        ), stdout=io.StringIO())
+
+    def test_tops_up_to_requested_sizes(self):
+        make_book(title="Чужая книга")
+        version = get_model_version(Book)
+        self.generate(books=30, users=4, news=3)
+
+        generated = Book.objects.filter(isbn__startswith=fake_data.ISBN_PREFIX)
+        self.assertEqual(generated.count(), 30)
+        self.assertEqual(Book.objects.count(), 31)
+        self.assertNotEqual(get_model_version(Book), version)
+        for isbn in generated.values_list("isbn", flat=True):
+            total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(isbn[:12]))
+            self.assertEqual(int(isbn[12]), (10 - total % 10) % 10)
+
+        users = User.objects.filter(email__endswith="@example.ru")
+        self.assertEqual(users.count(), 4)
+        self.assertTrue(users.first().check_password(fake_data.DEFAULT_PASSWORD))
+        authors = set(News.objects.values_list("author_id", flat=True))
+        self.assertLessEqual(authors, set(users.values_list("pk", flat=True)))
+
+        # Повтор ничего не добавляет и не сбрасывает кэш, больший размер - дозаполняет
+        version = get_model_version(Book)
+        self.generate(books=30, users=4, news=3)
+        self.assertEqual(get_model_version(Book), version)
+        self.generate(books=33)
+        self.assertEqual(generated.count(), 33)
+        self.assertEqual(User.objects.filter(email__endswith="@example.ru").count(), 4)
+
+    def test_invalid_arguments(self):
+        with self.assertRaisesMessage(CommandError, "отрицательными"):
+            self.generate(books=-1)
+        with self.assertRaisesMessage(CommandError, "--chunk-size"):
+            call_command("generate_data", "--books=1", "--chunk-size=0", stdout=io.StringIO())
+        # Новости без пользователей не к кому привязать
+        with self.assertRaises(CommandError):
+            self.generate(news=2)
+        self.assertFalse(News.objects.exists())
+
+    def test_rows_are_deterministic_per_seed(self):
+        def titles(seed, chunk_size=4):
+            return [row[:6] for row in fake_data.book_rows(0, 10, seed, chunk_size)]
+
+        self.assertEqual(titles(1), titles(1))
+        self.assertNotEqual(titles(1), titles(2))
+        # Куски генерируются независимо: продолжение с границы куска совпадает
+        self.assertEqual(titles(1)[8:], [row[:6] for row in fake_data.book_rows(8, 2, 1, 4)])
+
+
+class CopyStreamTests(SimpleTestCase):
+    def test_copy_format_escaping(self):
+        moment = datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc)
+        rows = [
+            ("C:\\книги", "строка\nс\tтабом", None, True, False, 42, moment),
+            ("второй", "", None, False, True, 0, moment),
+        ]
+        stream = fake_data.CopyStream(rows, chunk_rows=1)
+        # Чтение маленькими кусками собирает те же строки
+        data = b"".join(iter(lambda: stream.read(5), b"")).decode()
+        self.assertEqual(stream.rows, 2)
+        first, second, tail = data.split("\n")
+        self.assertEqual(tail, "")
+        self.assertEqual(first.split("\t"), [
+            "C:\\\\книги", "строка\\nс\\tтабом", "\\N", "t", "f", "42", moment.isoformat(),
+        ])
+        self.assertEqual(second.split("\t")[1:4], ["", "\\N", "f"])
+
+
+class SimilarBooksTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        index_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(BOOK_SIMILAR={
+            **settings.BOOK_SIMILAR, "INDEX_DIR": index_dir, "CHECK_INTERVAL": 0,
+            "DIMENSIONS": 64, "NEIGHBORS": 4,
+        }))
+        # Индекс процесса - свой в каждом тесте
+        self.enterContext(mock.patch("landing.similar._index", None))
+        self.books = {
+            title: make_book(title=title, author=author, description=description)
+            for title, author, description in (
+                ("Война и мир. Том 1", "Лев Толстой", "Роман-эпопея о войне 1812 года"),
+                ("Война и мир. Том 2", "Лев Толстой", "Роман-эпопея о войне 1812 года"),
+                ("Анна Каренина", "Лев Толстой", "Роман о семье"),
+                ("Преступление и наказание", "Федор Достоевский", "Роман о преступлении"),
+                ("Идиот", "Федор Достоевский", "Роман о князе Мышкине"),
+                ("Мертвые души", "Николай Гоголь", "Поэма о помещиках"),
+                ("Ревизор", "Николай Гоголь", "Комедия о чиновниках"),
+                ("Шинель", "Николай Гоголь", "Повесть о чиновнике"),
+            )
+        }
+
+    def similar(self, title, query=""):
+        response = self.client.get(f"/api/books/{self.books[title].pk}/similar/{query}")
+        self.assertEqual(response.status_code, 200)
+        return [(item["title"], item["score"]) for item in response.data]
+
+    def test_falls_back_to_same_author_without_index(self):
+        found = self.similar("Идиот")
+        self.assertEqual(found, [("Преступление и наказание", None)])
+        response = self.client.get(f"/api/books/{self.books['Идиот'].pk}/similar/?limit=x")
+        self.assertEqual(response.status_code, 400)
+
+    def test_built_index_ranks_neighbors(self):
+        call_command("build_similar_index", stdout=io.StringIO())
+        found = self.similar("Война и мир. Том 1")
+        self.assertEqual(found[0][0], "Война и мир. Том 2")
+        self.assertNotIn("Война и мир. Том 1", [title for title, _ in found])
+        scores = [score for _, score in found]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(0 < score <= 1 for score in scores))
+        # limit ограничен количеством соседей в индексе
+        self.assertEqual(len(self.similar("Шинель", "?limit=1")), 1)
+        self.assertLessEqual(len(self.similar("Шинель", "?limit=100")), 4)
+
+    def test_incremental_build_picks_up_changes(self):
+        self.assertEqual(build_index()["mode"], "full")
+        self.assertEqual(build_index()["mode"], "unchanged")
+
+        # Новая книга до сборки - через запасной путь, после - из индекса
+        self.books["Война и мир. Том 3"] = make_book(
+            title="Война и мир. Том 3", author="Лев Толстой",
+            description="Роман-эпопея о войне 1812 года",
+        )
+        self.assertTrue(all(score is None for _, score in self.similar("Война и мир. Том 3")))
+        stats = build_index()
+        self.assertEqual((stats["mode"], stats["books"]), ("incremental", 9))
+        found = self.similar("Война и мир. Том 3")
+        self.assertIn(found[0][0], ("Война и мир. Том 1", "Война и мир. Том 2"))
+        self.assertIsNotNone(found[0][1])
+        neighbors = [title for title, _ in self.similar("Война и мир. Том 1")]
+        self.assertIn("Война и мир. Том 3", neighbors)
+
+        # Удаленная книга пропадает из списков соседей
+        self.books.pop("Война и мир. Том 2").delete()
+        self.assertEqual(build_index()["mode"], "incremental")
+        neighbors = [title for title, _ in self.similar("Война и мир. Том 1")]
+        self.assertNotIn("Война и мир. Том 2", neighbors)
+
+        self.assertEqual(build_index(full=True)["mode"], "full")
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def upload(self, content=b"cover"):
+        return ContentFile(content, name="cover.JPG")
+
+    def blob(self, name):
+        return MediaBlob.objects.get(name=name)
+
+    def test_same_content_is_stored_once(self):
+        first = media_storage.save("a.jpg", self.upload())
+        second = media_storage.save("b.jpg", self.upload())
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("cas/") and first.endswith(".jpg"))
+        self.assertNotEqual(media_storage.save("c.jpg", self.upload(b"other")), first)
+
+    def test_ref_count_follows_cover_changes(self):
+        first = make_book(cover_image=self.upload())
+        second = make_book(cover_image=self.upload())
+        name = first.cover_image.name
+        self.assertEqual(second.cover_image.name, name)
+        self.assertEqual(self.blob(name).ref_count, 2)
+
+        first.cover_image = None
+        first.save()
+        self.assertEqual(self.blob(name).ref_count, 1)
+
+        second.delete()
+        self.assertEqual(self.blob(name).ref_count, 0)
+
+    def test_gc_deletes_only_old_orphans(self):
+        kept = make_book(cover_image=self.upload(b"kept")).cover_image.name
+        orphan = media_storage.save("orphan.jpg", self.upload(b"orphan"))
+        fresh = media_storage.save("fresh.jpg", self.upload(b"fresh"))
+        past = timezone.now() - timedelta(days=2)
+        MediaBlob.objects.bulk_create([
+            MediaBlob(name=orphan, ref_count=0),
+            MediaBlob(name=fresh, ref_count=0),
+        ])
+        MediaBlob.objects.filter(name__in=[kept, orphan]).update(updated_at=past)
+
+        call_command("gc_media", stdout=io.StringIO())
+
+        self.assertFalse(media_storage.exists(orphan))
+        self.assertFalse(MediaBlob.objects.filter(name=orphan).exists())
+        self.assertTrue(media_storage.exists(kept))
+        self.assertEqual(self.blob(kept).ref_count, 1)
+        self.assertTrue(media_storage.exists(fresh))
+
+    def test_gc_fixes_drifted_counters(self):
+        name = make_book(cover_image=self.upload()).cover_image.name
+        MediaBlob.objects.filter(name=name).update(
+            ref_count=0, updated_at=timezone.now() - timedelta(days=2)
+        )
+
+        call_command("gc_media", stdout=io.StringIO())
+
+        self.assertEqual(self.blob(name).ref_count, 1)
+        self.assertTrue(media_storage.exists(name))
+
+
+@override_settings(DATABASE_REPLICAS={"replica1": 1})
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.factory = RequestFactory()
+        self.seen = []
+
+        def get_response(request):
+            self.seen.append(current_read_alias())
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+
+    def test_safe_reads_go_to_a_replica(self):
+        self.middleware(self.factory.get("/api/books/"))
+        self.assertEqual(self.seen, ["replica1"])
+        # Вне запроса - снова primary
+        self.assertEqual(current_read_alias(), "default")
+
+    def test_write_pins_the_client_by_cookie(self):
+        response = self.middleware(self.factory.post("/api/books/"))
+        self.assertIn("db_pin", response.cookies)
+
+        request = self.factory.get("/api/books/")
+        request.COOKIES["db_pin"] = response.cookies["db_pin"].value
+        self.middleware(request)
+        self.assertEqual(self.seen, ["default", "default"])
+
+    def test_write_pins_the_token_in_the_cache(self):
+        self.middleware(self.factory.post("/api/books/", HTTP_AUTHORIZATION="Token abc"))
+        self.middleware(self.factory.get("/api/books/", HTTP_AUTHORIZATION="Token abc"))
+        self.middleware(self.factory.get("/api/books/", HTTP_AUTHORIZATION="Token other"))
+        self.assertEqual(self.seen, ["default", "default", "replica1"])
+
+    def test_expired_cookie_does_not_pin(self):
+        request = self.factory.get("/api/books/")
+        request.COOKIES["db_pin"] = "1"
+        self.middleware(request)
+        self.assertEqual(self.seen, ["replica1"])
+
+    def test_replica_read_after_a_change_is_not_cached(self):
+        cacheable = []
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: cacheable.append(cacheable_read(Book)) or HttpResponse()
+        )
+        bump_model_version(Book)
+        middleware(self.factory.get("/api/books/"))
+        # Чтение с primary кэшировать можно всегда
+        middleware(self.factory.post("/api/books/"))
+        caches["default"].clear()
+        middleware(self.factory.get("/api/books/"))
+        self.assertEqual(cacheable, [False, True, True])
+
+    def test_process_local_cache_is_an_error(self):
+        errors = check_replica_cache()
+        self.assertTrue(errors)
+        self.assertEqual({error.id for error in errors}, {"config.E001"})
+
+        with override_settings(DATABASE_REPLICAS={}):
+            self.assertEqual(check_replica_cache(), [])
+
+
+class FavoritesTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(title="Идиот")
+        self.url = f"/api/books/{self.book.id}/favorite/"
+
+    def favorites_count(self):
+        return Book.objects.values_list("favorites_count", flat=True).get(pk=self.book.pk)
+
+    def favorite(self, method="post", url=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url or self.url)
+
+    def test_add_is_idempotent(self):
+        response = self.favorite()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["favorites_count"], 1)
+
+        response = self.favorite()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.favorites_count(), 1)
+
+    def test_remove_and_toggle(self):
+        self.favorite()
+        self.assertEqual(self.favorite("delete").status_code, 204)
+        self.assertEqual(self.favorites_count(), 0)
+        # Повторное удаление не уводит счетчик в минус
+        self.favorite("delete")
+        self.assertEqual(self.favorites_count(), 0)
+
+        response = self.favorite(url=f"{self.url}toggle/")
+        self.assertEqual(
+            (response.data["is_favorited"], response.data["favorites_count"]), (True, 1)
+        )
+        response = self.favorite(url=f"{self.url}toggle/")
+        self.assertEqual(
+            (response.data["is_favorited"], response.data["favorites_count"]), (False, 0)
+        )
+
+    def test_deleting_a_user_decrements_the_counter(self):
+        self.favorite()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.favorites_count(), 0)
+
+    def test_full_save_keeps_the_counter(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        self.favorite()
+        stale.title = "Идиот (2-е изд.)"
+        stale.save()
+        self.assertEqual(self.favorites_count(), 1)
+
+    def test_favorite_change_moves_last_modified(self):
+        url = f"/api/books/{self.book.id}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # Счетчик меняется и у тех, кто сам книгу не отмечал
+        reader = User.objects.create_user(
+            email="other@example.com", username="other", password="Secret-pass-123"
+        )
+        with mock.patch("landing.caching.time.time", return_value=time.time() + 60), \
+                self.captureOnCommitCallbacks(execute=True):
+            add_favorite(reader, self.book)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["favorites_count"], 1)
+
+    def test_list_marks_favorites_per_user(self):
+        other = make_book()
+        self.favorite()
+
+        results = {item["id"]: item for item in self.client.get("/api/books/").data["results"]}
+        self.assertEqual(
+            (results[self.book.id]["is_favorited"], results[self.book.id]["favorites_count"]),
+            (True, 1),
+        )
+        self.assertFalse(results[other.id]["is_favorited"])
+
+        # Другой пользователь видит тот же счетчик, но без своей отметки
+        reader = User.objects.create_user(
+            email="other@example.com", username="other", password="Secret-pass-123"
+        )
+        self.client.force_authenticate(reader)
+        results = {item["id"]: item for item in self.client.get("/api/books/").data["results"]}
+        self.assertEqual(
+            (results[self.book.id]["is_favorited"], results[self.book.id]["favorites_count"]),
+            (False, 1),
+        )
+
+
+class ViewBufferTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = self.view_buffer
+        self.popular = make_book(title="Популярная")
+        self.quiet = make_book(title="Тихая")
+
+    def views(self, book):
+        return dict(BookViewBucket.objects.filter(book=book).values_list("hour", "views"))
+
+    def test_flush_writes_one_bucket_per_book_and_hour(self):
+        for _ in range(3):
+            self.buffer.record(self.popular.id)
+        self.buffer.record(self.quiet.id)
+
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self.views(self.popular), {current_hour(): 3})
+        self.assertEqual(self.views(self.quiet), {current_hour(): 1})
+
+    def test_repeated_flush_adds_to_the_bucket(self):
+        self.buffer.record(self.popular.id)
+        self.buffer.flush()
+        self.buffer.record(self.popular.id)
+        self.buffer.record(self.popular.id)
+        self.buffer.flush()
+
+        self.assertEqual(self.views(self.popular), {current_hour(): 3})
+
+    def test_views_of_deleted_books_are_dropped(self):
+        self.buffer.record(self.quiet.id)
+        self.quiet.delete()
+        self.buffer.record(self.popular.id)
+        self.buffer.flush()
+
+        self.assertEqual(BookViewBucket.objects.count(), 1)
+
+    def test_failed_write_keeps_the_views(self):
+        self.buffer.record(self.popular.id)
+        with mock.patch("landing.trending.write_buckets", side_effect=DatabaseError), \
+                self.assertLogs("landing.trending", "ERROR"):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(), 1)
+
+        self.buffer.flush()
+        self.assertEqual(self.views(self.popular), {current_hour(): 1})
+
+    def test_old_buckets_are_pruned(self):
+        retention = settings.BOOK_TRENDING["RETENTION_HOURS"]
+        BookViewBucket.objects.create(
+            book=self.quiet, hour=current_hour() - timedelta(hours=retention + 1), views=5
+        )
+        self.buffer.flush()
+        self.assertFalse(BookViewBucket.objects.exists())
+
+    def test_detail_view_is_counted_and_trending_orders_by_views(self):
+        for _ in range(2):
+            self.client.get(f"/api/books/{self.popular.id}/")
+        self.client.get(f"/api/books/{self.quiet.id}/")
+        self.assertEqual(self.buffer.pending(), 3)
+        self.buffer.flush()
+
+        response = self.client.get("/api/books/trending/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in response.data[:2]], [self.popular.id, self.quiet.id]
+        )
@@ -0,0 +1,236 @@
+"""
+Счетчики просмотров книг и "популярное" (GET /api/books/trending/).
+
+Просмотр книги (GET /api/books/{id}/, в том числе ответ 304) не пишет
+в БД: он увеличивает счетчик в буфере процесса (ViewBuffer). Фоновый
+поток раз в FLUSH_INTERVAL секунд (или раньше, если накопилось
+MAX_PENDING просмотров) записывает буфер пачкой в BookViewBucket -
+одна строка на книгу и час, счетчик увеличивается upsert-ом
+(INSERT ... ON CONFLICT DO UPDATE SET views = views + EXCLUDED.views).
+Тысячи просмотров одной книги за интервал - одна строка в одном запросе.
+
+Популярное - сумма просмотров по часовым корзинам за последние N часов
+(скользящее окно шагом в час) по индексу (hour, book). Результат
+кэшируется на CACHE_TIMEOUT секунд. Корзины старше RETENTION_HOURS
+удаляются при записи буфера.
+
+Просмотры, не успевшие попасть в БД при аварийном завершении процесса,
+теряются - для популярного это допустимо. Буфер свой в каждом процессе
+и после fork создается заново.
+"""
+import atexit
+import functools
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from config.metrics import cache_event
+from landing.caching import cacheable_read, get_cache, get_model_version
+from landing.models import Book, BookViewBucket
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном INSERT (по 3 параметра на строку)
+UPSERT_BATCH = 500
+
+
+def current_hour(now=None):
+    return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+def write_buckets(rows):
+    """
+    Прибавляет просмотры к часовым корзинам.
+
+    rows - {(book_id, начало часа): просмотры}. Просмотры удаленных
+    к этому времени книг отбрасываются (JOIN с таблицей книг).
+    """
+    alias = router.db_for_write(BookViewBucket)
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    table = quote(BookViewBucket._meta.db_table)
+    items = list(rows.items())
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH):
+            batch = items[start:start + UPSERT_BATCH]
+            params = []
+            for (book_id, hour), views in batch:
+                params += [book_id, connection.ops.adapt_datetimefield_value(hour), views]
+            # Столбцы VALUES без имен называются column1, column2, ... и в
+            # PostgreSQL, и в SQLite; WHERE true нужен SQLite, чтобы ON CONFLICT
+            # не принимался за продолжение JOIN
+            cursor.execute(
+                f"INSERT INTO {table} ({quote('book_id')}, {quote('hour')}, {quote('views')}) "
+                f"SELECT v.column1, v.column2, v.column3 "
+                f"FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}) AS v "
+                f"JOIN {quote(Book._meta.db_table)} b ON b.{quote('id')} = v.column1 "
+                f"WHERE true "
+                f"ON CONFLICT ({quote('book_id')}, {quote('hour')}) "
+                f"DO UPDATE SET {quote('views')} = {table}.{quote('views')} + EXCLUDED.{quote('views')}",
+                params,
+            )
+
+
+def prune_buckets(retention_hours):
+    """Удаляет корзины старше retention_hours часов"""
+    alias = router.db_for_write(BookViewBucket)
+    cutoff = current_hour() - timedelta(hours=retention_hours)
+    deleted, _ = BookViewBucket.objects.using(alias).filter(hour__lt=cutoff).delete()
+    return deleted
+
+
+class ViewBuffer:
+    """Просмотры книг одного процесса, еще не записанные в БД"""
+
+    def __init__(self, config):
+        self.config = config
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (id книги, начало часа) -> просмотры
+        self._pending_views = 0
+        self._wake = threading.Event()
+        self._pruned_at = None
+
+    def record(self, book_id):
+        key = (book_id, current_hour())
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._pending_views += 1
+            full = self._pending_views >= self.config["MAX_PENDING"]
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return self._pending_views
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_views = 0
+        return pending
+
+    def _restore(self, rows):
+        """Возвращает в буфер то, что не удалось записать (до следующей попытки)"""
+        with self._lock:
+            for key, views in rows.items():
+                self._pending[key] = self._pending.get(key, 0) + views
+                self._pending_views += views
+
+    def flush(self):
+        """Записывает накопленные просмотры в БД. Возвращает количество просмотров в записи"""
+        with self._flush_lock:
+            rows = self._take()
+            if rows:
+                try:
+                    write_buckets(rows)
+                except DatabaseError:
+                    logger.exception("Не удалось записать просмотры книг")
+                    self._restore(rows)
+                    return 0
+            hour = current_hour()
+            if self._pruned_at != hour:
+                self._pruned_at = hour
+                prune_buckets(self.config["RETENTION_HOURS"])
+            return sum(rows.values())
+
+    def run_flusher(self):
+        while True:
+            self._wake.wait(self.config["FLUSH_INTERVAL"])
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Ошибка записи просмотров книг")
+            finally:
+                # Соединения этого потока (с пулом - вернутся в пул)
+                connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Буфер текущего процесса (после fork создается заново)"""
+    global _buffer
+    buffer = _buffer
+    if buffer is not None and buffer.pid == os.getpid():
+        return buffer
+    with _buffer_lock:
+        if _buffer is None or _buffer.pid != os.getpid():
+            _buffer = ViewBuffer(settings.BOOK_TRENDING)
+            threading.Thread(target=_buffer.run_flusher, name="book-views-flush", daemon=True).start()
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def record_view(book_id):
+    if settings.BOOK_TRENDING["ENABLED"]:
+        get_buffer().record(book_id)
+
+
+def track_views(view_method):
+    """
+    Декоратор действия retrieve: считает просмотр книги.
+
+    Ставится над conditional_get - повторный просмотр с ответом 304
+    тоже просмотр.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            record_view(int(kwargs["pk"]))
+        return response
+
+    return wrapper
+
+
+def trending_books(hours, limit):
+    """
+    [(id книги, просмотры)] за последние hours часов (включая текущий),
+    по убыванию просмотров.
+    """
+    start = current_hour() - timedelta(hours=hours - 1)
+    rows = (
+        BookViewBucket.objects.filter(hour__gte=start)
+        .values("book")
+        .annotate(total=Sum("views"))
+        .order_by("-total", "-book")[:limit]
+    )
+    return [(row["book"], row["total"]) for row in rows]
+
+
+def get_trending(hours, limit, serialize):
+    """
+    Популярные книги с кэшем: сериализованные книги с полем views.
+
+    serialize(books) - сериализация списка книг (сериализатором view).
+    В ключе кэша - текущий час и версия модели Book.
+    """
+    cache = get_cache()
+    key = (
+        f"trending:v{get_model_version(Book)}:{current_hour():%Y%m%d%H}:{hours}:{limit}"
+    )
+    data = cache.get(key)
+    cache_event("trending", data is not None)
+    if data is not None:
+        return data
+
+    ranked = trending_books(hours, limit)
+    books = Book.objects.in_bulk([book_id for book_id, _ in ranked])
+    ordered = [(books[book_id], views) for book_id, views in ranked if book_id in books]
+    data = list(serialize([book for book, _ in ordered]))
+    for item, (_, views) in zip(data, ordered):
+        item["views"] = views
+    if cacheable_read(Book):
+        cache.set(key, data, settings.BOOK_TRENDING["CACHE_TIMEOUT"])
+    return data
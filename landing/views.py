@@ -1,14 +1,31 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import TemplateView, CreateView
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 
+from landing.caching import cache_response
+from landing.conditional import conditional_get
+from landing.favorites import (
+    add_favorite, favorite_state, favorites_etag, favorites_last_modified, remove_favorite,
+    toggle_favorite, with_favorites,
+)
+from landing.filters import BookFilterBackend, get_facets, parse_filters
+from landing.fuzzy import fuzzy_search_books
 from landing.forms import ItemsForm
 from landing.models import Item, Book
-from landing.serializers import BookSerializer
+from landing.pagination import BookPagination
+from landing.renderers import CSVRenderer, NDJSONRenderer
+from landing.search import search_books
+from landing.similar import similar_books
+from landing.suggest import suggest
+from landing.trending import get_trending, track_views
+from landing.serializers import BookSerializer, BookUpsertSerializer
 
 
 class HomeView(TemplateView):
@@ -30,6 +47,10 @@ class ItemsCreateView(CreateView):
 class BookViewSet(viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    # Обычная пагинация по страницам, ?pagination=cursor - курсорная
+    pagination_class = BookPagination
+    # ?author=, ?year_min=, ?year_max=, ?pages_min=, ?pages_max= (landing/filters.py)
+    filter_backends = [BookFilterBackend]
 
     def get_permissions(self):
         """
@@ -44,6 +65,22 @@ class BookViewSet(viewsets.ModelViewSet):
         # Создание, обновление и удаление только для авторизованных
         return [permissions.IsAuthenticated()]
 
+    @property
+    def throttle_scope(self):
+        """
+        Область лимитов (config/throttling.py): ограничиваем только запись,
+        чтение каталога идет без лимитов.
+        """
+        if self.request is None or self.request.method in permissions.SAFE_METHODS:
+            return None
+        return "books-write"
+
+    def get_serializer_class(self):
+        """Для пакетной записи - сериализатор без проверки уникальности ISBN"""
+        if self.action == "bulk":
+            return BookUpsertSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         """
         Дополнительные действия при создании книги.
@@ -56,7 +93,51 @@ class BookViewSet(viewsets.ModelViewSet):
         # Просто сохраняем объект
         serializer.save()
 
+    def get_recent_queryset(self):
+        """Последние 5 добавленных книг"""
+        return self.get_queryset().order_by("-created_at")[:5]
+
+    @conditional_get(
+        lambda view: view.filter_queryset(view.get_queryset()),
+        etag_extra=favorites_etag,
+        modified_extra=favorites_last_modified,
+    )
+    @with_favorites
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        """
+        Список книг.
+
+        Поддерживает ETag (landing/conditional.py), ответ кэшируется
+        (landing/caching.py), отметки избранного - поверх кэша (landing/favorites.py).
+        """
+        return super().list(request, *args, **kwargs)
+
+    @track_views
+    @conditional_get(
+        lambda view: view.filter_queryset(view.get_queryset()).filter(pk=view.kwargs["pk"]),
+        detail=True,
+        etag_extra=favorites_etag,
+        modified_extra=favorites_last_modified,
+    )
+    @with_favorites
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Детальная информация о книге (ETag, ответ кэшируется, отметки избранного).
+
+        Просмотр учитывается в популярном (landing/trending.py).
+        """
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=["get"])
+    @conditional_get(
+        lambda view: view.get_recent_queryset(),
+        etag_extra=favorites_etag,
+        modified_extra=favorites_last_modified,
+    )
+    @with_favorites
+    @cache_response
     def recent(self, request):
         """
         Кастомное действие для получения последних книг.
@@ -67,23 +148,299 @@ class BookViewSet(viewsets.ModelViewSet):
         detail=False означает, что это действие на коллекции (не на конкретном объекте)
         methods=["get"] - разрешенные HTTP методы
         """
-        recent_books = self.queryset.order_by("-created_at")[:5]
+        recent_books = self.get_recent_queryset()
         serializer = self.get_serializer(recent_books, many=True)
         return Response(serializer.data)
 
-    @action(detail=True, methods=["post"])
+    @action(detail=False, methods=["get"], pagination_class=None)
+    @with_favorites
+    def trending(self, request):
+        """
+        Популярные книги: больше всего просмотров за последние часы.
+
+        GET /api/books/trending/?hours=24&limit=20 - книги в формате списка
+        каталога с полем views (просмотры за окно), по убыванию просмотров
+
+        Считается по часовым счетчикам просмотров (landing/trending.py),
+        ответ кэшируется ненадолго.
+        """
+        config = settings.BOOK_TRENDING
+        try:
+            hours = int(request.query_params.get("hours", config["WINDOW_HOURS"]))
+            limit = int(request.query_params.get("limit", config["LIMIT"]))
+        except ValueError:
+            return Response({
+                "error": "Параметры hours и limit должны быть целыми числами"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        hours = min(max(hours, 1), config["MAX_WINDOW_HOURS"])
+        limit = min(max(limit, 1), config["MAX_LIMIT"])
+        return Response(get_trending(
+            hours, limit, lambda books: self.get_serializer(books, many=True).data
+        ))
+
+    # Порядок - по релевантности, курсорный режим BookPagination к нему не подходит
+    @action(detail=False, methods=["get"], pagination_class=PageNumberPagination)
+    @with_favorites
+    def search(self, request):
+        """
+        Полнотекстовый поиск по названию, автору и описанию книги.
+
+        GET /api/books/search/?q=толстой война - книги, отсортированные по релевантности
+        (с фильтрами: ?q=война&year_min=1860)
+        GET /api/books/search/?q=дастаевский&mode=fuzzy - нечеткий поиск по названию
+        и автору, устойчивый к опечаткам
+
+        На PostgreSQL используется tsvector с русским стеммингом и GIN индекс,
+        на SQLite - FTS5 (см. landing/search.py). Нечеткий поиск - триграммы
+        pg_trgm или индекс в памяти (landing/fuzzy.py).
+
+        Пагинация только постраничная (?page=N): ?pagination=cursor
+        отклоняется, курсор по дате добавления сбил бы порядок по релевантности.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({
+                "error": "Укажите поисковый запрос в параметре q"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if BookPagination().use_cursor(request):
+            return Response({
+                "error": "Результаты поиска идут по релевантности, курсорная пагинация недоступна"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = request.query_params.get("mode", "fulltext")
+        search = {"fulltext": search_books, "fuzzy": fuzzy_search_books}.get(mode)
+        if search is None:
+            return Response({
+                "error": "Параметр mode может быть fulltext или fuzzy"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        books = search(self.filter_queryset(self.get_queryset()), query)
+        page = self.paginate_queryset(books)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(books, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def suggest(self, request):
+        """
+        Подсказки для строки поиска по началу слов названия и автора.
+
+        GET /api/books/suggest/?q=золо&limit=10 -
+        [{"text": "Золотой сад", "field": "title", "books": 3}, ...]
+
+        Отвечает из индекса в памяти процесса (landing/suggest.py), без БД.
+        """
+        config = settings.BOOK_SUGGEST
+        try:
+            limit = int(request.query_params.get("limit", config["LIMIT"]))
+        except ValueError:
+            return Response({
+                "error": "Параметр limit должен быть целым числом"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), config["MAX_LIMIT"])
+        return Response(suggest(request.query_params.get("q", ""), limit))
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """
+        Количество книг по фасетам с учетом фильтров.
+
+        GET /api/books/facets/?year_min=2000 -
+        {"count": N, "facets": {"author": [{"value": ..., "count": ...}],
+        "year_published": [{"min": ..., "max": ..., "count": ...}], "pages": [...]}}
+
+        Диапазоны можно передать обратно как year_min/year_max и pages_min/pages_max.
+        Результат кэшируется ненадолго (landing/filters.py).
+        """
+        return Response(get_facets(self.get_queryset(), parse_filters(request)))
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Пакетное создание и обновление книг.
+
+        POST /api/books/bulk/ - принимает список книг, книги с существующим ISBN
+        обновляются. Все корректные книги записываются в одной транзакции
+        (bulk_create с upsert по ISBN), некорректные возвращаются с ошибками.
+
+        Ответ содержит результат по каждой книге в порядке запроса:
+        {"index": 0, "isbn": "...", "id": 1, "status": "created" | "updated"}
+        или {"index": 1, "status": "error", "errors": {...}}.
+        Статус 200 - все книги записаны, 207 - часть книг с ошибками,
+        400 - ни одна книга не записана.
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        item_errors = serializer.item_errors
+        if not serializer.validated_data:
+            return Response({
+                "results": [
+                    {"index": index, "status": "error", "errors": errors}
+                    for index, errors in sorted(item_errors.items())
+                ]
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer.save()
+        results = serializer.results
+        summary = {
+            "created": sum(1 for result in results if result["status"] == "created"),
+            "updated": sum(1 for result in results if result["status"] == "updated"),
+            "errors": len(item_errors),
+        }
+        return Response(
+            {**summary, "results": results},
+            status=status.HTTP_207_MULTI_STATUS if item_errors else status.HTTP_200_OK,
+        )
+
+    # Поля выгрузки каталога (GET /api/books/export/)
+    export_fields = (
+        "id",
+        "title",
+        "author",
+        "description",
+        "isbn",
+        "year_published",
+        "pages",
+        "cover_image",
+        "created_at",
+        "updated_at",
+    )
+
+    def get_export_rows(self, queryset):
+        """
+        Строки выгрузки из курсора на стороне сервера.
+
+        values_list вместо моделей и сериализатора: для выгрузки всего
+        каталога создавать объект на каждую книгу слишком дорого.
+        Путь к обложке превращается в полный URL, даты - в формат API.
+        """
+        datetime_field = serializers.DateTimeField()
+        cover_index = self.export_fields.index("cover_image")
+        date_indexes = [self.export_fields.index("created_at"), self.export_fields.index("updated_at")]
+
+        rows = queryset.values_list(*self.export_fields).iterator(
+            chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE
+        )
+        for row in rows:
+            row = list(row)
+            if row[cover_index]:
+                row[cover_index] = self.request.build_absolute_uri(
+                    default_storage.url(row[cover_index])
+                )
+            for index in date_indexes:
+                row[index] = datetime_field.to_representation(row[index])
+            yield row
+
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+        pagination_class=None,
+    )
+    def export(self, request):
+        """
+        Потоковая выгрузка всего каталога.
+
+        GET /api/books/export/?format=ndjson - JSON Lines (по умолчанию)
+        GET /api/books/export/?format=csv - CSV
+
+        Ответ - StreamingHttpResponse: строки читаются из БД пачками через
+        курсор на стороне сервера (QuerySet.iterator) и сразу отправляются
+        клиенту, поэтому память не растет с размером каталога, а первые
+        байты уходят до окончания запроса.
+        """
+        renderer = request.accepted_renderer
+        queryset = self.filter_queryset(self.get_queryset()).order_by("id")
+        response = StreamingHttpResponse(
+            renderer.stream(self.export_fields, self.get_export_rows(queryset)),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = f'attachment; filename="books.{renderer.format}"'
+        return response
+
+    @action(detail=True, methods=["get"], pagination_class=None)
+    @with_favorites
+    def similar(self, request, pk=None):
+        """
+        Похожие книги по названию, автору и описанию.
+
+        GET /api/books/{id}/similar/?limit=10 - книги в формате списка каталога
+        с полем score (сходство 0..1), по убыванию сходства
+
+        Соседи заранее посчитаны командой build_similar_index (landing/similar.py),
+        запрос только читает их из индекса. Для книги, добавленной после сборки
+        индекса, - книги того же автора (score = null).
+        """
+        config = settings.BOOK_SIMILAR
+        try:
+            limit = int(request.query_params.get("limit", config["LIMIT"]))
+        except ValueError:
+            return Response({
+                "error": "Параметр limit должен быть целым числом"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), config["NEIGHBORS"])
+
+        book = self.get_object()
+        ranked = similar_books(book, limit)
+        books = self.get_queryset().in_bulk([book_id for book_id, _ in ranked])
+        ordered = [(books[book_id], score) for book_id, score in ranked if book_id in books]
+        data = list(self.get_serializer([item for item, _ in ordered], many=True).data)
+        for item, (_, score) in zip(data, ordered):
+            item["score"] = round(score, 4) if score is not None else None
+        return Response(data)
+
+    @action(detail=True, methods=["post", "delete"])
     def favorite(self, request, pk=None):
         """
-        Пример кастомного действия для добавления книги в избранное.
+        Добавление книги в избранное и удаление из него.
 
-        detail=True означает, что это действие на конкретном объекте
-        GET /api/books/{id}/favorite/ - добавить книгу в избранное
+        POST /api/books/{id}/favorite/ - добавить (201, если книги в избранном
+        не было, 200 - если уже была)
+        DELETE /api/books/{id}/favorite/ - убрать (204)
 
-        Это пример - в реальном проекте нужно создать модель FavoriteBook.
+        Ответ POST: {"book_id": 1, "is_favorited": true, "favorites_count": 12}
         """
         book = self.get_object()
-        # Здесь можно добавить логику добавления в избранное
-        return Response({
-            "message": f"Книга '{book.title}' добавлена в избранное",
-            "book_id": book.id
-        })
+        if request.method == "DELETE":
+            remove_favorite(request.user, book)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        created = add_favorite(request.user, book)
+        return Response(
+            favorite_state(request.user, book),
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=True, methods=["post"], url_path="favorite/toggle")
+    def favorite_toggle(self, request, pk=None):
+        """
+        Переключение отметки избранного (кнопка-звездочка).
+
+        POST /api/books/{id}/favorite/toggle/ -
+        {"book_id": 1, "is_favorited": false, "favorites_count": 11}
+        """
+        book = self.get_object()
+        toggle_favorite(request.user, book)
+        return Response(favorite_state(request.user, book))
+
+    # Порядок - по дате добавления в избранное, курсорный режим BookPagination к нему не подходит
+    @action(detail=False, methods=["get"], pagination_class=PageNumberPagination)
+    @with_favorites
+    def favorites(self, request):
+        """
+        Избранные книги текущего пользователя, недавно добавленные сначала.
+
+        GET /api/books/favorites/ - страница книг в формате списка каталога
+        (фильтры ?author=, ?year_min= и т.д. тоже работают)
+        """
+        books = self.filter_queryset(self.get_queryset()).filter(
+            favorites__user=request.user
+        ).order_by("-favorites__created_at", "-id")
+        page = self.paginate_queryset(books)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(books, many=True)
+        return Response(serializer.data)
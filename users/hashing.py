@@ -0,0 +1,277 @@
+"""
+Проверка паролей в отдельном ограниченном пуле потоков.
+
+PBKDF2 - это намеренно дорогая операция (сотни миллисекунд CPU).
+Если считать хэш прямо в воркере, наплыв логинов занимает все воркеры,
+и запросы к каталогу ждут. Здесь хэширование идет в отдельном пуле:
+
+- WORKERS - сколько хэшей считается одновременно (остальные ждут в очереди);
+- MAX_QUEUE - сколько проверок может ждать; сверх этого запрос сразу
+  получает отказ (503), а не увеличивает очередь;
+- QUEUE_TIMEOUT - сколько секунд проверка может ждать в очереди; если
+  дольше, хэш не считается вовсе (клиент, скорее всего, уже не ждет);
+- HASH_TIMEOUT - сколько секунд отводится на сам хэш. Запрос ждет
+  результат не дольше QUEUE_TIMEOUT + HASH_TIMEOUT и получает 503, даже
+  если поток пула завис (задача снимается, если еще не начата).
+
+hashlib.pbkdf2_hmac отпускает GIL, поэтому потоки действительно
+выполняются параллельно и не блокируют остальные запросы процесса.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_logged_in, user_login_failed
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+# Границы гистограммы времени проверки (секунды)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+
+
+class HashingUnavailable(Exception):
+    """Очередь на хэширование переполнена или ожидание в ней слишком долгое"""
+
+
+class PasswordHashingPool:
+    def __init__(self, workers, max_queue, queue_timeout, hash_timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.hash_timeout = hash_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hashing"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0  # в очереди + выполняются
+        self._running = 0
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "wait_seconds_sum": 0.0,
+            "wait_seconds_max": 0.0,
+            "hash_seconds_sum": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+        self._latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def _task(self, enqueued, func, args):
+        waited = time.monotonic() - enqueued
+        if waited > self.queue_timeout:
+            return None, waited, 0.0, True
+
+        with self._lock:
+            self._running += 1
+        started = time.monotonic()
+        try:
+            result = func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+        return result, waited, time.monotonic() - started, False
+
+    @property
+    def result_timeout(self):
+        """Сколько ждать одну задачу: очередь плюс сам хэш"""
+        return self.queue_timeout + self.hash_timeout
+
+    def _release(self, future):
+        # Задача учитывается в очереди, пока не завершится или не будет снята,
+        # даже если вызвавший ее запрос уже перестал ждать
+        with self._lock:
+            self._pending -= 1
+
+    def _give_up(self, future):
+        future.cancel()
+        with self._lock:
+            self._stats["timed_out"] += 1
+        return HashingUnavailable("Превышено время ожидания проверки пароля")
+
+    def run(self, func, *args):
+        """
+        Выполняет func(*args) в пуле и ждет результат.
+
+        HashingUnavailable - если очередь полна, ожидание превысило QUEUE_TIMEOUT
+        или результата нет дольше QUEUE_TIMEOUT + HASH_TIMEOUT.
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise HashingUnavailable("Очередь проверки паролей переполнена")
+            self._pending += 1
+
+        enqueued = time.monotonic()
+        try:
+            future = self._executor.submit(self._task, enqueued, func, args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        try:
+            result, waited, hashed, timed_out = future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            raise self._give_up(future) from None
+
+        total = time.monotonic() - enqueued
+        with self._lock:
+            stats = self._stats
+            stats["wait_seconds_sum"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            if timed_out:
+                stats["timed_out"] += 1
+            else:
+                stats["completed"] += 1
+                stats["hash_seconds_sum"] += hashed
+                stats["hash_seconds_max"] = max(stats["hash_seconds_max"], hashed)
+                index = next(
+                    (i for i, bound in enumerate(LATENCY_BUCKETS) if total <= bound),
+                    len(LATENCY_BUCKETS),
+                )
+                self._latency_buckets[index] += 1
+
+        if timed_out:
+            raise HashingUnavailable("Превышено время ожидания проверки пароля")
+        return result
+
+    def map(self, func, items):
+        """
+        func(item) для каждого item в пуле, результаты в порядке items.
+
+        Для массовых операций (POST /api/users/bulk/): одновременно в пуле
+        не больше WORKERS задач этого вызова, так что проверки паролей при
+        входе встают в очередь между ними, а не за всей пачкой.
+        HashingUnavailable - как у run(), если очередь полна или задача
+        не уложилась в QUEUE_TIMEOUT + HASH_TIMEOUT.
+        """
+        window = threading.Semaphore(self.workers)
+        futures = []
+
+        def release(_):
+            with self._lock:
+                self._pending -= 1
+            window.release()
+
+        try:
+            for item in items:
+                if not window.acquire(timeout=self.result_timeout):
+                    raise self._give_up(futures[-1])
+                with self._lock:
+                    if self._pending >= self.workers + self.max_queue:
+                        self._stats["rejected"] += 1
+                        window.release()
+                        raise HashingUnavailable("Очередь проверки паролей переполнена")
+                    self._pending += 1
+                future = self._executor.submit(self._task, time.monotonic(), func, (item,))
+                future.add_done_callback(release)
+                futures.append(future)
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result(timeout=self.result_timeout))
+                except FutureTimeoutError:
+                    raise self._give_up(future) from None
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+        results = []
+        with self._lock:
+            stats = self._stats
+            for result, waited, hashed, timed_out in outcomes:
+                stats["wait_seconds_sum"] += waited
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+                if timed_out:
+                    stats["timed_out"] += 1
+                    continue
+                stats["completed"] += 1
+                stats["hash_seconds_sum"] += hashed
+                stats["hash_seconds_max"] = max(stats["hash_seconds_max"], hashed)
+                results.append(result)
+        if len(results) != len(outcomes):
+            raise HashingUnavailable("Превышено время ожидания хэширования паролей")
+        return results
+
+    def stats(self):
+        """Снимок метрик: глубина очереди, выполняемые проверки, задержки"""
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self._latency_buckets):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "queue_depth": self._pending - self._running,
+                "running": self._running,
+                **self._stats,
+                "latency_buckets": buckets,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = settings.LOGIN_HASHING
+            _pool = PasswordHashingPool(
+                workers=config["WORKERS"],
+                max_queue=config["MAX_QUEUE"],
+                queue_timeout=config["QUEUE_TIMEOUT"],
+                hash_timeout=config["HASH_TIMEOUT"],
+            )
+        return _pool
+
+
+def authenticate_offloaded(request, email, password):
+    """
+    Аналог authenticate() для ModelBackend, но хэш считается в пуле.
+
+    Поиск пользователя и сохранение идут в потоке запроса (там есть
+    соединение с БД), в пул уходит только вычисление хэша. Как и в
+    ModelBackend, для несуществующего пользователя хэш тоже считается,
+    чтобы по времени ответа нельзя было узнать, есть ли такой email.
+    """
+    pool = get_pool()
+    user_model = get_user_model()
+    try:
+        user = user_model._default_manager.get_by_natural_key(email)
+    except user_model.DoesNotExist:
+        pool.run(make_password, password)
+        user = None
+
+    if user is not None:
+        if not pool.run(check_password, password, user.password) or not user.is_active:
+            user = None
+        elif identify_hasher(user.password).must_update(user.password):
+            # Параметры хэшера изменились (например, число итераций) - перехэшируем
+            user.password = pool.run(make_password, password)
+            user.save(update_fields=["password"])
+
+    if user is None:
+        user_login_failed.send(
+            sender=__name__, credentials={"username": email}, request=request
+        )
+        return None
+
+    user.backend = MODEL_BACKEND
+    return user
+
+
+def mark_logged_in(request, user):
+    """
+    Вход без создания сессии (для клиентов, которые работают только с токеном).
+
+    Отправляем тот же сигнал, что и django login(), чтобы обновился last_login.
+    """
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
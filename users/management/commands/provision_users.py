@@ -0,0 +1,143 @@
+"""
+Массовое создание пользователей из файла.
+
+    python manage.py provision_users school-42.csv
+    python manage.py provision_users users.jsonl --workers 8 --credentials tokens.csv
+
+Колонки (поля JSON): username, email, password, first_name, last_name,
+birth_date. Если password пустой, он генерируется. Логины, токены и
+сгенерированные пароли пишутся в файл --credentials (CSV), отклоненные
+строки с ошибками - в файл отказов (JSON Lines).
+"""
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from landing.management.commands.import_books import chunked, read_csv, read_jsonl
+from users.provisioning import hashing_pool
+from users.serializers import UserProvisionSerializer
+
+READERS = {
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+    ".ndjson": read_jsonl,
+}
+
+
+class Command(BaseCommand):
+    help = "Создает пользователей с токенами из CSV или JSON Lines (пароли хэшируются в пуле процессов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу с пользователями")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество пользователей в одной пачке (по умолчанию 1000)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.USER_PROVISIONING["WORKERS"],
+            help="Количество процессов для хэширования паролей (0 - без пула)",
+        )
+        parser.add_argument(
+            "--credentials",
+            help="Файл с логинами и токенами (по умолчанию <path>.credentials.csv)",
+        )
+        parser.add_argument(
+            "--rejects",
+            help="Файл для отклоненных строк (по умолчанию <path>.rejects.jsonl)",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError("Поддерживаются только файлы .csv и .jsonl")
+
+        batch_size = options["batch_size"]
+        if not 1 <= batch_size <= settings.USER_PROVISIONING["MAX_ITEMS"]:
+            raise CommandError(
+                f"--batch-size должен быть от 1 до {settings.USER_PROVISIONING['MAX_ITEMS']}"
+            )
+
+        credentials_path = Path(options["credentials"] or f"{path}.credentials.csv")
+        rejects_path = Path(options["rejects"] or f"{path}.rejects.jsonl")
+        rejects_file = None
+
+        created = rejected = 0
+        started = time.monotonic()
+        with open(credentials_path, "w", newline="", encoding="utf-8") as credentials_file, \
+                hashing_pool(options["workers"]) as pool:
+            credentials = csv.writer(credentials_file)
+            credentials.writerow(["email", "username", "token", "password"])
+            try:
+                for batch in chunked(reader(path), batch_size):
+                    lines, rows, results = [], [], []
+                    for line, row in batch:
+                        if "_error" in row:
+                            # Строка JSON не разобралась - в сериализатор не передаем
+                            results.append({"line": line, "row": row.get("_raw"), "errors": [row["_error"]]})
+                        else:
+                            lines.append(line)
+                            # Пустые колонки CSV - незаполненные необязательные поля
+                            rows.append({k: v for k, v in row.items() if v not in ("", None)})
+
+                    serializer = UserProvisionSerializer(
+                        data=rows, many=True, context={"hashing_pool": pool}
+                    )
+                    if rows:
+                        serializer.is_valid(raise_exception=True)
+                        if serializer.validated_data:
+                            serializer.save()
+                            results.extend(serializer.results)
+                        else:
+                            results.extend(
+                                {"index": index, "status": "error", "errors": errors}
+                                for index, errors in sorted(serializer.item_errors.items())
+                            )
+
+                    for result in results:
+                        if result.get("status") == "created":
+                            created += 1
+                            credentials.writerow([
+                                result["email"],
+                                result["username"],
+                                result["token"],
+                                result.get("password", ""),
+                            ])
+                            continue
+                        if rejects_file is None:
+                            rejects_file = open(rejects_path, "w", encoding="utf-8")
+                        reject = result
+                        if "index" in result:
+                            # Пароль в файл отказов не пишем
+                            index = result["index"]
+                            row = {k: v for k, v in rows[index].items() if k != "password"}
+                            reject = {"line": lines[index], "row": row, "errors": result["errors"]}
+                        rejects_file.write(json.dumps(reject, ensure_ascii=False) + "\n")
+                        rejected += 1
+
+                    elapsed = max(time.monotonic() - started, 1e-9)
+                    self.stdout.write(
+                        f"Обработано {created + rejected} строк "
+                        f"({(created + rejected) / elapsed:.0f} пользователей/сек)"
+                    )
+            finally:
+                if rejects_file is not None:
+                    rejects_file.close()
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {created}, отклонено строк: {rejected} за {elapsed:.1f} сек"
+        ))
+        self.stdout.write(f"Логины и токены записаны в {credentials_path}")
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"Отклоненные строки записаны в {rejects_path}"))
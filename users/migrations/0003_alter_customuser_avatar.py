@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:06
+
+import landing.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_customuser_user_joined_id_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="customuser",
+            name="avatar",
+            field=models.ImageField(
+                blank=True,
+                help_text="Фото профиля пользователя",
+                null=True,
+                storage=landing.storage.get_media_storage,
+                upload_to="users/avatars/",
+                verbose_name="Аватар",
+            ),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 
+from landing.storage import get_media_storage
+
 # Create your models here.
 class CustomUser(AbstractUser):
     email = models.EmailField(
@@ -11,11 +13,18 @@ class CustomUser(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to="users/avatars/",
+        storage=get_media_storage,
         blank=True,
         null=True,
         verbose_name="Аватар",
         help_text="Фото профиля пользователя"
     )
+    birth_date = models.DateField(
+        blank=True,
+        null=True,
+        verbose_name="Дата рождения",
+        help_text="Дата рождения пользователя"
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
@@ -24,3 +33,7 @@ class CustomUser(AbstractUser):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ["-date_joined"]
+        indexes = [
+            # Для курсорной пагинации (см. users/pagination.py)
+            models.Index(fields=["-date_joined", "-id"], name="user_joined_id_idx"),
+        ]
@@ -0,0 +1,6 @@
+from landing.pagination import OptInCursorPagination
+
+
+class UserPagination(OptInCursorPagination):
+    """Пользователи: новые сначала, совпадает с индексом user_joined_id_idx"""
+    ordering = ("-date_joined", "-id")
@@ -0,0 +1,92 @@
+"""
+Массовое создание пользователей (подключение школы или филиала библиотеки).
+
+Регистрация по одному пользователю делает несколько запросов на каждого
+и считает PBKDF2 в потоке запроса. Здесь для пачки пользователей:
+
+- пароли хэшируются пачкой в пуле: в API - в общем пуле проверки
+  паролей (users/hashing.py, ограничен по потокам и очереди), в команде
+  manage.py provision_users - в пуле процессов на время ее работы;
+- пользователи и токены вставляются двумя bulk_create в одной транзакции.
+
+Проверка уникальности email и username одним запросом на всю пачку -
+в UserProvisionListSerializer (users/serializers.py).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from rest_framework.authtoken.models import Token
+
+
+def _init_worker():
+    # В дочернем процессе нужны настройки хэшеров (PASSWORD_HASHERS)
+    django.setup()
+
+
+@contextmanager
+def hashing_pool(workers):
+    """
+    Пул процессов для хэширования паролей (None при workers=0).
+
+    Только для manage.py provision_users: закрывает соединения с БД
+    текущего процесса, поэтому в запросе API не используется.
+    Процессы запускаются при первой задаче, поэтому пустой пул ничего не стоит.
+    """
+    if not workers:
+        yield None
+        return
+    # Соединения с БД не должны наследоваться дочерними процессами
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        yield executor
+
+
+def hash_passwords(passwords, executor=None):
+    """
+    Хэши паролей в том же порядке.
+
+    executor - пул процессов (hashing_pool) или PasswordHashingPool;
+    без него пароли хэшируются на месте.
+    """
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    # Один хэш - сотни миллисекунд, передача в пул на этом фоне незаметна
+    return list(executor.map(make_password, passwords))
+
+
+def provision_users(rows, executor=None, batch_size=1000):
+    """
+    Создает пользователей с токенами.
+
+    rows - проверенные данные пользователей с открытым паролем в "password".
+    Возвращает список (пользователь, ключ токена) в порядке rows.
+    """
+    user_model = get_user_model()
+    # Хэшируем до транзакции: это самая долгая часть
+    hashes = hash_passwords([row["password"] for row in rows], executor)
+
+    users = []
+    for row, password in zip(rows, hashes):
+        fields = {key: value for key, value in row.items() if key != "password"}
+        fields["email"] = user_model.objects.normalize_email(fields["email"])
+        users.append(user_model(**fields, password=password))
+
+    with transaction.atomic():
+        user_model.objects.bulk_create(users, batch_size=batch_size)
+        if any(user.pk is None for user in users):
+            # БД не вернула id после вставки - добираем одним запросом
+            ids = dict(
+                user_model.objects
+                .filter(email__in=[user.email for user in users])
+                .values_list("email", "id")
+            )
+            for user in users:
+                user.pk = ids[user.email]
+        tokens = [Token(user=user, key=Token.generate_key()) for user in users]
+        Token.objects.bulk_create(tokens, batch_size=batch_size)
+
+    return [(user, token.key) for user, token in zip(users, tokens)]
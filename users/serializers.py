@@ -1,7 +1,15 @@
+import secrets
+
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError
+from django.db.models import Q
+
+from .provisioning import provision_users
 
 User = get_user_model()
 
@@ -68,20 +76,14 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         Создание нового пользователя.
 
         1. Удаляем password_confirm (он не нужен в модели)
-        2. Извлекаем пароль
-        3. Создаем пользователя БЕЗ пароля
-        4. Устанавливаем пароль через set_password (автоматически хеширует)
-        5. Сохраняем пользователя
-        6. Создаем токен для API аутентификации
+        2. Создаем пользователя через create_user: пароль хэшируется
+           до сохранения, поэтому в БД одна вставка, а не вставка и обновление
+        3. Создаем токен для API аутентификации (доступен как user.auth_token)
         """
         validated_data.pop("password_confirm")
         password = validated_data.pop("password")
 
-        user = User.objects.create(**validated_data)
-
-        user.set_password(password)
-        user.save()
-
+        user = User.objects.create_user(password=password, **validated_data)
         Token.objects.create(user=user)
 
         return user
@@ -141,6 +143,7 @@ class UserLoginSerializer(serializers.Serializer):
     Поля:
     - email - для входа (так как USERNAME_FIELD = 'email')
     - password - пароль пользователя
+    - session - создавать ли сессию Django (false для клиентов только с токеном)
     """
     email = serializers.EmailField(
         required=True,
@@ -151,4 +154,137 @@ class UserLoginSerializer(serializers.Serializer):
         required=True,
         style={"input_type": "password"},
         help_text="Пароль пользователя"
-    )
\ No newline at end of file
+    )
+    session = serializers.BooleanField(
+        default=True,
+        help_text="Создать сессию для веб-интерфейса (false - только токен)"
+    )
+
+class UserProvisionListSerializer(serializers.ListSerializer):
+    """
+    Массовое создание пользователей (POST /api/users/bulk/, manage.py provision_users).
+
+    Каждый пользователь проверяется отдельно, ошибка в одном не отменяет
+    остальных. Уникальность email и username проверяется одним запросом
+    на всю пачку (и внутри самой пачки). По каждому пользователю
+    формируется результат (self.results) - created или error.
+    """
+    def to_internal_value(self, data):
+        max_items = self.context.get("max_items", settings.USER_PROVISIONING["MAX_ITEMS"])
+        if not isinstance(data, list):
+            raise serializers.ValidationError({
+                "non_field_errors": ["Ожидается список пользователей"]
+            })
+        if not data:
+            raise serializers.ValidationError({
+                "non_field_errors": ["Список пользователей пуст"]
+            })
+        if len(data) > max_items:
+            raise serializers.ValidationError({
+                "non_field_errors": [f"Не больше {max_items} пользователей за один запрос"]
+            })
+
+        self.item_errors = {}
+        checked = []
+        for index, item in enumerate(data):
+            try:
+                checked.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+
+        # Уже занятые email и username - одним запросом на всю пачку
+        taken_emails, taken_usernames = set(), set()
+        if checked:
+            rows = User.objects.filter(
+                Q(email__in=[row["email"] for _, row in checked])
+                | Q(username__in=[row["username"] for _, row in checked])
+            ).values_list("email", "username")
+            for email, username in rows:
+                taken_emails.add(email)
+                taken_usernames.add(username)
+
+        # Индексы корректных пользователей в запросе (параллельно validated_data)
+        self.valid_indexes = []
+        valid = []
+        for index, row in checked:
+            errors = {}
+            if row["email"] in taken_emails:
+                errors["email"] = ["Пользователь с таким email уже существует"]
+            if row["username"] in taken_usernames:
+                errors["username"] = ["Пользователь с таким username уже существует"]
+            if errors:
+                self.item_errors[index] = errors
+                continue
+            # Повтор в той же пачке - тоже ошибка
+            taken_emails.add(row["email"])
+            taken_usernames.add(row["username"])
+            self.valid_indexes.append(index)
+            valid.append(row)
+        return valid
+
+    def create(self, validated_data):
+        # Пароль не передан - генерируем и возвращаем его один раз в результате
+        generated = {}
+        for index, row in zip(self.valid_indexes, validated_data):
+            if not row.get("password"):
+                row["password"] = generated[index] = secrets.token_urlsafe(12)
+
+        try:
+            created = provision_users(validated_data, executor=self.context.get("hashing_pool"))
+        except IntegrityError:
+            # Email или username заняли параллельным запросом после проверки
+            raise serializers.ValidationError({
+                "non_field_errors": ["Часть пользователей уже создана другим запросом, повторите"]
+            })
+
+        results = {}
+        for index, (user, token) in zip(self.valid_indexes, created):
+            results[index] = {
+                "index": index,
+                "id": user.pk,
+                "email": user.email,
+                "username": user.username,
+                "token": token,
+                "status": "created",
+            }
+            if index in generated:
+                results[index]["password"] = generated[index]
+        for index, errors in self.item_errors.items():
+            results[index] = {"index": index, "status": "error", "errors": errors}
+        self.results = [results[index] for index in sorted(results)]
+
+        return [user for user, _ in created]
+
+
+class UserProvisionSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор одного пользователя для массового создания.
+
+    email и username объявлены явно, без UniqueValidator: уникальность
+    проверяет UserProvisionListSerializer одним запросом на всю пачку.
+    """
+    email = serializers.EmailField(max_length=254)
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(
+        write_only=True,
+        required=False,
+        allow_blank=True,
+        validators=[validate_password],
+        style={"input_type": "password"},
+        help_text="Если не указан, будет сгенерирован",
+    )
+
+    class Meta:
+        model = User
+        fields = [
+            "username",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "birth_date",
+        ]
+        list_serializer_class = UserProvisionListSerializer
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
@@ -1,3 +1,325 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from config import throttling
+from config.throttling import CacheStore, LocalStore
+from users import hashing
+from users.hashing import HashingUnavailable, PasswordHashingPool
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        # Хранилище лимитов общее на процесс - каждый тест начинает с пустого
+        throttling._stores.clear()
+        self.client = APIClient()
+
+    def login(self, ip="10.0.0.1"):
+        return self.client.post("/api/login/", {}, format="json", REMOTE_ADDR=ip)
+
+    def test_login_is_limited_per_ip(self):
+        for _ in range(20):
+            self.assertEqual(self.login().status_code, 400)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        # Другой клиент не затронут
+        self.assertEqual(self.login(ip="10.0.0.2").status_code, 400)
+
+
+class ThrottleStoreTests(SimpleTestCase):
+    def test_token_bucket_refills(self):
+        store = LocalStore()
+        for _ in range(3):
+            self.assertTrue(store.token_bucket("k", 3, 1.0, 100.0)[0])
+        allowed, wait = store.token_bucket("k", 3, 1.0, 100.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 1.0)
+        self.assertTrue(store.token_bucket("k", 3, 1.0, 101.0)[0])
+
+    def assert_rejections_are_not_counted(self, store):
+        for _ in range(2):
+            self.assertTrue(store.sliding_window("k", 2, 60, 0.0)[0])
+        # Отклоненные запросы не занимают место в окне
+        for _ in range(5):
+            self.assertFalse(store.sliding_window("k", 2, 60, 30.0)[0])
+        # В середине следующего окна предыдущее учитывается наполовину: 2 * 0.5 + 1 <= 2
+        self.assertTrue(store.sliding_window("k", 2, 60, 90.0)[0])
+        self.assertFalse(store.sliding_window("k", 2, 60, 90.0)[0])
+
+    def test_local_sliding_window(self):
+        self.assert_rejections_are_not_counted(LocalStore())
+
+    def test_cache_sliding_window(self):
+        caches["default"].clear()
+        self.assert_rejections_are_not_counted(CacheStore("default"))
+
+    def test_cache_token_bucket_refills(self):
+        caches["default"].clear()
+        store = CacheStore("default")
+        for _ in range(3):
+            self.assertTrue(store.token_bucket("k", 3, 1.0, 100.0)[0])
+        allowed, wait = store.token_bucket("k", 3, 1.0, 100.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 1.0)
+        self.assertTrue(store.token_bucket("k", 3, 1.0, 101.0)[0])
+
+    def test_cache_token_bucket_under_concurrency(self):
+        caches["default"].clear()
+        store = CacheStore("default")
+        cache_get = store.cache.get
+
+        def slow_get(*args, **kwargs):
+            # Окно между чтением и записью TAT, в которое попадают остальные потоки
+            value = cache_get(*args, **kwargs)
+            time.sleep(0.005)
+            return value
+
+        results = []
+        barrier = threading.Barrier(6)
+
+        def hit():
+            barrier.wait()
+            results.append(store.token_bucket("k", 3, 0.001, 100.0)[0])
+
+        with mock.patch.object(store.cache, "get", slow_get):
+            threads = [threading.Thread(target=hit) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(True), 3)
+
+    def test_cache_token_bucket_denies_while_locked(self):
+        caches["default"].clear()
+        store = CacheStore("default")
+        store.LOCK_WAIT = 0.01
+        store.cache.add(store._key("k") + ":lock", 1)
+        self.assertEqual(store.token_bucket("k", 3, 1.0, 100.0), (False, 1.0))
+
+    def test_local_store_purges_idle_keys(self):
+        store = LocalStore()
+        store.MAX_KEYS = 10
+        for index in range(11):
+            store.token_bucket(f"old-{index}", 1, 1.0, 0.0)
+        store.token_bucket("new", 1, 1.0, LocalStore.IDLE_SECONDS + 1)
+        self.assertEqual(list(store._buckets), ["new"])
+
+
+class HashingPoolTests(SimpleTestCase):
+    def make_pool(self, **options):
+        pool = PasswordHashingPool(**{
+            "workers": 1, "max_queue": 0, "queue_timeout": 0.05, "hash_timeout": 0.05, **options,
+        })
+        # Зависший хэш отпускается в конце теста, чтобы поток пула завершился
+        self.stuck = threading.Event()
+        self.addCleanup(pool._executor.shutdown)
+        self.addCleanup(self.stuck.set)
+        return pool
+
+    def occupy(self, pool):
+        """Занимает единственный поток пула до конца теста"""
+        started = threading.Event()
+
+        def hang():
+            started.set()
+            self.stuck.wait()
+
+        threading.Thread(target=self.swallow, args=(pool, hang), daemon=True).start()
+        self.assertTrue(started.wait(5))
+
+    @staticmethod
+    def swallow(pool, func):
+        try:
+            pool.run(func)
+        except HashingUnavailable:
+            pass
+
+    def test_rejects_when_queue_is_full(self):
+        pool = self.make_pool(queue_timeout=5, hash_timeout=5)
+        self.occupy(pool)
+        started = time.monotonic()
+        with self.assertRaises(HashingUnavailable):
+            pool.run(len, "x")
+        # Отказ сразу, без ожидания в очереди
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(pool.stats()["rejected"], 1)
+
+    def test_stuck_hash_times_out(self):
+        pool = self.make_pool()
+        started = time.monotonic()
+        with self.assertRaises(HashingUnavailable):
+            pool.run(self.stuck.wait)
+        self.assertLess(time.monotonic() - started, 1)
+        stats = pool.stats()
+        self.assertEqual((stats["timed_out"], stats["completed"]), (1, 0))
+        # Пока хэш не закончился, он занимает место в пуле
+        self.assertEqual(stats["running"], 1)
+        with self.assertRaises(HashingUnavailable):
+            pool.run(len, "x")
+        self.assertEqual(pool.stats()["rejected"], 1)
+
+        # Когда хэш все-таки закончился, место освобождается
+        self.stuck.set()
+        deadline = time.monotonic() + 5
+        while pool.stats()["queue_depth"] + pool.stats()["running"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.run(len, "x"), 1)
+
+    def test_queued_task_is_cancelled_on_timeout(self):
+        pool = self.make_pool(max_queue=1)
+        self.occupy(pool)
+        called = mock.Mock()
+        with self.assertRaises(HashingUnavailable):
+            pool.run(called)
+        # Задача снята из очереди и не выполнится, место в очереди свободно
+        self.assertEqual(pool.stats()["queue_depth"], 0)
+        self.stuck.set()
+        pool._executor.shutdown()
+        called.assert_not_called()
+
+    def test_map_keeps_order(self):
+        pool = self.make_pool(workers=2, hash_timeout=5)
+        self.assertEqual(pool.map(str.upper, ["a", "b", "c"]), ["A", "B", "C"])
+        self.assertEqual(pool.stats()["queue_depth"], 0)
+
+
+class LoginHashingTests(TestCase):
+    def setUp(self):
+        throttling._stores.clear()
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email="reader@example.com", username="reader", password="Secret-pass-123"
+        )
+
+    def login(self):
+        return self.client.post(
+            "/api/login/",
+            {"email": "reader@example.com", "password": "Secret-pass-123", "session": False},
+            format="json",
+        )
+
+    def test_login_uses_pool(self):
+        pool = PasswordHashingPool(workers=1, max_queue=1, queue_timeout=5, hash_timeout=5)
+        self.addCleanup(pool._executor.shutdown)
+        with mock.patch.object(hashing, "_pool", pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("token", response.data)
+        self.assertEqual(pool.stats()["completed"], 1)
+
+    def test_stuck_hashing_returns_503(self):
+        pool = PasswordHashingPool(workers=1, max_queue=1, queue_timeout=0.05, hash_timeout=0.05)
+        stuck = threading.Event()
+        self.addCleanup(pool._executor.shutdown)
+        self.addCleanup(stuck.set)
+
+        with mock.patch.object(hashing, "_pool", pool), \
+                mock.patch.object(hashing, "check_password", lambda *args: stuck.wait()):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(pool.stats()["timed_out"], 1)
+
+
+# Быстрый хэшер: тестам важен порядок и состав результатов, а не стойкость хэша
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            email="admin@example.com", username="admin", password="Secret-pass-123", is_staff=True
+        )
+
+    def setUp(self):
+        throttling._stores.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def bulk(self, users):
+        return self.client.post("/api/users/bulk/", users, format="json")
+
+    def test_partial_success_reports_each_user(self):
+        response = self.bulk([
+            {"username": "anna", "email": "Anna@Example.com", "password": "Long-pass-2024"},
+            {"username": "admin2", "email": "admin@example.com", "password": "Long-pass-2024"},
+            {"username": "boris", "email": "boris@example.com"},
+            {"username": "anna", "email": "anna2@example.com", "password": "Long-pass-2024"},
+        ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data["created"], response.data["errors"]), (2, 2))
+        anna, taken, boris, duplicate = response.data["results"]
+
+        self.assertEqual(anna["status"], "created")
+        user = get_user_model().objects.get(pk=anna["id"])
+        self.assertTrue(user.check_password("Long-pass-2024"))
+        self.assertEqual(Token.objects.get(user=user).key, anna["token"])
+        self.assertNotIn("password", anna)
+
+        self.assertIn("email", taken["errors"])
+        self.assertIn("username", duplicate["errors"])
+        # Сгенерированный пароль возвращается один раз
+        self.assertTrue(get_user_model().objects.get(pk=boris["id"]).check_password(boris["password"]))
+
+    def test_only_staff(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email="reader@example.com", username="reader", password="Secret-pass-123"
+        ))
+        response = self.bulk([{"username": "anna", "email": "anna@example.com"}])
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(USER_PROVISIONING={"MAX_ITEMS": 5000, "API_MAX_ITEMS": 1, "WORKERS": 0})
+    def test_batch_size_is_limited(self):
+        response = self.bulk([
+            {"username": "anna", "email": "anna@example.com"},
+            {"username": "boris", "email": "boris@example.com"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(get_user_model().objects.filter(username="anna").exists())
+
+    def test_busy_hashing_pool_creates_nobody(self):
+        with mock.patch("users.views.get_pool") as get_pool:
+            get_pool.return_value.map.side_effect = HashingUnavailable
+            response = self.bulk([{"username": "anna", "email": "anna@example.com"}])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertFalse(get_user_model().objects.filter(username="anna").exists())
+
+    def test_command_writes_credentials_and_rejects(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        path = directory / "school.csv"
+        path.write_text(
+            "username,email,password,first_name\n"
+            "anna,anna@example.com,Long-pass-2024,Анна\n"
+            "boris,not-an-email,Long-pass-2024,\n"
+            "vera,vera@example.com,,\n",
+            encoding="utf-8",
+        )
+        call_command("provision_users", str(path), "--workers", "0", stdout=io.StringIO())
+
+        with (directory / "school.csv.credentials.csv").open(encoding="utf-8") as file:
+            credentials = list(csv.DictReader(file))
+        self.assertEqual([row["username"] for row in credentials], ["anna", "vera"])
+        self.assertEqual(credentials[0]["password"], "")
+        vera = get_user_model().objects.get(username="vera")
+        self.assertTrue(vera.check_password(credentials[1]["password"]))
+        self.assertEqual(Token.objects.get(user=vera).key, credentials[1]["token"])
+
+        with (directory / "school.csv.rejects.jsonl").open(encoding="utf-8") as file:
+            [reject] = [json.loads(line) for line in file]
+        self.assertEqual(reject["line"], 3)
+        self.assertNotIn("password", reject["row"])
+        self.assertIn("email", reject["errors"])
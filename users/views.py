@@ -1,16 +1,20 @@
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.shortcuts import render, redirect
 from django.contrib.auth import login as django_login, logout as django_logout
 from django.contrib.auth.decorators import login_required
 
 from .forms import UserRegistrationForm
+from .hashing import HashingUnavailable, authenticate_offloaded, get_pool, mark_logged_in
 from .models import CustomUser
+from .pagination import UserPagination
 from .serializers import (
+    UserProvisionSerializer,
     UserRegistrationSerializer,
     UserSerializer,
     UserLoginSerializer,
@@ -29,6 +33,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     parser_classes = [MultiPartParser, FormParser]  # Для загрузки аватаров
+    # Обычная пагинация по страницам, ?pagination=cursor - курсорная
+    pagination_class = UserPagination
 
     def get_permissions(self):
         """
@@ -36,7 +42,7 @@ class UserViewSet(viewsets.ModelViewSet):
         - list - только staff может видеть список всех пользователей
         - retrieve - можно посмотреть свой профиль или любой (если staff)
         - update - можно обновить только свой профиль
-        - destroy - только staff может удалять пользователей
+        - destroy, bulk - только staff может удалять и массово создавать пользователей
         """
         if self.action == "list":
             return [permissions.IsAdminUser()]  # Только админы видят список
@@ -44,7 +50,8 @@ class UserViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         elif self.action in ["update", "partial_update"]:
             return [permissions.IsAuthenticated()]
-        elif self.action == "destroy":
+        elif self.action in ["destroy", "bulk"]:
+            # permission_classes из @action здесь не действуют - get_permissions их заменяет
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
@@ -76,6 +83,57 @@ class UserViewSet(viewsets.ModelViewSet):
         context["request"] = self.request
         return context
 
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[permissions.IsAdminUser],
+        parser_classes=[JSONParser],
+        serializer_class=UserProvisionSerializer,
+    )
+    def bulk(self, request):
+        """
+        Массовое создание пользователей (только для staff).
+
+        POST /api/users/bulk/ - список пользователей (username, email,
+        password, first_name, last_name, birth_date). Без пароля он
+        генерируется и возвращается в результате один раз.
+
+        Ответ содержит результат по каждому пользователю в порядке запроса:
+        {"index": 0, "id": 1, "email": "...", "username": "...", "token": "...",
+        "status": "created"} или {"index": 1, "status": "error", "errors": {...}}.
+        Статус 201 - все созданы, 207 - часть с ошибками, 400 - никто не создан,
+        503 - пул хэширования паролей перегружен (никто не создан).
+        """
+        context = self.get_serializer_context()
+        # Пароли хэшируются в общем пуле проверки паролей (как при входе),
+        # размер пачки ограничен, чтобы запрос не занимал пул надолго
+        context["hashing_pool"] = get_pool()
+        context["max_items"] = settings.USER_PROVISIONING["API_MAX_ITEMS"]
+        serializer = self.get_serializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        item_errors = serializer.item_errors
+        if not serializer.validated_data:
+            return Response({
+                "results": [
+                    {"index": index, "status": "error", "errors": errors}
+                    for index, errors in sorted(item_errors.items())
+                ]
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            serializer.save()
+        except HashingUnavailable:
+            return Response({
+                "error": "Сервис хэширования паролей перегружен, повторите попытку позже"
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "5"})
+
+        results = serializer.results
+        return Response(
+            {"created": len(results) - len(item_errors), "errors": len(item_errors), "results": results},
+            status=status.HTTP_207_MULTI_STATUS if item_errors else status.HTTP_201_CREATED,
+        )
+
 
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
@@ -101,13 +159,10 @@ def register(request):
         # Создаем пользователя (в сериализаторе уже создается токен)
         user = serializer.save()
 
-        # Получаем токен для нового пользователя
-        token, created = Token.objects.get_or_create(user=user)
-
         return Response({
             "message": "Пользователь успешно зарегистрирован",
             "user": UserSerializer(user, context={"request": request}).data,
-            "token": token.key,  # Токен для API запросов
+            "token": user.auth_token.key,  # Токен для API запросов
         }, status=status.HTTP_201_CREATED)
 
     # Если данные невалидны, возвращаем ошибки
@@ -123,7 +178,13 @@ def login(request):
     Принимает email и password, проверяет учетные данные.
     Если все верно, возвращает токен для API аутентификации.
 
-    Также выполняет Django login для сессионной аутентификации (для веб-интерфейса).
+    Пароль проверяется в отдельном ограниченном пуле (users/hashing.py),
+    чтобы наплыв логинов не занимал воркеры, обслуживающие каталог.
+    Если пул перегружен, возвращается 503 с заголовком Retry-After.
+
+    По умолчанию также выполняет Django login для сессионной аутентификации
+    (для веб-интерфейса). Клиенты, которые работают только с токеном,
+    передают "session": false - тогда сессия в БД не создается.
     """
     serializer = UserLoginSerializer(data=request.data)
 
@@ -131,14 +192,21 @@ def login(request):
         email = serializer.validated_data["email"]
         password = serializer.validated_data["password"]
 
-        # Аутентифицируем пользователя
-        # authenticate проверяет email и password
-        user = authenticate(request, username=email, password=password)
+        # Аутентифицируем пользователя (хэш пароля считается в пуле)
+        try:
+            user = authenticate_offloaded(request, email, password)
+        except HashingUnavailable:
+            return Response({
+                "error": "Сервис входа перегружен, повторите попытку позже"
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
 
         if user is not None:
             # Пользователь найден и пароль верный
-            # Выполняем Django login для сессионной аутентификации
-            django_login(request, user)
+            if serializer.validated_data["session"]:
+                # Выполняем Django login для сессионной аутентификации
+                django_login(request, user)
+            else:
+                mark_logged_in(request, user)
 
             # Получаем или создаем токен для API
             token, created = Token.objects.get_or_create(user=user)
@@ -157,6 +225,19 @@ def login(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def login_stats(request):
+    """
+    Метрики пула проверки паролей (только для staff).
+
+    queue_depth - сколько проверок ждут в очереди, running - сколько
+    выполняются, rejected/timed_out - отказы из-за перегрузки,
+    latency_buckets - накопительная гистограмма времени проверки.
+    """
+    return Response(get_pool().stats())
+
+
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def logout(request):